@@ -0,0 +1,263 @@
+"""
+Hack assembly backend. AsmTranslator turns the vm command tuples of
+VMWriter straight into Hack assembly, so a build goes from jack to asm
+without writing and parsing vm text in between. Calls, returns and the
+comparisons jump to shared trampolines, emitted once per program after the
+bootstrap, instead of expanding their whole sequence at every use - a call
+is 10 instructions instead of about 45.
+"""
+
+NEW_LINE = '\n'
+
+COMMENT = '//'
+
+ASM = '.asm'
+
+TARGET = 'asm'  # CompileOptions.target of this backend
+
+ENTRY = 'Sys.init'
+
+STACK_BASE = 256
+
+TEMP_BASE = 5
+
+# most index a base segment entry is reached at by incrementing A
+SHORT_OFFSET = 6
+
+# registers the trampolines pass their arguments in
+ARGS_REGISTER = 'R13'
+TARGET_REGISTER = 'R14'
+RETURN_REGISTER = 'R15'
+FRAME_REGISTER = 'R13'
+
+CALL_TRAMPOLINE = '$$CALL'
+RETURN_TRAMPOLINE = '$$RETURN'
+
+base_segment_dict = {'local': 'LCL', 'argument': 'ARG', 'this': 'THIS',
+                     'that': 'THAT'}
+
+pointer_dict = {0: 'THIS', 1: 'THAT'}
+
+binary_dict = {'add': 'M=D+M', 'sub': 'M=M-D', 'and': 'M=D&M',
+               'or': 'M=D|M'}
+
+unary_dict = {'neg': 'M=-M', 'not': 'M=!M'}
+
+# comparison -> (trampoline, jump on the difference when true)
+compare_dict = {'eq': ('$$EQ', 'JEQ'), 'gt': ('$$GT', 'JGT'),
+                'lt': ('$$LT', 'JLT')}
+
+PUSH_D = ['@SP', 'AM=M+1', 'A=A-1', 'M=D']
+POP_D = ['@SP', 'AM=M-1', 'D=M']
+
+
+def bootstrap():
+    """
+    :return: asm lines that set the stack up and call Sys.init, followed
+    by the trampolines the translated code jumps to
+    """
+    lines = ['@%d' % STACK_BASE, 'D=A', '@SP', 'M=D',
+             '@' + ARGS_REGISTER, 'M=0',
+             '@' + ENTRY, 'D=A', '@' + TARGET_REGISTER, 'M=D',
+             '@$$HALT', 'D=A', '@' + CALL_TRAMPOLINE, '0;JMP',
+             '($$HALT)', '@$$HALT', '0;JMP']
+    return lines + trampolines()
+
+
+def trampolines():
+    """
+    :return: asm lines of the shared call, return and comparison sequences
+    """
+    # call: D = return address, R13 = number of arguments, R14 = address
+    # of the function
+    lines = ['(' + CALL_TRAMPOLINE + ')'] + PUSH_D
+    for register in ('LCL', 'ARG', 'THIS', 'THAT'):
+        lines += ['@' + register, 'D=M'] + PUSH_D
+    lines += ['@' + ARGS_REGISTER, 'D=M', '@5', 'D=D+A', '@SP', 'D=M-D',
+              '@ARG', 'M=D', '@SP', 'D=M', '@LCL', 'M=D',
+              '@' + TARGET_REGISTER, 'A=M', '0;JMP']
+    # return: the frame is below LCL, the return address 5 under it
+    lines += ['(' + RETURN_TRAMPOLINE + ')',
+              '@LCL', 'D=M', '@' + FRAME_REGISTER, 'M=D',
+              '@5', 'A=D-A', 'D=M', '@' + TARGET_REGISTER, 'M=D'] + POP_D + \
+        ['@ARG', 'A=M', 'M=D', '@ARG', 'D=M+1', '@SP', 'M=D']
+    for register in ('THAT', 'THIS', 'ARG', 'LCL'):
+        lines += ['@' + FRAME_REGISTER, 'AM=M-1', 'D=M', '@' + register,
+                  'M=D']
+    lines += ['@' + TARGET_REGISTER, 'A=M', '0;JMP']
+    for trampoline, jump in sorted(compare_dict.values()):
+        lines += compare_trampoline(trampoline, jump)
+    return lines
+
+
+def compare_trampoline(trampoline, jump):
+    """
+    x - y is 0 only for x = y, even when it overflows, so eq jumps on it
+    straight away. it overflows for x and y of different signs only (e.g.
+    20000 - -20000), so gt / lt decide those by the signs
+    :param trampoline: label of the comparison
+    :param jump: jump on x - y when the comparison is true
+    :return: asm lines of the comparison - D = return address, the result
+    replaces the operands
+    """
+    true, false = trampoline + '_TRUE', trampoline + '_FALSE'
+    lines = ['(' + trampoline + ')', '@' + RETURN_REGISTER, 'M=D'] + POP_D
+    if jump != 'JEQ':
+        # x < 0 <= y is true for lt, 0 <= x and y < 0 for gt
+        negative_x, negative_y = (true, false) if jump == 'JLT' else \
+            (false, true)
+        lines += ['@' + trampoline + '_NEGATIVE', 'D;JLT',
+                  '@SP', 'A=M-1', 'D=M', '@' + negative_x, 'D;JLT',
+                  '@' + trampoline + '_SAME', '0;JMP',
+                  '(' + trampoline + '_NEGATIVE)',
+                  '@SP', 'A=M-1', 'D=M', '@' + negative_y, 'D;JGE',
+                  '(' + trampoline + '_SAME)', '@SP', 'A=M', 'D=M']
+    lines += ['A=A-1', 'D=M-D', '@' + true, 'D;' + jump,
+              '(' + false + ')', '@SP', 'A=M-1', 'M=0',
+              '@' + RETURN_REGISTER, 'A=M', '0;JMP',
+              '(' + true + ')', '@SP', 'A=M-1', 'M=-1',
+              '@' + RETURN_REGISTER, 'A=M', '0;JMP']
+    return lines
+
+
+def parse_vm(vm_code):
+    """
+    :param vm_code: vm text, e.g. of an OS class given as a .vm file
+    :return: list of its vm command tuples
+    """
+    commands = []
+    for line in vm_code.split(NEW_LINE):
+        parts = line.split(COMMENT, 1)[0].split()
+        if not parts:
+            continue
+        if len(parts) == 3:
+            parts[2] = int(parts[2])
+        commands.append(tuple(parts))
+    return commands
+
+
+class AsmTranslator:
+    """
+    Translates vm command tuples into Hack assembly lines, one command at a
+    time. Labels are scoped by the function they are in, statics are named
+    after the class of the function.
+    """
+
+    def __init__(self):
+        self.function_name = None
+        self.class_name = None
+        self.return_counter = 0
+        self._translate_dict = {'push': self.push, 'pop': self.pop,
+                                'label': self.label, 'goto': self.goto,
+                                'if-goto': self.if_goto, 'call': self.call,
+                                'function': self.function,
+                                'return': self.return_}
+
+    def translate_all(self, commands):
+        """
+        :param commands: vm command tuples
+        :return: list of the asm lines of all of them
+        """
+        lines = []
+        for command in commands:
+            lines += self.translate(command)
+        return lines
+
+    def translate(self, command):
+        """
+        :param command: vm command tuple, e.g. ('push', 'constant', 7)
+        :return: list of asm lines
+        """
+        operation = command[0]
+        if operation in binary_dict:
+            return POP_D + ['A=A-1', binary_dict[operation]]
+        if operation in unary_dict:
+            return ['@SP', 'A=M-1', unary_dict[operation]]
+        if operation in compare_dict:
+            return_label = self.return_label()
+            return ['@' + return_label, 'D=A',
+                    '@' + compare_dict[operation][0], '0;JMP',
+                    '(' + return_label + ')']
+        return self._translate_dict[operation](*command[1:])
+
+    def return_label(self):
+        """
+        :return: new label to come back to after a trampoline
+        """
+        self.return_counter += 1
+        return '%s$ret.%d' % (self.function_name, self.return_counter)
+
+    def push(self, segment, index):
+        if segment == 'constant':
+            if index <= 1:
+                # the constant goes straight into the new stack entry
+                return ['@SP', 'AM=M+1', 'A=A-1', 'M=%d' % index]
+            return ['@%d' % index, 'D=A'] + PUSH_D
+        if segment in base_segment_dict:
+            return self.base_address(segment, index) + ['D=M'] + PUSH_D
+        return ['@' + self.fixed_address(segment, index), 'D=M'] + PUSH_D
+
+    def pop(self, segment, index):
+        if segment not in base_segment_dict:
+            return POP_D + ['@' + self.fixed_address(segment, index), 'M=D']
+        if index <= SHORT_OFFSET:
+            return POP_D + self.base_address(segment, index) + ['M=D']
+        # the address is computed before D is taken by the popped value
+        return ['@%d' % index, 'D=A', '@' + base_segment_dict[segment],
+                'D=D+M', '@' + FRAME_REGISTER, 'M=D'] + POP_D + \
+            ['@' + FRAME_REGISTER, 'A=M', 'M=D']
+
+    @staticmethod
+    def base_address(segment, index):
+        """
+        :return: asm lines that leave the address of the entry in A,
+        keeping D for small indexes
+        """
+        register = '@' + base_segment_dict[segment]
+        if index == 0:
+            return [register, 'A=M']
+        if index <= SHORT_OFFSET:
+            return [register, 'A=M+1'] + ['A=A+1'] * (index - 1)
+        return ['@%d' % index, 'D=A', register, 'A=D+M']
+
+    def fixed_address(self, segment, index):
+        """
+        :return: symbol of an entry of the temp, pointer or static segment
+        """
+        if segment == 'temp':
+            return 'R%d' % (TEMP_BASE + index)
+        if segment == 'pointer':
+            return pointer_dict[index]
+        return '%s.%d' % (self.class_name, index)
+
+    def label(self, label):
+        return ['(%s$%s)' % (self.function_name, label)]
+
+    def goto(self, label):
+        return ['@%s$%s' % (self.function_name, label), '0;JMP']
+
+    def if_goto(self, label):
+        return POP_D + ['@%s$%s' % (self.function_name, label), 'D;JNE']
+
+    def call(self, name, n_args):
+        return_label = self.return_label()
+        if n_args <= 1:
+            lines = ['@' + ARGS_REGISTER, 'M=%d' % n_args]
+        else:
+            lines = ['@%d' % n_args, 'D=A', '@' + ARGS_REGISTER, 'M=D']
+        return lines + ['@' + name, 'D=A', '@' + TARGET_REGISTER, 'M=D',
+                        '@' + return_label, 'D=A', '@' + CALL_TRAMPOLINE,
+                        '0;JMP', '(' + return_label + ')']
+
+    def function(self, name, n_locals):
+        self.function_name = name
+        self.class_name = name.split('.')[0]
+        self.return_counter = 0
+        lines = ['(' + name + ')']
+        if n_locals:
+            lines += ['@SP', 'A=M', 'M=0'] + ['A=A+1', 'M=0'] * (
+                n_locals - 1) + ['D=A+1', '@SP', 'M=D']
+        return lines
+
+    def return_(self):
+        return ['@' + RETURN_TRAMPOLINE, '0;JMP']
@@ -0,0 +1,157 @@
+import glob
+import hashlib
+import json
+import os
+import shutil
+from functools import lru_cache
+
+CACHE_DIR = '.jackcache'
+
+MANIFEST = 'manifest.json'
+
+BLOB = '.vm'
+
+COMPILER_VERSION = '1.1'
+
+
+@lru_cache(maxsize=None)
+def compiler_fingerprint():
+    """
+    hash of the compiler version and the compiler sources, so editing the
+    compiler invalidates every cached output. computed once per process.
+    :return: hex digest
+    """
+    digest = hashlib.sha256(COMPILER_VERSION.encode())
+    compiler_dir = os.path.dirname(os.path.abspath(__file__))
+    for module in sorted(glob.glob(os.path.join(compiler_dir, '*.py'))):
+        with open(module, 'rb') as f:
+            digest.update(f.read())
+    return digest.hexdigest()
+
+
+def summary(caches):
+    """
+    :param caches: BuildCaches of a build
+    :return: human readable hit / miss summary of all of them
+    """
+    return 'cache: %d hits (%d restored), %d misses' % (
+        sum(cache.hits for cache in caches),
+        sum(cache.restored for cache in caches),
+        sum(cache.misses for cache in caches))
+
+
+class BuildCache:
+    """
+    Persistent .jack -> .vm cache of a single dir. Outputs are stored as
+    blobs named by the hash of the source content and the compiler version,
+    and a manifest remembers which blob every .vm file in the dir currently
+    holds, so an unchanged file is skipped without even reading its .vm.
+    """
+
+    def __init__(self, cache_dir):
+        """
+        :param cache_dir: dir to keep the blobs and the manifest in
+        """
+        self.cache_dir = cache_dir
+        self.hits = 0
+        self.misses = 0
+        self.restored = 0
+        self._version = compiler_fingerprint()
+        self._manifest = {}
+        try:
+            with open(os.path.join(cache_dir, MANIFEST), 'r') as f:
+                self._manifest = json.load(f)
+        except (OSError, ValueError):
+            pass
+
+    def source_key(self, source, options=''):
+        """
+        :param source: jack source bytes
+        :param options: anything else the output depends on
+        :return: cache key of the source
+        """
+        digest = hashlib.sha256(self._version.encode())
+        digest.update(options.encode())
+        digest.update(source)
+        return digest.hexdigest()
+
+    def fetch(self, key, vm_path):
+        """
+        make vm_path hold the cached output of key, if there is one
+        :param key: cache key of the source
+        :param vm_path: output file of the source
+        :return: True on a hit - vm_path is up to date, False on a miss
+        """
+        blob = self._blob_path(key)
+        record = self._manifest.get(os.path.basename(vm_path))
+        if record is not None and record[0] == key and \
+                record[1:] == self._stat(vm_path):
+            self.hits += 1
+            return True
+        if os.path.isfile(blob):
+            shutil.copyfile(blob, vm_path)
+            self._manifest[os.path.basename(vm_path)] = \
+                [key] + self._stat(vm_path)
+            self.hits += 1
+            self.restored += 1
+            return True
+        self.misses += 1
+        return False
+
+    def store(self, key, vm_path):
+        """
+        remember a freshly compiled output
+        :param key: cache key of the source
+        :param vm_path: output file of the source
+        """
+        os.makedirs(self.cache_dir, exist_ok=True)
+        blob = self._blob_path(key)
+        shutil.copyfile(vm_path, blob + '.tmp')
+        os.replace(blob + '.tmp', blob)
+        self._manifest[os.path.basename(vm_path)] = \
+            [key] + self._stat(vm_path)
+
+    def save(self):
+        """
+        write the manifest back to disk
+        """
+        if not self._manifest:
+            return
+        os.makedirs(self.cache_dir, exist_ok=True)
+        manifest_path = os.path.join(self.cache_dir, MANIFEST)
+        with open(manifest_path + '.tmp', 'w') as f:
+            json.dump(self._manifest, f)
+        os.replace(manifest_path + '.tmp', manifest_path)
+
+    def clear(self):
+        """
+        drop every cached output
+        """
+        shutil.rmtree(self.cache_dir, ignore_errors=True)
+        self._manifest = {}
+
+    def reset_stats(self):
+        """
+        start counting hits and misses from zero, for a cache reused across
+        builds
+        """
+        self.hits = 0
+        self.misses = 0
+        self.restored = 0
+
+    def stats(self):
+        """
+        :return: human readable hit / miss summary
+        """
+        return summary([self])
+
+    def _blob_path(self, key):
+        return os.path.join(self.cache_dir, key + BLOB)
+
+    @staticmethod
+    def _stat(path):
+        try:
+            stat = os.stat(path)
+        except OSError:
+            return [None, None]
+        return [stat.st_mtime_ns, stat.st_size]
@@ -0,0 +1,550 @@
+from collections import Counter
+from functools import partial
+
+import AsmWriter
+import Peephole
+import SymbolTable
+import VMWriter
+
+op_dict = {'+': ('add',), '-': ('sub',), '*': ('call', 'Math.multiply', 2),
+           '/': ('call', 'Math.divide', 2), '&': ('and',), '|': ('or',),
+           '<': ('lt',), '>': ('gt',), '=': ('eq',)}
+
+unary_op_dict = {'-': 'neg', '~': 'not'}
+
+NOT = ('not',)
+
+keyword_constant_dict = {'true': -1, 'false': 0, 'null': 0}
+
+WORD_SIZE = 16
+MIN_INT = -(1 << (WORD_SIZE - 1))
+WORD_MASK = (1 << WORD_SIZE) - 1
+
+
+def to_word(value):
+    """
+    :param value: python int
+    :return: value wrapped to a signed 16 bit two's complement word
+    """
+    return ((value - MIN_INT) & WORD_MASK) + MIN_INT
+
+
+def jack_divide(left, right):
+    """
+    Math.divide semantics - the quotient of the absolute values, negated
+    when the signs differ
+    :return: quotient word, None when Math.divide has no well defined result
+    """
+    if right == 0 or MIN_INT in (left, right):
+        return None
+    quotient = abs(left) // abs(right)
+    return to_word(-quotient if (left < 0) != (right < 0) else quotient)
+
+
+fold_op_dict = {'+': lambda left, right: to_word(left + right),
+                '-': lambda left, right: to_word(left - right),
+                '*': lambda left, right: to_word(left * right),
+                '/': jack_divide,
+                '&': lambda left, right: to_word(left & right),
+                '|': lambda left, right: to_word(left | right),
+                '<': lambda left, right: -1 if left < right else 0,
+                '>': lambda left, right: -1 if left > right else 0,
+                '=': lambda left, right: -1 if left == right else 0}
+
+fold_unary_op_dict = {'-': lambda value: to_word(-value),
+                      '~': lambda value: to_word(~value)}
+
+MAX_REDUCED_LENGTH = 24  # longest sequence that replaces a Math call
+
+# scratch registers of the strength reduced sequences - the value they hold
+# is dead as soon as the sequence ends
+FACTOR = ('temp', 1)
+PARTIAL = ('temp', 2)
+
+
+def double_commands(scratch):
+    """
+    :param scratch: temp register to copy the top of the stack through
+    :return: vm commands that double the top of the stack
+    """
+    return [('pop',) + scratch, ('push',) + scratch, ('push',) + scratch,
+            ('add',)]
+
+
+def multiply_commands(multiplier):
+    """
+    shift-and-add replacement of call Math.multiply 2 for a constant
+    multiplier. the multiplicand is on top of the stack.
+    :param multiplier: constant 16 bit word
+    :return: vm commands, or None if none is shorter than the budget
+    """
+    if multiplier == 0:
+        return [('pop',) + FACTOR, ('push', 'constant', 0)]
+    factor = abs(multiplier)
+    if factor & (factor - 1) == 0:
+        # power of two - double it in place
+        commands = []
+        for _ in range(factor.bit_length() - 1):
+            commands += double_commands(FACTOR)
+    else:
+        # add chain: x + x + ... + x
+        chain = [('pop',) + FACTOR, ('push',) + FACTOR]
+        for _ in range(factor - 1):
+            chain += [('push',) + FACTOR, ('add',)]
+        # binary method: double the partial product per bit, add x per 1
+        binary = [('pop',) + FACTOR, ('push',) + FACTOR]
+        for bit in bin(factor)[3:]:
+            binary += double_commands(PARTIAL)
+            if bit == '1':
+                binary += [('push',) + FACTOR, ('add',)]
+        commands = min(chain, binary, key=len)
+    if multiplier < 0:
+        commands.append(('neg',))
+    if len(commands) > MAX_REDUCED_LENGTH:
+        return None
+    return commands
+
+
+def divide_commands(divisor):
+    """
+    replacement of call Math.divide 2 for a constant divisor. the dividend
+    is on top of the stack.
+    :param divisor: constant 16 bit word
+    :return: vm commands, or None if the divisor has no fast path
+    """
+    if divisor == 1:
+        return []
+    if divisor == -1:
+        return [('neg',)]
+    return None
+
+
+reduce_op_dict = {'*': multiply_commands, '/': divide_commands}
+
+
+class CodeEmitter:
+    """
+    Code generation shared by both front ends of the compiler, the single
+    pass CompilationEngine and CodeGenerator, which walks a JackAST tree.
+    The front ends only tell how a construct is read - its parts are given
+    as callables that compile them - and the write_xxx() methods lay out
+    its vm code, so both emit the same code command for command.
+    """
+
+    def __init__(self, output, options, inline_table=None):
+        """
+        :param output: file / stream to write to, or a callable that gets
+        the vm text chunks
+        :param options: CompileOptions
+        :param inline_table: subroutine name -> (number of arguments, vm
+        commands that replace the call, the only class the commands are
+        valid in or None) for the calls to inline, None for no inlining
+        """
+        self.options = options
+        self.symbol_table = SymbolTable.SymbolTable()
+        # constant terms are returned to the expression instead of emitted
+        self.track_constants = self.options.fold_constants or \
+            self.options.strength_reduce
+        # optimization counters, e.g. hits per peephole rule
+        self.stats = Counter()
+        optimizer = None
+        if self.options.peephole:
+            optimizer = partial(Peephole.PeepholeOptimizer, stats=self.stats)
+        translator = None
+        if self.options.target == AsmWriter.TARGET:
+            translator = AsmWriter.AsmTranslator()
+        self.writer = VMWriter.VMWriter(output, optimizer, translator)
+        self.scope = None
+        self.return_type = None
+        # subroutine being compiled, and the call graph of the class -
+        # subroutine name -> names of the subroutines it calls
+        self.function_name = None
+        self.calls = {}
+        self.inline_table = inline_table if inline_table is not None else {}
+        self.while_counter = 0
+        self.if_counter = 0
+        self.string_counter = 0
+
+    def write_subroutine(self, name, kind, num_of_locals, num_of_fields):
+        """
+        emit the function command of a subroutine and the code that sets
+        up its this
+        :param name: subroutine name, without the class
+        :param kind: constructor / function / method
+        :param num_of_locals: how many local variables it declares
+        :param num_of_fields: how many fields the class declares
+        """
+        self.function_name = self.scope + '.' + name
+        self.calls[self.function_name] = set()
+        self.writer.write_function(self.function_name, num_of_locals)
+        if kind == 'method':
+            self.writer.write_push('argument', 0)
+            self.writer.write_pop('pointer', 0)
+        elif kind == 'constructor':
+            self.writer.write_push('constant', num_of_fields)
+            self.writer.write_call('Memory.alloc', 1)
+            self.writer.write_pop('pointer', 0)
+
+    def write_let(self, var, write_index, write_value):
+        """
+        emit a let statement
+        :param var: the variable assigned to
+        :param write_index: compiles the index of an array entry, None if
+        the variable itself is assigned to
+        :param write_value: compiles the value
+        """
+        if write_index is not None:
+            write_index()
+            self.writer.write_push(var.segment, var.index)
+            self.writer.write_arithmetic('add')
+        write_value()
+        if write_index is not None:
+            self.writer.write_pop('temp', 0)
+            self.writer.write_pop('pointer', 1)
+            self.writer.write_push('temp', 0)
+            self.writer.write_pop('that', 0)
+        else:
+            self.writer.write_pop(var.segment, var.index)
+
+    def write_array_let(self, var, index, write_index, write_value):
+        """
+        emit a let statement into an array entry when array_access is on.
+        the value is held back, so when it sets no pointer 1 of its own
+        pointer 1 is set before it and the value is stored straight into
+        that, without the temp shuffle
+        :param var: the array variable
+        :param index: constant index, None if write_index compiles it
+        :param write_index: compiles the index
+        :param write_value: compiles the value
+        """
+        if index is None:
+            write_index()
+            self.writer.write_push(var.segment, var.index)
+            self.writer.write_arithmetic('add')
+        self.writer.start_capture()
+        write_value()
+        value = self.writer.end_capture()
+        if VMWriter.SET_THAT in value:
+            if index is not None:
+                self.writer.write_push(var.segment, var.index)
+            self.writer.emit_all(value)
+            self.writer.write_pop('temp', 0)
+            self.writer.write_pop('pointer', 1)
+            self.writer.write_push('temp', 0)
+        else:
+            self.stats['array.shuffles_skipped'] += 1
+            if index is None:
+                self.writer.write_pop('pointer', 1)
+            else:
+                self.set_that(var)
+            self.writer.emit_all(value)
+        self.writer.write_pop('that', index or 0)
+
+    def write_array_entry(self, var, index, write_index):
+        """
+        push an array entry
+        :param var: the array variable
+        :param index: constant index, None if write_index compiles it
+        :param write_index: compiles the index
+        """
+        if index is not None:
+            self.set_that(var)
+            self.writer.write_push('that', index)
+            return
+        write_index()
+        self.writer.write_push(var.segment, var.index)
+        self.writer.write_arithmetic('add')
+        self.writer.write_pop('pointer', 1)
+        self.writer.write_push('that', 0)
+
+    def set_that(self, var):
+        """
+        point pointer 1 at the array in var, unless it already is
+        :param var: the array variable
+        """
+        if self.writer.that_base == (var.segment, var.index):
+            self.stats['array.pointer_reused'] += 1
+            return
+        self.writer.write_push(var.segment, var.index)
+        self.writer.write_pop('pointer', 1)
+
+    def write_if_statement(self, write_condition, write_if_clause,
+                           else_clause):
+        """
+        emit an if statement, possibly with a trailing else clause
+        :param write_condition: compiles the condition
+        :param write_if_clause: compiles the statements of the if clause
+        :param else_clause: called right after the if clause, returns a
+        callable that compiles the else clause, or None if there is none
+        """
+        if_num = str(self.if_counter)
+        self.if_counter += 1
+        if self.options.branch_layout:
+            # a condition ~c of a boolean c is jumped on as c, with the if
+            # clause falling through. ~ is bitwise, so ~c of any other c is
+            # nonzero too and must be jumped on as it is. negating a
+            # condition costs more than the jump it saves, so any other
+            # condition keeps the else first layout
+            self.writer.start_capture()
+            write_condition()
+            condition = self.writer.end_capture()
+            if condition[-1] == NOT and \
+                    Peephole.is_boolean(condition, len(condition) - 1):
+                self.writer.emit_all(condition[:-1])
+                self.write_negated_if(if_num, write_if_clause, else_clause)
+                return
+            self.writer.emit_all(condition)
+        else:
+            write_condition()
+        self.writer.write_if('IF_START_' + if_num)
+        # the else clause is laid out first, so hold the if clause back
+        self.writer.start_capture()
+        write_if_clause()
+        if_statements = self.writer.end_capture()
+        write_else_clause = else_clause()
+        if write_else_clause is not None:
+            write_else_clause()
+        self.writer.write_goto('IF_END_' + if_num)
+        self.writer.write_label('IF_START_' + if_num)
+        self.writer.emit_all(if_statements)
+        self.writer.write_label('IF_END_' + if_num)
+
+    def write_negated_if(self, if_num, write_if_clause, else_clause):
+        """
+        emit the clauses of an if statement, whose negated condition is
+        already on the stack, with the if clause falling through
+        :param if_num: number of the labels of the statement
+        """
+        self.writer.write_if('IF_FALSE_' + if_num)
+        write_if_clause()
+        write_else_clause = else_clause()
+        if write_else_clause is not None:
+            self.writer.write_goto('IF_END_' + if_num)
+            self.writer.write_label('IF_FALSE_' + if_num)
+            write_else_clause()
+            self.writer.write_label('IF_END_' + if_num)
+        else:
+            self.writer.write_label('IF_FALSE_' + if_num)
+
+    def write_while_statement(self, write_condition, write_body):
+        """
+        emit a while statement. with branch_layout the condition is laid
+        out after the body, so an iteration runs a single jump - it is
+        still compiled first and held back, so the labels of both layouts
+        are numbered alike
+        :param write_condition: compiles the condition
+        :param write_body: compiles the statements of the loop
+        """
+        while_num = str(self.while_counter)
+        self.while_counter += 1
+        if self.options.branch_layout:
+            self.writer.write_goto('WHILE_EXP_' + while_num)
+            self.writer.write_label('WHILE_BODY_' + while_num)
+            self.writer.start_capture()
+            write_condition()
+            condition = self.writer.end_capture()
+            write_body()
+            self.writer.write_label('WHILE_EXP_' + while_num)
+            self.writer.emit_all(condition)
+            self.writer.write_if('WHILE_BODY_' + while_num)
+            return
+        self.writer.write_label('WHILE_EXP_' + while_num)
+        write_condition()
+        self.writer.write_if('WHILE_BODY_' + while_num)
+        self.writer.write_goto('WHILE_END_' + while_num)
+        self.writer.write_label('WHILE_BODY_' + while_num)
+        write_body()
+        self.writer.write_goto('WHILE_EXP_' + while_num)
+        self.writer.write_label('WHILE_END_' + while_num)
+
+    def write_return_value(self):
+        """
+        emit the return of a subroutine, whose value - if any - is already
+        on the stack
+        """
+        if self.return_type == 'void':
+            self.writer.write_push('constant', 0)
+        self.writer.write_return()
+
+    def write_subroutine_call(self, subroutine, expression_counter):
+        """
+        emit a call whose arguments are already on the stack, or the
+        commands that replace it if it is inlined
+        :param subroutine: full name of the called subroutine
+        :param expression_counter: how many arguments it gets
+        """
+        inlined = self.inline_table.get(subroutine)
+        if inlined is not None and inlined[0] == expression_counter and \
+                inlined[2] in (None, self.scope):
+            # the arguments are already evaluated, in order - only the
+            # call frame is saved
+            self.stats['inline.calls_inlined'] += 1
+            self.writer.emit_all(inlined[1])
+        else:
+            self.calls[self.function_name].add(subroutine)
+            self.writer.write_call(subroutine, expression_counter)
+
+    def fold_operations(self, value, operations):
+        """
+        emit the operations of an expression, evaluating it at compile time
+        as long as its operands are constants. jack has no precedence, so
+        only a constant prefix of the expression can be folded. a constant
+        operand of * and / may be strength reduced instead of calling Math.
+        :param value: value of the first term if it is a constant that is
+        folded, None if it was emitted
+        :param operations: iterable of (op, compile the right term) - a
+        term compiler returns what compile / generate term does
+        :return: value of a constant expression - nothing was emitted for
+        it - or None
+        """
+        for op, write_term in operations:
+            op_command = op_dict[op]
+            if value is None:
+                right = write_term()
+                if right is None or not self.write_reduced(op, right):
+                    if right is not None:
+                        self.write_constant(right)
+                    self.writer.emit(op_command)
+                continue
+            reduced = None
+            if op == '*':
+                reduced = self.reduced_commands(op, value)
+            if reduced is None:
+                # the left constant is only pushed if the right term is not
+                self.writer.defer(self.constant_commands(value))
+            right = write_term()
+            if right is None:
+                value = None
+                if reduced is None:
+                    self.writer.emit(op_command)
+                else:
+                    # multiplication commutes - the constant was never pushed
+                    self.stats['strength.calls_eliminated'] += 1
+                    self.writer.emit_all(reduced)
+                continue
+            if reduced is None:
+                self.writer.cancel_deferred()
+            folded = None
+            if self.options.fold_constants:
+                folded = fold_op_dict[op](value, right)
+            if folded is None:
+                self.write_constant(value)
+                if not self.write_reduced(op, right):
+                    self.write_constant(right)
+                    self.writer.emit(op_command)
+            else:
+                self.stats['fold.operations'] += 1
+            value = folded
+        return value
+
+    def reduced_commands(self, op, operand):
+        """
+        :param op: '*' or '/' (any other op has no reduction)
+        :param operand: constant right operand, or left operand of '*'
+        :return: vm commands that replace pushing the operand and the Math
+        call, or None
+        """
+        if not self.options.strength_reduce or op not in reduce_op_dict:
+            return None
+        return reduce_op_dict[op](operand)
+
+    def write_reduced(self, op, right):
+        """
+        emit the strength reduced form of op with a constant right operand
+        :return: True if there was one
+        """
+        reduced = self.reduced_commands(op, right)
+        if reduced is None:
+            return False
+        self.stats['strength.calls_eliminated'] += 1
+        self.writer.emit_all(reduced)
+        return True
+
+    @staticmethod
+    def constant_commands(value):
+        """
+        :param value: 16 bit word
+        :return: vm commands that push the value
+        """
+        if value == MIN_INT:
+            return [('push', 'constant', ~value), ('not',)]
+        if value < 0:
+            return [('push', 'constant', -value), ('neg',)]
+        return [('push', 'constant', value)]
+
+    def write_constant(self, value):
+        """
+        :param value: 16 bit word to push
+        """
+        self.writer.emit_all(self.constant_commands(value))
+
+    def write_unary(self, op, value):
+        """
+        emit a unary op, or fold it
+        :param op: '-' or '~'
+        :param value: value of the operand if it is a constant that is
+        folded, None if it was emitted
+        :return: value of the term if it is folded, None otherwise
+        """
+        if value is not None and self.options.fold_constants:
+            self.stats['fold.operations'] += 1
+            return fold_unary_op_dict[op](value)
+        if value is not None:
+            self.write_constant(value)
+        self.writer.write_arithmetic(unary_op_dict[op])
+        return None
+
+    def write_keyword_constant(self, word):
+        """
+        push a keyword constant
+        :param word: true / false / null / this
+        """
+        if word == 'this':
+            self.writer.write_push('pointer', 0)
+            return
+        self.writer.write_push('constant', 0)
+        if word == 'true':
+            self.writer.write_arithmetic('not')
+
+    def write_string(self, string):
+        """
+        build a new String object of the given text on the stack
+        :param string: text of the string constant, without the quotes
+        """
+        self.writer.write_push('constant', len(string))
+        self.writer.write_call('String.new', 1)
+        for letter in string:
+            self.writer.write_push('constant', ord(letter))
+            self.writer.write_call('String.appendChar', 2)
+
+    def write_string_constant(self, literal):
+        """
+        push a string constant - pooled if pool_strings is on
+        :param literal: string constant token, including the quotes
+        """
+        if self.options.pool_strings:
+            self.write_pooled_string(literal)
+        else:
+            self.write_string(literal[1:-1])
+
+    def write_pooled_string(self, literal):
+        """
+        push the String object of a string constant, which lives in a hidden
+        static of the class and is built on first use only
+        :param literal: string constant token, including the quotes
+        """
+        # the quoted literal is not a valid identifier, so it can name the
+        # hidden static without clashing with the class's own variables
+        pooled = self.symbol_table.lookup(literal)
+        if pooled is None:
+            pooled = self.symbol_table.define(literal, 'String',
+                                              SymbolTable.STATIC)
+            self.stats['strings.pooled_literals'] += 1
+        pooled_label = 'STRING_POOLED_' + str(self.string_counter)
+        self.string_counter += 1
+        self.writer.write_push(pooled.segment, pooled.index)
+        self.writer.write_if(pooled_label)
+        self.write_string(literal[1:-1])
+        self.writer.write_pop(pooled.segment, pooled.index)
+        self.writer.write_label(pooled_label)
+        self.writer.write_push(pooled.segment, pooled.index)
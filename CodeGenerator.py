@@ -0,0 +1,254 @@
+from functools import partial
+
+import CodeEmitter
+import JackParser
+import JackTokenizer
+import SymbolTable
+from CodeEmitter import keyword_constant_dict
+from CompilationEngine import CompileOptions
+from JackAST import (LetStatement, IfStatement, WhileStatement, DoStatement,
+                     ReturnStatement, IntegerConstant, StringConstant,
+                     KeywordConstant, VarTerm, ArrayTerm, SubroutineCall,
+                     UnaryTerm, ParenTerm)
+
+
+def compile_file(input_file_path, output, options=None, inline_table=None,
+                 source=None):
+    """
+    compile a jack file through the syntax tree
+    :param input_file_path: jack file
+    :param output: file / stream to write to, or a callable
+    :param options: CompileOptions, None for the defaults
+    :param inline_table: calls to inline, see CodeGenerator
+    :param source: jack code to compile instead of reading input_file_path
+    :return: the CodeGenerator, for its stats and call graph
+    """
+    if options is None:
+        options = CompileOptions()
+    class_node = JackParser.parse_file(input_file_path, source,
+                                       options.stream, options.max_errors)
+    generator = CodeGenerator(output, options, inline_table, input_file_path)
+    generator.generate(class_node)
+    return generator
+
+
+class CodeGenerator(CodeEmitter.CodeEmitter):
+    """
+    Code generation stage of the compiler: walks the tree JackParser built
+    for a class and emits its VM code through a VMWriter. The output is the
+    same as CompilationEngine's for the same options, command for command.
+    """
+
+    def __init__(self, output, options=None, inline_table=None,
+                 file_path=None):
+        """
+        :param output: file / stream to write to, or a callable that gets
+        the vm text chunks
+        :param options: CompileOptions, None for the defaults
+        :param inline_table: subroutine name -> (number of arguments, vm
+        commands that replace the call, the only class the commands are
+        valid in or None) for the calls to inline, None for no inlining
+        :param file_path: jack file of the tree, for the error messages
+        """
+        if options is None:
+            options = CompileOptions()
+        super().__init__(output, options, inline_table)
+        self.file_path = file_path
+        self.statements_func_dict = {LetStatement: self.generate_let,
+                                     DoStatement: self.generate_do,
+                                     WhileStatement: self.generate_while,
+                                     IfStatement: self.generate_if,
+                                     ReturnStatement: self.generate_return}
+        self.terms_func_dict = {ParenTerm: self.generate_paren,
+                                UnaryTerm: self.generate_unary,
+                                ArrayTerm: self.generate_array,
+                                SubroutineCall: self.generate_call,
+                                VarTerm: self.generate_var,
+                                IntegerConstant: self.generate_integer,
+                                KeywordConstant: self.generate_keyword,
+                                StringConstant: self.generate_string}
+
+    def generate(self, class_node):
+        """
+        emit the vm code of a class and write it all to the output
+        :param class_node: ClassNode
+        """
+        for _ in self.generate_steps(class_node):
+            pass
+        self.writer.flush()
+
+    def generate_steps(self, class_node):
+        """
+        emit the vm code of a class a subroutine at a time
+        :param class_node: ClassNode
+        :return: iterator that emits the next subroutine on every step
+        """
+        self.scope = class_node.name
+        for var_dec in class_node.class_vars:
+            self.define(var_dec)
+        for subroutine in class_node.subroutines:
+            self.generate_subroutine(subroutine)
+            yield
+        self.scope = None
+
+    def define(self, var_dec):
+        """
+        :param var_dec: VarDec to add to the symbol table
+        :return: how many variables it declares
+        """
+        for name in var_dec.names:
+            self.symbol_table.define(name, var_dec.type, var_dec.kind)
+        return len(var_dec.names)
+
+    def variable(self, node):
+        """
+        :param node: LetStatement / VarTerm / ArrayTerm
+        :return: the symbol of the variable the node names
+        :raise JackSyntaxError: at the name, if no variable has that name
+        """
+        var = self.symbol_table.lookup(node.name)
+        if var is None:
+            line, column = node.position
+            raise JackTokenizer.JackSyntaxError(
+                self.file_path,
+                [(line, column, 'undefined variable %r' % node.name)])
+        return var
+
+    def generate_subroutine(self, subroutine):
+        num_of_fields = self.symbol_table.var_count(SymbolTable.FIELD)
+        self.symbol_table.start_subroutine()
+        self.return_type = subroutine.return_type
+        if subroutine.kind == 'method':
+            self.symbol_table.define('this', self.scope, SymbolTable.ARG)
+        for symbol_type, name in subroutine.params:
+            self.symbol_table.define(name, symbol_type, SymbolTable.ARG)
+        var_dec_counter = 0
+        for var_dec in subroutine.var_decs:
+            var_dec_counter += self.define(var_dec)
+        self.write_subroutine(subroutine.name, subroutine.kind,
+                              var_dec_counter, num_of_fields)
+        self.generate_statements(subroutine.statements)
+        self.symbol_table.end_subroutine()
+
+    def generate_statements(self, statements):
+        for statement in statements:
+            self.statements_func_dict[type(statement)](statement)
+
+    def generate_let(self, statement):
+        var = self.variable(statement)
+        write_value = partial(self.generate_expression, statement.value)
+        if statement.index is None:
+            self.write_let(var, None, write_value)
+            return
+        write_index = partial(self.generate_expression, statement.index)
+        if self.options.array_access:
+            self.write_array_let(var, self.constant_index(statement.index),
+                                 write_index, write_value)
+        else:
+            self.write_let(var, write_index, write_value)
+
+    def constant_index(self, expression):
+        """
+        :param expression: index of an array access
+        :return: its value if it is a single integer constant and
+        array_access is on, None otherwise
+        """
+        if self.options.array_access and not expression.operations and \
+                type(expression.term) is IntegerConstant:
+            return expression.term.value
+        return None
+
+    def generate_if(self, statement):
+        else_clause = None
+        if statement.else_statements is not None:
+            else_clause = partial(self.generate_statements,
+                                  statement.else_statements)
+        self.write_if_statement(
+            partial(self.generate_expression, statement.condition),
+            partial(self.generate_statements, statement.statements),
+            lambda: else_clause)
+
+    def generate_while(self, statement):
+        self.write_while_statement(
+            partial(self.generate_expression, statement.condition),
+            partial(self.generate_statements, statement.statements))
+
+    def generate_do(self, statement):
+        self.generate_call(statement.call)
+        self.writer.write_pop('temp', 0)
+
+    def generate_return(self, statement):
+        if statement.value is not None:
+            self.generate_expression(statement.value)
+        self.write_return_value()
+
+    def generate_expression(self, expression):
+        value = self.fold_expression(expression)
+        if value is not None:
+            self.write_constant(value)
+
+    def fold_expression(self, expression):
+        """
+        emit an expression, folding a constant prefix of it - see
+        CodeEmitter.fold_operations
+        :return: value of a constant expression - nothing was emitted for
+        it - or None
+        """
+        return self.fold_operations(
+            self.generate_term(expression.term),
+            ((op, partial(self.generate_term, term))
+             for op, term in expression.operations))
+
+    def generate_term(self, term):
+        """
+        :return: value of the term if it is a constant that is folded -
+        nothing was emitted for it - None otherwise
+        """
+        return self.terms_func_dict[type(term)](term)
+
+    def generate_paren(self, term):
+        return self.fold_expression(term.expression)
+
+    def generate_unary(self, term):
+        return self.write_unary(term.op, self.generate_term(term.term))
+
+    def generate_array(self, term):
+        self.write_array_entry(self.variable(term),
+                               self.constant_index(term.index),
+                               partial(self.generate_expression, term.index))
+
+    def generate_var(self, term):
+        var = self.variable(term)
+        self.writer.write_push(var.segment, var.index)
+
+    def generate_integer(self, term):
+        if self.track_constants:
+            return term.value
+        self.writer.write_push('constant', term.value)
+
+    def generate_keyword(self, term):
+        if self.track_constants and term.word in keyword_constant_dict:
+            return keyword_constant_dict[term.word]
+        self.write_keyword_constant(term.word)
+
+    def generate_string(self, term):
+        self.write_string_constant(term.literal)
+
+    def generate_call(self, call):
+        if call.target is None:
+            self.writer.write_push('pointer', 0)
+            expression_counter = 1
+            subroutine = self.scope + '.' + call.name
+        else:
+            var = self.symbol_table.lookup(call.target)
+            class_name = call.target
+            expression_counter = 0
+            if var:
+                self.writer.write_push(var.segment, var.index)
+                class_name = var.type
+                expression_counter = 1
+            subroutine = class_name + '.' + call.name
+        for argument in call.arguments:
+            self.generate_expression(argument)
+        expression_counter += len(call.arguments)
+        self.write_subroutine_call(subroutine, expression_counter)
@@ -1,44 +1,74 @@
+import CodeEmitter
 import JackTokenizer
+import SymbolTable
+from CodeEmitter import keyword_constant_dict
+from JackTokenizer import (class_var_dec, VAR, ELSE, unary_op_list,
+                           keyword_constant_list, DOT, END_OF_LINE,
+                           OPEN_ROUND, OPEN_SQUARE, CLOSE_ROUND, COMMA,
+                           CLOSE_TALTAL, OPEN_TALTAL, CLOSE_SQUARE, EQUALS,
+                           CLASS, SUBROUTINE_KINDS, closing_dict, OP)
 
-class_var_dec = ['static', 'field']
-
-vars = ['static', 'field', 'argument', 'var']
-
-VAR = 'var'
-
-ELSE = 'else'
-
-ARG = 'argument'
-
-unary_op_list = ['-', '~']
-
-DOT = '.'
-
-END_OF_LINE = ';'
-
-OPEN_ROUND = '('
-
-OPEN_SQUARE = '['
-
-CLOSE_ROUND = ")"
-
-COMMA = ','
-
-CLOSE_TALTAL = '}'
-
-OP = ['+', '-', '*', '/', '&', '|', '<', '>', '=']
-
-op_dict = {'+': 'add', '-': 'sub', '*': 'call Math.multiply 2',
-           '/': 'call Math.divide 2', '&': 'and', '|': 'or',
-           '<': 'lt', '>': 'gt', '=': 'eq'}
-
-unary_op_dict = {'-': 'neg', '~': 'not'}
+VM_TARGET = 'vm'
 
 CLASS_VAR_DEC = 'classVarDec'
 VAR_DEC = 'varDec'
 
 
-class CompilationEngine:
+class CompileOptions:
+    """
+    switches of the optional optimizations, all off by default so the
+    output is the plain translation of the source
+    """
+
+    def __init__(self, peephole=False, fold_constants=False,
+                 strength_reduce=False, pool_strings=False,
+                 branch_layout=False, ast=False, stream=False,
+                 max_errors=JackTokenizer.MAX_ERRORS, target=VM_TARGET,
+                 array_access=False):
+        """
+        :param peephole: rewrite redundant VM sequences
+        :param fold_constants: evaluate constant expressions at compile time
+        :param strength_reduce: replace Math.multiply / Math.divide calls
+        that have a constant operand with cheaper sequences
+        :param pool_strings: build every distinct string literal of a class
+        once and reuse it - the literal must not be changed or disposed
+        :param branch_layout: lay if statements out with the negated
+        condition, so the if clause falls through, and while loops with the
+        condition after the body, so an iteration runs a single jump
+        :param ast: parse the class into a syntax tree first and generate
+        the code from the tree (JackParser / CodeGenerator) - same output
+        :param stream: read the source a chunk at a time and split it into
+        tokens lazily (StreamTokenizer), for huge generated classes - same
+        output
+        :param max_errors: syntax errors reported per file - past a bad
+        statement the compilation goes on to find more, up to this many
+        :param target: 'vm' for vm code, 'asm' for Hack assembly straight
+        from the vm commands (AsmWriter) - the asm of a class is not a
+        program without the bootstrap and trampolines AsmWriter adds
+        :param array_access: address a constant index as that <index>,
+        keep pointer 1 for consecutive accesses of the same local /
+        argument array, and store into an array without the temp shuffle
+        when the value can not move pointer 1
+        """
+        self.peephole = peephole
+        self.fold_constants = fold_constants
+        self.strength_reduce = strength_reduce
+        self.pool_strings = pool_strings
+        self.branch_layout = branch_layout
+        self.ast = ast
+        self.stream = stream
+        self.max_errors = max_errors
+        self.target = target
+        self.array_access = array_access
+
+    def key(self):
+        """
+        :return: string that identifies the options, for cache keys
+        """
+        return repr(sorted(self.__dict__.items()))
+
+
+class CompilationEngine(CodeEmitter.CodeEmitter):
     """
     This module effects the actual compilation into XML form. It gets its
     input from a JackTokenizer and writes its parsed XML structure into an
@@ -51,67 +81,155 @@ class CompilationEngine:
     input.
     """
 
-    def __init__(self, input_file_path, output):
+    def __init__(self, input_file_path, output, options=None,
+                 inline_table=None, source=None, tokenizer=None):
         """
         creates a new compilation engine with the given input and output.
         The next method called must be compileClass(). :param
-        input_file_path: input file path :param output: output file to write
-        to
-        """
-        self.tokenizer = JackTokenizer.JackTokenizer(input_file_path)
-        self.file = output
+        input_file_path: input file path :param output: output file /
+        stream to write to, or a callable that gets the vm text chunks
+        :param options: CompileOptions, None for the defaults
+        :param inline_table: subroutine name -> (number of arguments, vm
+        commands that replace the call, the only class the commands are
+        valid in or None) for the calls to inline, None for no inlining
+        :param source: jack code to compile instead of reading
+        input_file_path
+        :param tokenizer: tokenizer of the class to compile, instead of a
+        new one over input_file_path / source
+        """
+        if options is None:
+            options = CompileOptions()
+        super().__init__(output, options, inline_table)
+        if tokenizer is not None:
+            self.tokenizer = tokenizer
+        elif self.options.stream:
+            self.tokenizer = JackTokenizer.StreamTokenizer(input_file_path,
+                                                           source)
+        else:
+            self.tokenizer = JackTokenizer.JackTokenizer(input_file_path,
+                                                         source)
         self.statements_func_dict = {'let': self.compile_let,
                                      'do': self.compile_do,
                                      'while': self.compile_while,
                                      'if': self.compile_if,
                                      'return': self.compile_return}
-        self.scope = None
-        self.while_counter = 0
-        self.if_counter = 0
-        self.buffer = []
+        # syntax errors found so far, as (line, column, message)
+        self.diagnostics = []
 
     def write_class_to_file(self):
         """
-        write all lines to file
+        write all lines that are still pending to file
         """
-        for command in range(len(self.buffer) - 1):
-            self.file.write(self.buffer[command])
-            self.file.write('\n')
-        self.file.write(self.buffer[-1])
+        self.writer.flush()
 
     def remove_token(self):
         """
-        advance the token by 1
+        advance the token by 1 - every loop of the engine either advances or
+        stops, so the compilation is linear in the input and always ends
+        :raise JackSyntaxError: at the end of the input
         """
-        if self.tokenizer.has_more_tokens():
-            self.tokenizer.advance()
+        if not self.tokenizer.has_more_tokens():
+            raise self.tokenizer.error('unexpected end of input')
+        self.tokenizer.advance()
+
+    def expect(self, symbol):
+        """
+        advance over the current token, which must be the given symbol
+        :raise JackSyntaxError: if it is another token
+        """
+        if self.tokenizer.get_curr_token() != symbol:
+            raise self.tokenizer.unexpected(repr(symbol))
+        self.remove_token()
+
+    def identifier(self, expected):
+        """
+        advance over the current token, which must be an identifier
+        :param expected: what the identifier names, for the error message
+        :return: the identifier
+        :raise JackSyntaxError: if it is another token
+        """
+        if self.tokenizer.token_type() is not \
+                JackTokenizer.TokenType.IDENTIFIER:
+            raise self.tokenizer.unexpected(expected)
+        name = self.tokenizer.get_curr_token()
+        self.remove_token()
+        return name
+
+    def variable(self):
+        """
+        :return: the symbol of the variable the current token names
+        :raise JackSyntaxError: if no variable has that name
+        """
+        var = self.symbol_table.lookup(self.tokenizer.get_curr_token())
+        if var is None:
+            raise self.tokenizer.error('undefined variable %r' %
+                                       self.tokenizer.get_curr_token())
+        return var
 
     def compile_class(self):
         """
         compiles a complete class.
+        :raise JackSyntaxError: with the errors of the class, up to
+        options.max_errors of them
+        """
+        for _ in self.compile_class_steps():
+            pass
+
+    def compile_class_steps(self):
+        """
+        compiles a complete class a subroutine at a time
+        :return: iterator that compiles up to the end of the next
+        subroutine on every step
+        :raise JackSyntaxError: with the errors of the class, up to
+        options.max_errors of them, after the last step
+        """
+        try:
+            yield from self.compile_class_declaration()
+        except JackTokenizer.JackSyntaxError as error:
+            self.diagnostics.extend(error.diagnostics)
+        except Exception as error:
+            # e.g. an undefined name, reported where it was found
+            line, column = self.tokenizer.get_position()
+            self.diagnostics.append(
+                (line, column, JackTokenizer.error_message(error)))
+        if self.diagnostics:
+            raise JackTokenizer.JackSyntaxError(
+                self.tokenizer.file_path,
+                self.diagnostics[:self.options.max_errors])
+
+    def compile_class_declaration(self):
+        """
+        compiles the class declaration, failing at its first error outside
+        a statement
+        :return: iterator that stops after every subroutine
         """
-        self.tokenizer.symbol_table.add_node()
         # <class>
+        if not self.tokenizer.has_more_tokens():
+            raise self.tokenizer.unexpected(repr(CLASS))
         self.tokenizer.advance()
         # <keyword> class
-        self.remove_token()
+        self.expect(CLASS)
         # <identifier> class_name
-        self.scope = self.tokenizer.get_curr_token()
-        self.remove_token()
+        self.scope = self.identifier('class name')
         # <symbol> {
-        self.remove_token()
+        self.expect(OPEN_TALTAL)
         # inner class
         while self.tokenizer.get_curr_token() != CLOSE_TALTAL:
-            # classVarDec
-            while self.tokenizer.key_word() in class_var_dec:
+            if self.tokenizer.key_word() in class_var_dec:
+                # classVarDec
                 self.compile_class_var_dec()
-            # subroutine
-            while self.tokenizer.token_type() is JackTokenizer.TokenType.KEYWORD:
-                self.buffer += self.compile_subroutine()
-        # <symbol> }
-        self.remove_token()
+            elif self.tokenizer.get_curr_token() in SUBROUTINE_KINDS:
+                # subroutine
+                self.compile_subroutine()
+                yield
+            else:
+                raise self.tokenizer.unexpected(
+                    'class variable or subroutine declaration')
+        # <symbol> } - the last token
+        if self.tokenizer.has_more_tokens():
+            self.tokenizer.advance()
+            raise self.tokenizer.unexpected('end of input after the class')
 
-        self.tokenizer.symbol_table.del_node()
         self.scope = None
 
     def compile_class_var_dec(self):
@@ -124,77 +242,66 @@ class CompilationEngine:
     def compile_subroutine(self):
         """
         compiles a complete method, function, or constructor.
-        :return: list of relevant VM code lines
         """
+        num_of_fields = self.symbol_table.var_count(SymbolTable.FIELD)
 
-        lines = []
-
-        num_of_fields = self.tokenizer.symbol_table.head_val.scope_counter[1]
-
-        self.tokenizer.symbol_table.add_node()
+        self.symbol_table.start_subroutine()
 
         # <subroutineDec>
         # <keyword> constructor | function | method
         subroutine_type = self.tokenizer.get_curr_token()
         self.remove_token()
         # <keyword | identifier> type
-        self.tokenizer.symbol_table.update_scope_return_type(
-            self.tokenizer.get_curr_token())
+        self.return_type = self.tokenizer.get_curr_token()
         self.remove_token()
         # <identifier> subroutine name
-        subroutine = self.tokenizer.get_curr_token()
-        self.remove_token()
+        subroutine = self.identifier('subroutine name')
         # <symbol> (
-        self.remove_token()
-        lines += self.compile_parameter_list(subroutine_type)
+        self.expect(OPEN_ROUND)
+        self.compile_parameter_list(subroutine_type)
         # <symbol> )
-        self.remove_token()
+        self.expect(CLOSE_ROUND)
         # <subroutineBody>
         # <symbol> {
-        self.remove_token()
+        self.expect(OPEN_TALTAL)
         var_dec_counter = 0
         while self.tokenizer.key_word() == VAR:
             var_dec_counter += self.compile_var_dec()
-        lines.append('function ' + self.scope + '.' + subroutine + ' ' + str(
-            var_dec_counter))
-        if subroutine_type == 'method':
-            lines.append('push argument 0')
-            lines.append('pop pointer 0')
-        elif subroutine_type == 'constructor':
-            lines.append('push constant ' + str(num_of_fields))
-            lines.append('call Memory.alloc 1')
-            lines.append('pop pointer 0')
-        lines += self.compile_statements()
+        self.write_subroutine(subroutine, subroutine_type, var_dec_counter,
+                              num_of_fields)
+        self.compile_statements()
         # <symbol> }
-        self.remove_token()
-
-        self.tokenizer.symbol_table.del_node()
+        self.expect(CLOSE_TALTAL)
 
-        return lines
+        self.symbol_table.end_subroutine()
 
     def compile_parameter_list(self, subroutine_type):
         """
         compiles a (possibly empty) parameter list, not including the
         enclosing Parenthesis.
-        :return: list of empty VM code lines
         """
         # <parameterList>
         if subroutine_type == 'method':
-            self.tokenizer.symbol_table.head_val.scope_counter[2] += 1
-        while self.tokenizer.get_curr_token() != CLOSE_ROUND:
-            if self.tokenizer.get_curr_token() == COMMA:
-                self.remove_token()
-            symbol_type = self.tokenizer.get_curr_token()
-            self.remove_token()
-            # add_to_symbol_list
-            self.tokenizer.symbol_table.head_val.var_dict[
-                self.tokenizer.get_curr_token()] = (
-                ARG, symbol_type,
-                self.tokenizer.symbol_table.head_val.scope_counter[2])
-            self.tokenizer.symbol_table.head_val.scope_counter[2] += 1
+            # the object is argument 0 - 'this' is a keyword, so the name is
+            # never looked up
+            self.symbol_table.define('this', self.scope, SymbolTable.ARG)
+        if self.tokenizer.get_curr_token() == CLOSE_ROUND:
+            return
+        self.compile_parameter()
+        # , type varName
+        while self.tokenizer.get_curr_token() == COMMA:
             self.remove_token()
+            self.compile_parameter()
 
-        return []
+    def compile_parameter(self):
+        """
+        compiles the type and name of a parameter
+        """
+        symbol_type = self.tokenizer.get_curr_token()
+        self.remove_token()
+        # add_to_symbol_list
+        self.symbol_table.define(self.identifier('parameter name'),
+                                 symbol_type, SymbolTable.ARG)
 
     def compile_var_dec(self):
         """
@@ -217,11 +324,6 @@ class CompilationEngine:
 
         symbol_kind = self.tokenizer.get_curr_token()
 
-        symbol_counter = self.tokenizer.symbol_table.head_val.scope_counter[
-            vars.index(symbol_kind)]
-        self.tokenizer.symbol_table.head_val.scope_counter[
-            vars.index(symbol_kind)] += 1
-
         self.remove_token()
         # <keyword> type
 
@@ -231,26 +333,16 @@ class CompilationEngine:
         # <identifier>
 
         # add_to_symbol_list
-        self.tokenizer.symbol_table.head_val.var_dict[
-            self.tokenizer.get_curr_token()] = (
-            symbol_kind, symbol_type, symbol_counter)
-
-        self.remove_token()
+        self.symbol_table.define(self.identifier('variable name'),
+                                 symbol_type, symbol_kind)
         # , varName
         while self.tokenizer.get_curr_token() == COMMA:
             var_counter += 1
             self.remove_token()
-            symbol_counter = \
-                self.tokenizer.symbol_table.head_val.scope_counter[
-                    vars.index(symbol_kind)]
-            self.tokenizer.symbol_table.head_val.scope_counter[
-                vars.index(symbol_kind)] += 1
-            self.tokenizer.symbol_table.head_val.var_dict[
-                self.tokenizer.get_curr_token()] = (
-                symbol_kind, symbol_type, symbol_counter)
-            self.remove_token()
+            self.symbol_table.define(self.identifier('variable name'),
+                                     symbol_type, symbol_kind)
         # <symbol> ;
-        self.remove_token()
+        self.expect(END_OF_LINE)
 
         return var_counter
 
@@ -258,223 +350,229 @@ class CompilationEngine:
         """
         compiles a sequence of statements, not including the enclosing
         Parenthesis.
-        :return: list of relevant VM code lines
         """
-        lines = []
         while self.tokenizer.get_curr_token() != CLOSE_TALTAL:
-            lines += self.statements_func_dict[
-                self.tokenizer.get_curr_token()]()
-        return lines
+            try:
+                self.compile_statement()
+            except JackTokenizer.JackSyntaxError as error:
+                self.recover(error)
+
+    def compile_statement(self):
+        """
+        compiles a single statement of any kind
+        """
+        compile_function = self.statements_func_dict.get(
+            self.tokenizer.get_curr_token())
+        if compile_function is None:
+            raise self.tokenizer.unexpected('statement')
+        compile_function()
+
+    def recover(self, error):
+        """
+        record the syntax error of a statement and skip the rest of the
+        statement, to go on with the next one. the output is dropped from
+        then on.
+        :param error: JackSyntaxError raised while compiling the statement
+        :raise JackSyntaxError: the error again, when it is the last one
+        to report or the input ends in the statement
+        """
+        if len(self.diagnostics) + 1 >= self.options.max_errors or \
+                not self.tokenizer.skip_statement():
+            raise error
+        self.diagnostics.extend(error.diagnostics)
+        self.writer.discard()
 
     def compile_let(self):
         """
         Compiles a let statement
-        :return: list of relevant VM code lines
         """
-        lines = []
         # let
         self.remove_token()
-        var_name = self.tokenizer.get_curr_token()
         # varName
-        self.remove_token()
-        array_index = None
-        if self.tokenizer.get_curr_token() == OPEN_SQUARE:
-            array_index = self.pre_expression_compile()
+        if self.tokenizer.token_type() is not \
+                JackTokenizer.TokenType.IDENTIFIER:
+            raise self.tokenizer.unexpected('variable name')
+        var = self.variable()
+        self.remove_token()
+        if self.tokenizer.get_curr_token() != OPEN_SQUARE:
+            self.write_let(var, None, self.compile_let_value)
+        elif self.options.array_access:
+            self.write_array_let(var, self.constant_index(),
+                                 self.pre_expression_compile,
+                                 self.compile_let_value)
+        else:
+            self.write_let(var, self.pre_expression_compile,
+                           self.compile_let_value)
+
+    def compile_let_value(self):
+        """
+        compiles the rest of a let statement, from its =
+        """
         # =
-        self.remove_token()
-        to_assign = self.compile_expression()
+        self.expect(EQUALS)
+        self.compile_expression()
         # ;
+        self.expect(END_OF_LINE)
+
+    def constant_index(self):
+        """
+        advance over the [k] of an array access if k is an integer constant
+        and array_access is on
+        :return: k, or None - then the [ is still the current token
+        """
+        index = self.tokenizer.future_token()
+        if not self.options.array_access or index is None or \
+                not index.isdigit() or \
+                self.tokenizer.peek(2) != CLOSE_SQUARE:
+            return None
+        # [
         self.remove_token()
-        if array_index is not None:
-            lines += array_index
-            lines.append(
-                'push ' + self.tokenizer.get_symbol_record(var_name)[0] + ' ' +
-                str(self.tokenizer.get_symbol_record(var_name)[2]))
-            lines.append('add')
-            lines += to_assign
-            lines.append('pop temp 0')
-            lines.append('pop pointer 1')
-            lines.append('push temp 0')
-            lines.append('pop that 0')
-        else:
-            lines += to_assign
-            lines.append(
-                'pop ' + self.tokenizer.get_symbol_record(var_name)[0] + ' ' +
-                str(self.tokenizer.get_symbol_record(var_name)[2]))
-        return lines
+        # k
+        self.remove_token()
+        # ]
+        self.expect(CLOSE_SQUARE)
+        return int(index)
 
     def pre_expression_compile(self):
         """
         compiles an expression including the Parenthesis
-        :return: list of relevant VM code lines
         """
         # [ / (
+        closing = closing_dict.get(self.tokenizer.get_curr_token())
+        if closing is None:
+            raise self.tokenizer.unexpected(repr(OPEN_ROUND))
         self.remove_token()
-        to_return = self.compile_expression()
+        self.compile_expression()
         # ] / )
-        self.remove_token()
-        return to_return
+        self.expect(closing)
 
     def compile_subroutine_call(self, is_do):
         """
         compile subroutine call
         :param is_do: is called from do or let
-        :return: list of relevant VM code lines
         """
-        lines = []
         # subroutineName | var
-        subroutine = self.tokenizer.get_curr_token()
-        self.remove_token()
+        subroutine = self.identifier('subroutine name')
         if self.tokenizer.get_curr_token() == OPEN_ROUND:
-            parameters, expression_counter = self.pre_compile_expression_list(
-                True)
+            expression_counter = self.pre_compile_expression_list(True)
             subroutine = self.scope + '.' + subroutine
         else:
             var_name = subroutine
             # .
-            self.remove_token()
+            self.expect(DOT)
             # subroutineName
-            subroutine = self.tokenizer.get_curr_token()
-            self.remove_token()
-            var = self.tokenizer.get_symbol_record(var_name)
-            parameters, expression_counter = self.pre_compile_expression_list(
-                False)
+            subroutine = self.identifier('subroutine name')
+            var = self.symbol_table.lookup(var_name)
+            if var:
+                self.writer.write_push(var.segment, var.index)
+                var_name = var.type
+            expression_counter = self.pre_compile_expression_list(False)
             if var:
                 expression_counter += 1
-                lines.append('push ' + var[0] + ' ' +
-                             str(var[2]))
-                var_name = var[1]
             subroutine = var_name + '.' + subroutine
-        lines += parameters
-        lines.append('call ' + subroutine + ' ' + str(expression_counter))
+        self.write_subroutine_call(subroutine, expression_counter)
         if is_do:
-            lines.append('pop temp 0')
-        return lines
+            self.writer.write_pop('temp', 0)
 
     def compile_do(self):
         """
         Compiles a do statement
-        :return: list of relevant VM code lines
         """
-        lines = []
         # do
         self.remove_token()
-        lines += self.compile_subroutine_call(True)
+        self.compile_subroutine_call(True)
         # ;
-        self.remove_token()
-        return lines
+        self.expect(END_OF_LINE)
 
     def pre_compile_expression_list(self, is_method):
         """
         compiles an expression list including the Parenthesis
-        :return: list of relevant VM code lines, how many expressions
+        :return: how many expressions
         """
         # (
-        self.remove_token()
-        to_return = self.compile_expression_list(is_method)
+        self.expect(OPEN_ROUND)
+        expression_counter = self.compile_expression_list(is_method)
         # )
-        self.remove_token()
-        return to_return
+        self.expect(CLOSE_ROUND)
+        return expression_counter
 
     def compile_while(self):
         """
         Compiles a while statement
-        :return: list of relevant VM code lines
         """
-        while_num = self.while_counter
-        self.while_counter += 1
-        lines = ['label WHILE_EXP_' + str(while_num)]
         # while
         self.remove_token()
-        lines += self.pre_expression_compile()
-        lines.append('if-goto WHILE_BODY_' + str(while_num))
-        lines.append('goto WHILE_END_' + str(while_num))
-        lines.append('label WHILE_BODY_' + str(while_num))
-        lines += self.pre_statements_compile()
-        lines.append('goto WHILE_EXP_' + str(while_num))
-        lines.append('label WHILE_END_' + str(while_num))
-        return lines
+        self.write_while_statement(self.pre_expression_compile,
+                                   self.pre_statements_compile)
 
     def pre_statements_compile(self):
         """
         compiles statements including the Parenthesis
-        :return: list of relevant VM code lines
         """
         # {
-        self.remove_token()
-        to_return = self.compile_statements()
+        self.expect(OPEN_TALTAL)
+        self.compile_statements()
         # }
-        self.remove_token()
-        return to_return
+        self.expect(CLOSE_TALTAL)
 
     def compile_if(self):
         """
         compiles an if statement, possibly with a trailing else clause.
-        :return: list of relevant VM code lines
         """
-        lines = []
-        if_num = self.if_counter
-        self.if_counter += 1
+        # if
         self.remove_token()
-        lines += self.pre_expression_compile()
-        lines.append('if-goto IF_START_' + str(if_num))
-        if_statements = self.pre_statements_compile()
-        else_statements = None
-        if self.tokenizer.get_curr_token() == ELSE:
-            self.remove_token()
-            else_statements = self.pre_statements_compile()
-        if else_statements:
-            lines += else_statements
-        lines.append('goto IF_END_' + str(if_num))
-        lines.append('label IF_START_' + str(if_num))
-        lines += if_statements
-        lines.append('label IF_END_' + str(if_num))
-        return lines
+        self.write_if_statement(self.pre_expression_compile,
+                                self.pre_statements_compile, self.else_clause)
+
+    def else_clause(self):
+        """
+        advance over the else of an else clause, if the current token is one
+        :return: pre_statements_compile, to compile the clause, or None
+        """
+        if self.tokenizer.get_curr_token() != ELSE:
+            return None
+        self.remove_token()
+        return self.pre_statements_compile
 
     def compile_return(self):
         """
         compiles a return statement.
-        :return: list of relevant VM code lines
         """
-        lines = []
         self.remove_token()
         if self.tokenizer.get_curr_token() != END_OF_LINE:
-            lines += self.compile_expression()
+            self.compile_expression()
         # ;
-        self.remove_token()
-        if self.tokenizer.symbol_table.get_scope_return_type() == 'void':
-            lines.append('push constant 0')
-        lines.append('return')
-        return lines
+        self.expect(END_OF_LINE)
+        self.write_return_value()
+
+    def compile_expression(self):
+        """
+        compiles an expression.
+        """
+        value = self.fold_expression()
+        if value is not None:
+            self.write_constant(value)
 
-    def compile_op(self):
+    def fold_expression(self):
         """
-        :return: relevant command for current op token
+        compiles an expression, folding a constant prefix of it - see
+        CodeEmitter.fold_operations
+        :return: value of a constant expression - nothing was emitted for
+        it - or None
         """
-        op = self.tokenizer.get_curr_token()
-        return op_dict[op]
+        return self.fold_operations(self.compile_term(), self.operations())
 
-    def compile_expression(self):
+    def operations(self):
         """
-        compiles an expression.
-        :return: list of relevant VM code lines
+        advance over the ops of an expression, one at a time
+        :return: iterator of (op, compile_term) - the term is compiled
+        before the next op is read
         """
-        lines = []
-        term_lines = []
-        term_lines += self.compile_term()
-        add_term_lines = True
         while self.tokenizer.get_curr_token() in OP:
-            add_term_lines = False
             # op
-            op_line = self.compile_op()
+            op = self.tokenizer.get_curr_token()
             self.remove_token()
-            term_lines += self.compile_term()
-            lines += term_lines
-            term_lines = []
-            lines.append(op_line)
-        if add_term_lines:
-            lines += term_lines
-        return lines
+            yield op, self.compile_term
 
     def compile_term(self):
         """
@@ -483,75 +581,83 @@ class CompilationEngine:
         Specifically, if the current token is an identifier, it must still
         distinguish between a variable, an array entry, and a subroutine
         call. The distinction can be made by looking ahead one extra token.
-        :return: list of relevant VM code lines
+        :return: value of the term if it is a constant that is folded -
+        nothing was emitted for it - None otherwise
         """
-        lines = []
         const = self.tokenizer.get_curr_token()
         future_token = self.tokenizer.future_token()
         if const == OPEN_ROUND:
-            lines += self.pre_expression_compile()
+            # (
+            self.remove_token()
+            value = self.fold_expression()
+            # )
+            self.expect(CLOSE_ROUND)
+            return value
         elif const in unary_op_list:
             # unaryOp
-            unary_op = unary_op_dict[self.tokenizer.get_curr_token()]
             self.remove_token()
-            term = self.compile_term()
-            lines += term
-            lines.append(unary_op)
+            return self.write_unary(const, self.compile_term())
         elif self.tokenizer.token_type() is JackTokenizer.TokenType.IDENTIFIER:
             if future_token == OPEN_SQUARE:
-                var_name = self.tokenizer.get_curr_token()
+                var = self.variable()
                 self.remove_token()
-                array_index = self.pre_expression_compile()
-                lines += array_index
-                lines.append(
-                    'push ' + self.tokenizer.get_symbol_record(var_name)[
-                        0] + ' ' +
-                    str(self.tokenizer.get_symbol_record(var_name)[2]))
-                lines.append('add')
-                lines.append('pop pointer 1')
-                lines.append('push that 0')
+                self.write_array_entry(var, self.constant_index(),
+                                       self.pre_expression_compile)
             elif future_token in [DOT, OPEN_ROUND]:
-                lines += self.compile_subroutine_call(False)
+                self.compile_subroutine_call(False)
             else:
-                symbol_record = self.tokenizer.get_symbol_record(const)
-                lines.append('push ' + symbol_record[0] + ' ' +
-                             str(symbol_record[2]))
+                var = self.variable()
+                self.writer.write_push(var.segment, var.index)
                 self.remove_token()
+        elif self.track_constants and (
+                const in keyword_constant_dict or
+                self.tokenizer.token_type() is
+                JackTokenizer.TokenType.INT_CONST):
+            self.remove_token()
+            if const in keyword_constant_dict:
+                return keyword_constant_dict[const]
+            return int(const)
         else:
-            if const in ['null', 'false', 'true']:
-                lines.append('push constant 0')
-                if const == 'true':
-                    lines.append('not')
-            elif const == 'this':
-                lines.append('push pointer 0')
+            self.check_constant()
+            if const in keyword_constant_list:
+                self.write_keyword_constant(const)
             else:
                 try:
-                    lines.append('push constant ' + str(int(const)))
+                    self.writer.write_push('constant', int(const))
                 except ValueError:
-                    const = const[1:-1]
-                    lines.append('push constant ' + str(len(const)))
-                    lines.append('call String.new 1')
-                    for letter in const:
-                        char = ord(letter)
-                        lines.append('push constant ' + str(char))
-                        lines.append('call String.appendChar 2')
+                    self.write_string_constant(const)
             self.remove_token()
 
-        return lines
+    def check_constant(self):
+        """
+        :raise JackSyntaxError: if the current token is not a constant - any
+        other token where a term should be
+        """
+        token_type = self.tokenizer.token_type()
+        const = self.tokenizer.get_curr_token()
+        if token_type is JackTokenizer.TokenType.STRING_CONST:
+            if len(const) < 2:
+                raise self.tokenizer.error('unterminated string constant')
+        elif token_type is not JackTokenizer.TokenType.INT_CONST and \
+                const not in keyword_constant_dict and const != 'this':
+            raise self.tokenizer.unexpected('term')
 
     def compile_expression_list(self, is_method):
         """
         compiles a (possibly empty) comma separated list of expressions.
-        :return: list of relevant VM code lines, how many expressions
+        :return: how many expressions
         """
-        lines = []
         expression_counter = 0
         if is_method:
-            lines.append('push pointer 0')
+            self.writer.write_push('pointer', 0)
             expression_counter += 1
-        while self.tokenizer.get_curr_token() != CLOSE_ROUND:
-            if self.tokenizer.get_curr_token() == COMMA:
-                self.remove_token()
-            lines += self.compile_expression()
+        if self.tokenizer.get_curr_token() == CLOSE_ROUND:
+            return expression_counter
+        self.compile_expression()
+        expression_counter += 1
+        # , expression
+        while self.tokenizer.get_curr_token() == COMMA:
+            self.remove_token()
+            self.compile_expression()
             expression_counter += 1
-        return lines, expression_counter
+        return expression_counter
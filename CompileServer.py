@@ -0,0 +1,226 @@
+"""
+Long running compile server. The server keeps the compiler imported and
+the build caches of every dir it has compiled in memory, and takes compile
+requests from thin clients over a local unix socket:
+
+    python CompileServer.py --serve [--socket PATH]
+    python CompileServer.py [--socket PATH] <JackCompiler arguments>
+    python CompileServer.py [--socket PATH] --shutdown
+
+Every request is a single line of json - the working dir of the client and
+the JackCompiler command line (paths plus options) - and is answered by a
+single line of json with the status and diagnostics of every file. Only
+the standard library is imported at module level, so the client starts as
+fast as the interpreter does.
+"""
+import contextlib
+import errno
+import json
+import os
+import socket
+import socketserver
+import stat
+import sys
+import threading
+
+SOCKET_NAME = 'jackcompiler-%d.sock'
+
+ENCODING = 'utf-8'
+
+OK = 'ok'
+ERROR = 'error'
+
+
+def default_socket_path():
+    """
+    :return: per user socket path in the temp dir
+    """
+    return os.path.join(os.environ.get('TMPDIR', '/tmp'),
+                        SOCKET_NAME % os.getuid())
+
+
+class CompileRequestHandler(socketserver.StreamRequestHandler):
+    """
+    answers every json line a client sends, until it disconnects
+    """
+
+    def handle(self):
+        for line in self.rfile:
+            try:
+                reply = self.server.handle_request_message(
+                    json.loads(line.decode(ENCODING)))
+            except Exception as error:
+                reply = {'status': ERROR, 'message': '%s: %s' % (
+                    type(error).__name__, error)}
+            self.wfile.write(json.dumps(reply).encode(ENCODING) + b'\n')
+            self.wfile.flush()
+
+
+class CompileServer(socketserver.ThreadingMixIn,
+                    socketserver.UnixStreamServer):
+    """
+    Serves compile requests on a thread per client. Builds of the same dir
+    are serialized by a lock per dir, builds of different dirs run side by
+    side.
+    """
+    daemon_threads = True
+
+    def __init__(self, socket_path):
+        """
+        :param socket_path: unix socket to listen on
+        """
+        # the compiler is imported by the server only, the client stays thin
+        import Main
+        self.main = Main
+        self._caches = {}
+        self._locks = {}
+        self._locks_lock = threading.Lock()
+        # the socket file is removed on close only once this server made it
+        self._bound = False
+        remove_stale_socket(socket_path)
+        socketserver.UnixStreamServer.__init__(self, socket_path,
+                                               CompileRequestHandler)
+
+    def server_bind(self):
+        socketserver.UnixStreamServer.server_bind(self)
+        self._bound = True
+
+    def server_close(self):
+        """
+        stop listening, and remove the socket file if this server made it
+        """
+        socketserver.UnixStreamServer.server_close(self)
+        if self._bound:
+            self._bound = False
+            os.unlink(self.server_address)
+
+    def handle_request_message(self, message):
+        """
+        :param message: decoded request - {'cwd': ..., 'args': [...]} or
+        {'shutdown': true}
+        :return: reply to encode back to the client
+        """
+        if message.get('shutdown'):
+            threading.Thread(target=self.shutdown).start()
+            return {'status': OK}
+        try:
+            args = self.main.parse_args(message['args'])
+        except SystemExit:
+            return {'status': ERROR, 'message': 'invalid arguments: ' +
+                    ' '.join(message['args'])}
+        cwd = message.get('cwd', os.getcwd())
+        if self.main.STDIN in args.paths:
+            return {'status': ERROR, 'message': 'stdin is not served'}
+        args.paths = [os.path.join(cwd, path) for path in args.paths]
+        if args.out_dir:
+            args.out_dir = os.path.join(cwd, args.out_dir)
+        if args.profile:
+            args.profile = os.path.join(cwd, args.profile)
+        groups, unmatched = self.main.collect_sources(args.paths,
+                                                      args.out_dir)
+        with contextlib.ExitStack() as stack:
+            # always taken in the same order, so two builds cannot deadlock
+            for dir_path in sorted(group[0] for group in groups):
+                stack.enter_context(self._dir_lock(dir_path))
+            errors, report = self.main.build(args, self._caches)
+        messages = dict(errors)
+        files = []
+        for dir_path, files_list, vm_dir, complete in groups:
+            for file_name in files_list:
+                file_path = os.path.join(dir_path, file_name)
+                record = {'file': file_path,
+                          'status': ERROR if file_path in messages else OK}
+                if file_path in messages:
+                    record['message'] = messages[file_path]
+                    record['lines'] = self.main.error_lines(
+                        file_path, messages[file_path])
+                files.append(record)
+        for pattern, message in unmatched:
+            files.append({'file': pattern, 'status': ERROR,
+                          'message': message,
+                          'lines': self.main.error_lines(pattern, message)})
+        return {'status': ERROR if errors else OK, 'files': files,
+                'report': report}
+
+    def _dir_lock(self, dir_path):
+        with self._locks_lock:
+            return self._locks.setdefault(dir_path, threading.Lock())
+
+
+def remove_stale_socket(socket_path):
+    """
+    remove the socket file a server that is gone left behind. a socket
+    some server still accepts connections on is kept.
+    :param socket_path: unix socket to listen on
+    """
+    try:
+        if not stat.S_ISSOCK(os.stat(socket_path).st_mode):
+            return
+    except FileNotFoundError:
+        return
+    probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        probe.connect(socket_path)
+    except ConnectionRefusedError:
+        os.unlink(socket_path)
+        return
+    finally:
+        probe.close()
+    raise OSError(errno.EADDRINUSE, 'a compile server already listens on',
+                  socket_path)
+
+
+def send_request(socket_path, message):
+    """
+    :param socket_path: unix socket of the server
+    :param message: request to send
+    :return: decoded reply of the server
+    """
+    client = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        client.connect(socket_path)
+        client.sendall(json.dumps(message).encode(ENCODING) + b'\n')
+        reply = client.makefile('rb').readline()
+    finally:
+        client.close()
+    return json.loads(reply.decode(ENCODING))
+
+
+def main(argv):
+    """
+    :param argv: command line arguments without the program name
+    :return: exit code
+    """
+    socket_path = default_socket_path()
+    if '--socket' in argv:
+        index = argv.index('--socket')
+        socket_path = argv[index + 1]
+        argv = argv[:index] + argv[index + 2:]
+    if '--serve' in argv:
+        try:
+            server = CompileServer(socket_path)
+        except OSError as error:
+            sys.stderr.write('%s: %s\n' % (socket_path, error.strerror))
+            return 1
+        try:
+            server.serve_forever()
+        finally:
+            server.server_close()
+        return 0
+    if '--shutdown' in argv:
+        send_request(socket_path, {'shutdown': True})
+        return 0
+    reply = send_request(socket_path, {'cwd': os.getcwd(), 'args': argv})
+    for line in reply.get('report', []):
+        print(line)
+    if 'message' in reply:
+        sys.stderr.write(reply['message'] + '\n')
+    for record in reply.get('files', []):
+        if record['status'] != OK:
+            for line in record['lines']:
+                sys.stderr.write(line + '\n')
+    return 0 if reply['status'] == OK else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,123 @@
+"""
+Nodes of the abstract syntax tree of a jack class, as built by JackParser.
+Nodes keep their fields in __slots__, sequences are tuples (all the empty
+ones are the same object) and names are the interned token strings, so
+the trees of a whole dir are cheap to hold.
+"""
+
+
+class Node:
+    """
+    base of the tree nodes - the fields are given in __slots__ order
+    """
+    __slots__ = ()
+
+    def __init__(self, *values):
+        for field, value in zip(self.__slots__, values):
+            setattr(self, field, value)
+
+    def __repr__(self):
+        return '%s(%s)' % (type(self).__name__, ', '.join(
+            repr(getattr(self, field)) for field in self.__slots__))
+
+
+class ClassNode(Node):
+    __slots__ = ('name', 'class_vars', 'subroutines')
+
+
+class VarDec(Node):
+    """
+    kind: static / field / var
+    """
+    __slots__ = ('kind', 'type', 'names')
+
+
+class Subroutine(Node):
+    """
+    kind: constructor / function / method, params: tuple of (type, name)
+    """
+    __slots__ = ('kind', 'return_type', 'name', 'params', 'var_decs',
+                 'statements')
+
+
+class LetStatement(Node):
+    """
+    index: expression of an array entry, None for a plain variable
+    position: line and column of the name in the source
+    """
+    __slots__ = ('name', 'index', 'value', 'position')
+
+
+class IfStatement(Node):
+    __slots__ = ('condition', 'statements', 'else_statements')
+
+
+class WhileStatement(Node):
+    __slots__ = ('condition', 'statements')
+
+
+class DoStatement(Node):
+    __slots__ = ('call',)
+
+
+class ReturnStatement(Node):
+    """
+    value: expression, None for a plain return
+    """
+    __slots__ = ('value',)
+
+
+class Expression(Node):
+    """
+    term (op term)* - operations is a tuple of (op, term), evaluated left to
+    right as jack has no precedence
+    """
+    __slots__ = ('term', 'operations')
+
+
+class IntegerConstant(Node):
+    __slots__ = ('value',)
+
+
+class StringConstant(Node):
+    """
+    literal: the string constant token, including the quotes
+    """
+    __slots__ = ('literal',)
+
+
+class KeywordConstant(Node):
+    """
+    word: true / false / null / this
+    """
+    __slots__ = ('word',)
+
+
+class VarTerm(Node):
+    """
+    position: line and column of the name in the source
+    """
+    __slots__ = ('name', 'position')
+
+
+class ArrayTerm(Node):
+    """
+    position: line and column of the name in the source
+    """
+    __slots__ = ('name', 'index', 'position')
+
+
+class SubroutineCall(Node):
+    """
+    target: class or variable name before the dot, None for a call of a
+    subroutine of the class itself
+    """
+    __slots__ = ('target', 'name', 'arguments')
+
+
+class UnaryTerm(Node):
+    __slots__ = ('op', 'term')
+
+
+class ParenTerm(Node):
+    __slots__ = ('expression',)
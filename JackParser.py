@@ -0,0 +1,373 @@
+import JackTokenizer
+from JackAST import (ClassNode, VarDec, Subroutine, LetStatement, IfStatement,
+                     WhileStatement, DoStatement, ReturnStatement, Expression,
+                     IntegerConstant, StringConstant, KeywordConstant, VarTerm,
+                     ArrayTerm, SubroutineCall, UnaryTerm, ParenTerm)
+from JackTokenizer import (class_var_dec, VAR, ELSE, unary_op_list,
+                           keyword_constant_list, DOT, END_OF_LINE,
+                           OPEN_ROUND, OPEN_SQUARE, CLOSE_ROUND, COMMA,
+                           CLOSE_TALTAL, OPEN_TALTAL, EQUALS, CLASS,
+                           SUBROUTINE_KINDS, closing_dict, OP)
+
+
+def parse_file(input_file_path, source=None, stream=False,
+               max_errors=JackTokenizer.MAX_ERRORS):
+    """
+    :param input_file_path: jack file
+    :param source: jack code to parse instead of reading input_file_path
+    :param stream: split the source into tokens lazily (StreamTokenizer)
+    :param max_errors: syntax errors to report before giving up
+    :return: ClassNode of the class in the file
+    :raise JackSyntaxError: with the errors of the class
+    """
+    if stream:
+        tokenizer = JackTokenizer.StreamTokenizer(input_file_path, source)
+    else:
+        tokenizer = JackTokenizer.JackTokenizer(input_file_path, source)
+    return JackParser(tokenizer, max_errors).parse_class()
+
+
+class JackParser:
+    """
+    Parse stage of the compiler: reads a class from a JackTokenizer into a
+    tree of JackAST nodes, without generating any code. Each parse_xxx()
+    method reads the syntactic construct xxx, advances the tokenizer exactly
+    beyond it and returns its node, like the compile_xxx() methods of
+    CompilationEngine.
+    """
+
+    def __init__(self, tokenizer, max_errors=JackTokenizer.MAX_ERRORS):
+        """
+        :param tokenizer: JackTokenizer of the class to parse
+        :param max_errors: syntax errors to report before giving up - past
+        a bad statement the parse goes on to find more
+        """
+        self.tokenizer = tokenizer
+        self.max_errors = max_errors
+        # syntax errors found so far, as (line, column, message)
+        self.diagnostics = []
+        # names of the variables in scope: the class variables declared so
+        # far, and in a subroutine its parameters and locals too
+        self.class_variables = set()
+        self.variables = self.class_variables
+        self.statements_func_dict = {'let': self.parse_let,
+                                     'do': self.parse_do,
+                                     'while': self.parse_while,
+                                     'if': self.parse_if,
+                                     'return': self.parse_return}
+
+    def remove_token(self):
+        """
+        advance the token by 1 - every loop of the parser either advances
+        or stops, so the parse is linear in the input and always ends
+        :return: the token advanced over
+        :raise JackSyntaxError: at the end of the input
+        """
+        token = self.tokenizer.get_curr_token()
+        if not self.tokenizer.has_more_tokens():
+            raise self.tokenizer.error('unexpected end of input')
+        self.tokenizer.advance()
+        return token
+
+    def expect(self, symbol):
+        """
+        advance over the current token, which must be the given symbol
+        :raise JackSyntaxError: if it is another token
+        """
+        if self.tokenizer.get_curr_token() != symbol:
+            raise self.tokenizer.unexpected(repr(symbol))
+        self.remove_token()
+
+    def identifier(self, expected):
+        """
+        advance over the current token, which must be an identifier
+        :param expected: what the identifier names, for the error message
+        :return: the identifier
+        :raise JackSyntaxError: if it is another token
+        """
+        if self.tokenizer.token_type() is not \
+                JackTokenizer.TokenType.IDENTIFIER:
+            raise self.tokenizer.unexpected(expected)
+        return self.remove_token()
+
+    def variable(self):
+        """
+        advance over the current token, which must name a variable in scope
+        :return: the name and its (line, column) in the source
+        :raise JackSyntaxError: if it is not an identifier, or no variable
+        has that name
+        """
+        if self.tokenizer.token_type() is not \
+                JackTokenizer.TokenType.IDENTIFIER:
+            raise self.tokenizer.unexpected('variable name')
+        if self.tokenizer.get_curr_token() not in self.variables:
+            raise self.tokenizer.error('undefined variable %r' %
+                                       self.tokenizer.get_curr_token())
+        position = self.tokenizer.get_position()
+        return self.remove_token(), position
+
+    def parse_class(self):
+        """
+        :return: ClassNode
+        :raise JackSyntaxError: with the errors of the class, up to
+        max_errors of them
+        """
+        try:
+            class_node = self.parse_class_declaration()
+        except JackTokenizer.JackSyntaxError as error:
+            self.diagnostics.extend(error.diagnostics)
+        if self.diagnostics:
+            raise JackTokenizer.JackSyntaxError(
+                self.tokenizer.file_path, self.diagnostics[:self.max_errors])
+        return class_node
+
+    def parse_class_declaration(self):
+        """
+        :return: ClassNode, failing at the first error outside a statement
+        """
+        if not self.tokenizer.has_more_tokens():
+            raise self.tokenizer.unexpected(repr(CLASS))
+        self.tokenizer.advance()
+        self.expect(CLASS)
+        name = self.identifier('class name')
+        self.expect(OPEN_TALTAL)
+        class_vars = []
+        subroutines = []
+        while self.tokenizer.get_curr_token() != CLOSE_TALTAL:
+            if self.tokenizer.key_word() in class_var_dec:
+                class_vars.append(self.parse_var_dec())
+            elif self.tokenizer.get_curr_token() in SUBROUTINE_KINDS:
+                subroutines.append(self.parse_subroutine())
+            else:
+                raise self.tokenizer.unexpected(
+                    'class variable or subroutine declaration')
+        # } - the last token
+        if self.tokenizer.has_more_tokens():
+            self.tokenizer.advance()
+            raise self.tokenizer.unexpected('end of input after the class')
+        return ClassNode(name, tuple(class_vars), tuple(subroutines))
+
+    def parse_var_dec(self):
+        """
+        static / field / var declaration of one or more variables
+        :return: VarDec
+        """
+        kind = self.remove_token()
+        symbol_type = self.remove_token()
+        names = [self.identifier('variable name')]
+        while self.tokenizer.get_curr_token() == COMMA:
+            self.remove_token()
+            names.append(self.identifier('variable name'))
+        self.expect(END_OF_LINE)
+        self.variables.update(names)
+        return VarDec(kind, symbol_type, tuple(names))
+
+    def parse_subroutine(self):
+        """
+        :return: Subroutine
+        """
+        self.variables = set(self.class_variables)
+        kind = self.remove_token()
+        return_type = self.remove_token()
+        name = self.identifier('subroutine name')
+        self.expect(OPEN_ROUND)
+        params = self.parse_parameter_list()
+        self.expect(CLOSE_ROUND)
+        self.expect(OPEN_TALTAL)
+        var_decs = []
+        while self.tokenizer.key_word() == VAR:
+            var_decs.append(self.parse_var_dec())
+        statements = self.parse_statements()
+        self.expect(CLOSE_TALTAL)
+        self.variables = self.class_variables
+        return Subroutine(kind, return_type, name, params, tuple(var_decs),
+                          statements)
+
+    def parse_parameter_list(self):
+        """
+        :return: tuple of (type, name), not including the parenthesis
+        """
+        if self.tokenizer.get_curr_token() == CLOSE_ROUND:
+            return ()
+        params = [self.parse_parameter()]
+        while self.tokenizer.get_curr_token() == COMMA:
+            self.remove_token()
+            params.append(self.parse_parameter())
+        return tuple(params)
+
+    def parse_parameter(self):
+        """
+        :return: (type, name) of a parameter
+        """
+        symbol_type = self.remove_token()
+        name = self.identifier('parameter name')
+        self.variables.add(name)
+        return symbol_type, name
+
+    def parse_statements(self):
+        """
+        :return: tuple of statement nodes, not including the braces
+        """
+        statements = []
+        while self.tokenizer.get_curr_token() != CLOSE_TALTAL:
+            try:
+                statements.append(self.parse_statement())
+            except JackTokenizer.JackSyntaxError as error:
+                self.recover(error)
+        return tuple(statements)
+
+    def parse_statement(self):
+        """
+        :return: statement node of any kind
+        """
+        parse_function = self.statements_func_dict.get(
+            self.tokenizer.get_curr_token())
+        if parse_function is None:
+            raise self.tokenizer.unexpected('statement')
+        return parse_function()
+
+    def recover(self, error):
+        """
+        record the syntax error of a statement and skip the rest of the
+        statement, to go on with the next one
+        :param error: JackSyntaxError raised while parsing the statement
+        :raise JackSyntaxError: the error again, when it is the last one
+        to report or the input ends in the statement
+        """
+        if len(self.diagnostics) + 1 >= self.max_errors or \
+                not self.tokenizer.skip_statement():
+            raise error
+        self.diagnostics.extend(error.diagnostics)
+
+    def parse_block(self):
+        """
+        :return: tuple of statement nodes of a block including the braces
+        """
+        self.expect(OPEN_TALTAL)
+        statements = self.parse_statements()
+        self.expect(CLOSE_TALTAL)
+        return statements
+
+    def parse_let(self):
+        # let
+        self.remove_token()
+        name, position = self.variable()
+        index = None
+        if self.tokenizer.get_curr_token() == OPEN_SQUARE:
+            index = self.parse_enclosed_expression()
+        self.expect(EQUALS)
+        value = self.parse_expression()
+        self.expect(END_OF_LINE)
+        return LetStatement(name, index, value, position)
+
+    def parse_if(self):
+        # if
+        self.remove_token()
+        condition = self.parse_enclosed_expression()
+        statements = self.parse_block()
+        else_statements = None
+        if self.tokenizer.get_curr_token() == ELSE:
+            self.remove_token()
+            else_statements = self.parse_block()
+        return IfStatement(condition, statements, else_statements)
+
+    def parse_while(self):
+        # while
+        self.remove_token()
+        condition = self.parse_enclosed_expression()
+        return WhileStatement(condition, self.parse_block())
+
+    def parse_do(self):
+        # do
+        self.remove_token()
+        call = self.parse_subroutine_call()
+        self.expect(END_OF_LINE)
+        return DoStatement(call)
+
+    def parse_return(self):
+        # return
+        self.remove_token()
+        value = None
+        if self.tokenizer.get_curr_token() != END_OF_LINE:
+            value = self.parse_expression()
+        self.expect(END_OF_LINE)
+        return ReturnStatement(value)
+
+    def parse_enclosed_expression(self):
+        """
+        :return: Expression inside [ ] or ( )
+        """
+        # [ / (
+        closing = closing_dict.get(self.tokenizer.get_curr_token())
+        if closing is None:
+            raise self.tokenizer.unexpected(repr(OPEN_ROUND))
+        self.remove_token()
+        expression = self.parse_expression()
+        # ] / )
+        self.expect(closing)
+        return expression
+
+    def parse_expression(self):
+        """
+        :return: Expression
+        """
+        term = self.parse_term()
+        operations = []
+        while self.tokenizer.get_curr_token() in OP:
+            op = self.remove_token()
+            operations.append((op, self.parse_term()))
+        return Expression(term, tuple(operations))
+
+    def parse_term(self):
+        """
+        :return: term node - an identifier is told apart from an array entry
+        and a subroutine call by the token after it
+        """
+        token = self.tokenizer.get_curr_token()
+        if token == OPEN_ROUND:
+            return ParenTerm(self.parse_enclosed_expression())
+        if token in unary_op_list:
+            self.remove_token()
+            return UnaryTerm(token, self.parse_term())
+        token_type = self.tokenizer.token_type()
+        if token_type is JackTokenizer.TokenType.IDENTIFIER:
+            future_token = self.tokenizer.future_token()
+            if future_token in [DOT, OPEN_ROUND]:
+                return self.parse_subroutine_call()
+            name, position = self.variable()
+            if future_token == OPEN_SQUARE:
+                return ArrayTerm(name, self.parse_enclosed_expression(),
+                                 position)
+            return VarTerm(name, position)
+        if token_type is JackTokenizer.TokenType.INT_CONST:
+            self.remove_token()
+            return IntegerConstant(int(token))
+        if token in keyword_constant_list:
+            self.remove_token()
+            return KeywordConstant(token)
+        if token_type is not JackTokenizer.TokenType.STRING_CONST:
+            raise self.tokenizer.unexpected('term')
+        if len(token) < 2:
+            raise self.tokenizer.error('unterminated string constant')
+        self.remove_token()
+        return StringConstant(token)
+
+    def parse_subroutine_call(self):
+        """
+        :return: SubroutineCall
+        """
+        target = None
+        name = self.identifier('subroutine name')
+        if self.tokenizer.get_curr_token() == DOT:
+            self.remove_token()
+            target = name
+            name = self.identifier('subroutine name')
+        self.expect(OPEN_ROUND)
+        arguments = []
+        if self.tokenizer.get_curr_token() != CLOSE_ROUND:
+            arguments.append(self.parse_expression())
+            while self.tokenizer.get_curr_token() == COMMA:
+                self.remove_token()
+                arguments.append(self.parse_expression())
+        self.expect(CLOSE_ROUND)
+        return SubroutineCall(target, name, tuple(arguments))
@@ -1,10 +1,12 @@
+import io
 import re
+from array import array
+from collections import deque
 from enum import Enum
+from sys import intern
 
 EMPTY_STRING = ''
 
-SPACE = " "
-
 keyword_list = ['class', 'constructor', 'function', 'method', 'field',
                 'static',
                 'var', 'int', 'char', 'boolean', 'void', 'true', 'false',
@@ -15,47 +17,61 @@ symbol_list = ['{', '}', '(', ')', '[', ']', '.', ',', ';', '+', '-', '*', '/',
                '&', '|', '<', '>', '=', '~']
 symbol_dict = {'<': '&lt;', '>': '&gt;', '"': '&quot;', '&': '&amp;'}
 
-ARG = 'argument'
+_SYMBOL_CLASS = '[' + re.escape(EMPTY_STRING.join(symbol_list)) + ']'
+
+# one alternation for the whole lexer, the name of the group that matched
+# tells the kind of the token
+TOKEN_PATTERN = re.compile(
+    r'(?P<skip>\s+|//[^\n]*|/\*.*?(?:\*/|\Z))|'
+    r'(?P<string>"[^"\n]*"|")|'
+    r'(?P<symbol>' + _SYMBOL_CLASS + r')|'
+    r'(?P<word>[^\s"' + _SYMBOL_CLASS[1:-1] + r']+)', re.DOTALL)
+
+NEW_LINE = '\n'
+
+CHUNK_SIZE = 1 << 16  # characters a streaming tokenizer reads at a time
+
+MAX_ERRORS = 10  # syntax errors reported per file before it is given up
+
+# the tokens of the grammar, shared by CompilationEngine and JackParser
+class_var_dec = ['static', 'field']
+
 VAR = 'var'
 
-kind_to_segment_dict = {ARG: ARG, VAR: 'local', 'static': 'static',
-                        'field': 'this'}
+ELSE = 'else'
 
+unary_op_list = ['-', '~']
 
-class Node:
-    """
-    Node for linked list, to hold data per scope
-    """
-    def __init__(self, var_dict=None):
-        self.var_dict = var_dict
-        self.scope_counter = [0, 0, 0, 0]  # [static,field] / [argument, var]
-        self.scope_return_type = None
-        self.next_val = None
+keyword_constant_list = ['true', 'false', 'null', 'this']
 
+DOT = '.'
 
-class SLinkedList:
-    """
-    linked list to hold the variables per scope
-    """
-    def __init__(self):
-        self.head_val = None
+END_OF_LINE = ';'
 
-    def add_node(self):
-        if self.head_val is None:
-            self.head_val = Node({})
-        else:
-            new_scope = Node({})
-            new_scope.next_val = self.head_val
-            self.head_val = new_scope
+OPEN_ROUND = '('
+
+OPEN_SQUARE = '['
 
-    def del_node(self):
-        self.head_val = self.head_val.next_val
+CLOSE_ROUND = ')'
 
-    def update_scope_return_type(self, return_type):
-        self.head_val.scope_return_type = return_type
+COMMA = ','
 
-    def get_scope_return_type(self):
-        return self.head_val.scope_return_type
+CLOSE_TALTAL = '}'
+
+OPEN_TALTAL = '{'
+
+CLOSE_SQUARE = ']'
+
+EQUALS = '='
+
+CLASS = 'class'
+
+SUBROUTINE_KINDS = ('constructor', 'function', 'method')
+
+# closing bracket of every bracket an expression can be enclosed in
+closing_dict = {OPEN_SQUARE: CLOSE_SQUARE, OPEN_ROUND: CLOSE_ROUND}
+
+OP = ['+', '-', '*', '/', '&', '|', '<', '>', '=']
 
 
 class TokenType(Enum):
@@ -69,6 +85,157 @@ class TokenType(Enum):
     STRING_CONST = 5
 
 
+# token kinds are stored as the small int values of TokenType
+KEYWORD = TokenType.KEYWORD.value
+SYMBOL = TokenType.SYMBOL.value
+IDENTIFIER = TokenType.IDENTIFIER.value
+INT_CONST = TokenType.INT_CONST.value
+STRING_CONST = TokenType.STRING_CONST.value
+
+kind_to_token_type = [None] + list(TokenType)
+
+_keywords = frozenset(keyword_list)
+
+
+class JackSyntaxError(Exception):
+    """
+    syntax errors of a jack file, each at a line and column of the source
+    """
+
+    def __init__(self, file_path, diagnostics):
+        """
+        :param file_path: jack file, None for jack code given as text
+        :param diagnostics: list of (line, column, message)
+        """
+        Exception.__init__(self, file_path, diagnostics)
+        self.file_path = file_path
+        self.diagnostics = diagnostics
+
+    def __str__(self):
+        return NEW_LINE.join('%d:%d: %s' % diagnostic
+                             for diagnostic in self.diagnostics)
+
+
+def error_message(error):
+    """
+    :param error: exception raised while compiling a file
+    :return: the diagnostics of a JackSyntaxError, one per line, the type
+    and text of any other error
+    """
+    if isinstance(error, JackSyntaxError):
+        return str(error)
+    return '%s: %s' % (type(error).__name__, error)
+
+
+def lex(source):
+    """
+    split jack source code into tokens in a single pass, dropping
+    whitespace and comments
+    :param source: jack code string
+    :return: parallel arrays - interned tokens, token kinds, line and column
+    of every token
+    """
+    tokens = []
+    kinds = array('B')
+    lines = array('I')
+    columns = array('I')
+    line = 1
+    line_start = 0
+    for match in TOKEN_PATTERN.finditer(source):
+        group = match.lastgroup
+        start = match.start()
+        if group == 'skip':
+            newlines = source.count(NEW_LINE, start, match.end())
+            if newlines:
+                line += newlines
+                line_start = source.rindex(NEW_LINE, start, match.end()) + 1
+            continue
+        token = intern(match.group())
+        if group == 'word':
+            if token in _keywords:
+                kinds.append(KEYWORD)
+            elif token.isdigit():
+                kinds.append(INT_CONST)
+            else:
+                kinds.append(IDENTIFIER)
+        elif group == 'symbol':
+            kinds.append(SYMBOL)
+        else:
+            kinds.append(STRING_CONST)
+        tokens.append(token)
+        lines.append(line)
+        columns.append(start - line_start + 1)
+    return tokens, kinds, lines, columns
+
+
+def lex_stream(read, chunk_size=CHUNK_SIZE):
+    """
+    split jack source code into tokens lazily, reading it a chunk at a
+    time - only the unfinished tail of a chunk is kept between two reads
+    :param read: function that returns up to n more characters of the
+    code, '' at the end
+    :param chunk_size: characters to read at a time
+    :return: iterator of (interned token, kind, line, column)
+    """
+    buffer = EMPTY_STRING
+    position = 0
+    line = 1
+    line_start = 0
+    size = chunk_size
+    at_end = False
+    while not at_end:
+        chunk = read(size)
+        at_end = not chunk
+        buffer = buffer[position:] + chunk
+        line_start -= position
+        position = 0
+        length = len(buffer)
+        while position < length:
+            match = TOKEN_PATTERN.match(buffer, position)
+            group = match.lastgroup
+            end = match.end()
+            # a match that touches the end of the chunk may go on in the
+            # next one, and so may a string whose closing quote is not read
+            if not at_end and (end == length or (
+                    group == 'string' and end - position == 1 and
+                    buffer.find(NEW_LINE, end) < 0)):
+                break
+            if group == 'skip':
+                newlines = buffer.count(NEW_LINE, position, end)
+                if newlines:
+                    line += newlines
+                    line_start = buffer.rindex(NEW_LINE, position, end) + 1
+                position = end
+                continue
+            token = intern(match.group())
+            if group == 'word':
+                if token in _keywords:
+                    kind = KEYWORD
+                elif token.isdigit():
+                    kind = INT_CONST
+                else:
+                    kind = IDENTIFIER
+            elif group == 'symbol':
+                kind = SYMBOL
+            else:
+                kind = STRING_CONST
+            yield token, kind, line, position - line_start + 1
+            position = end
+        # a token or comment longer than a chunk is read in bigger chunks
+        size = size * 2 if position == 0 else chunk_size
+
+
+def lex_file(file_path, chunk_size=CHUNK_SIZE):
+    """
+    :param file_path: jack file
+    :param chunk_size: characters to read at a time
+    :return: iterator of (interned token, kind, line, column) of the file,
+    which is closed once the tokens run out or the iterator is dropped
+    """
+    with open(file_path, 'r') as f:
+        yield from lex_stream(f.read, chunk_size)
+
+
 class JackTokenizer:
     """
     Handles the parsing of a single .vm file, and encapsulates access to the
@@ -77,20 +244,22 @@ class JackTokenizer:
     comments.
     """
 
-    def __init__(self, file_path):
+    def __init__(self, file_path, source=None):
         """
         Constructor - Opens the input file/stream and gets ready to parse it.
         :param file_path: Input file / stream
+        :param source: jack code to split instead of reading file_path
         """
-        self.file = open(file_path, 'r')
-        self._jack_code = self.file.readlines()
-        self.file.close()
-        self._jack_code = self.clean_lines(self._jack_code)
+        self.file_path = file_path
+        if source is None:
+            with open(file_path, 'r') as f:
+                source = f.read()
+        self._jack_code, self._kinds, self._lines, self._columns = lex(
+            source)
         self._curr_index = 0
         self._length = len(self._jack_code)
         self._curr_token = None
-
-        self.symbol_table = SLinkedList()
+        self._curr_kind = None
 
     def has_more_tokens(self):
         """
@@ -106,31 +275,34 @@ class JackTokenizer:
         there is no current command.
         """
         self._curr_token = self._jack_code[self._curr_index]
+        self._curr_kind = self._kinds[self._curr_index]
         self._curr_index += 1
 
     def future_token(self):
         """
-        :return: current +1 token
+        :return: current +1 token, None past the end
         """
-        return self._jack_code[self._curr_index]
+        if self._curr_index < self._length:
+            return self._jack_code[self._curr_index]
+        return None
+
+    def peek(self, n=1):
+        """
+        :param n: how many tokens to look ahead, 0 is the current token
+        :return: the token n places after the current one, None past the end
+        """
+        index = self._curr_index - 1 + n
+        if 0 <= index < self._length:
+            return self._jack_code[index]
+        return None
 
     def token_type(self):
         """
-        Returns the type of the current VM command. C_ARITHMETIC is returned
-        for all the arithmetic commands :return: C_ARITHMETIC, C_PUSH,
-        C_POP, C_LABEL, C_GOTO, C_IF, C_FUNCTION, C_RETURN, C_CALL
-        """
-        if self._curr_token in symbol_list:
-            return TokenType.SYMBOL
-        elif self._curr_token in keyword_list:
-            return TokenType.KEYWORD
-        elif self._curr_token.startswith('"') and self._curr_token.endswith(
-                '"'):
-            return TokenType.STRING_CONST
-        elif self._curr_token.isdigit():
-            return TokenType.INT_CONST
-        else:
-            return TokenType.IDENTIFIER
+        Returns the type of the current token, which was classified once
+        when the input was split.
+        :return: TokenType
+        """
+        return kind_to_token_type[self._curr_kind]
 
     def key_word(self):
         """
@@ -139,50 +311,139 @@ class JackTokenizer:
         """
         return self._curr_token
 
-    @staticmethod
-    def clean_lines(file):
-        """
-        get an array of lines and clear the whitespaces and comments
-        :param file: vm lines array
-        :return: cleaned vm lines array
-        """
-        lines = []
-        for line in file:
-            if '//' in line:
-                if line.count('"', 0, line.find('//')) % 2 == 0:
-                    line = line[:line.find('//')]
-            lines.append(line)
-        one_string = EMPTY_STRING.join(lines)
-        one_string = re.sub('\n', EMPTY_STRING, one_string)
-        one_string = re.sub('/\*.*?\*/', EMPTY_STRING, one_string)
-        string_split = one_string.split('"')
-        tokens = []
-        for i in range(len(string_split)):
-            if i % 2 == 0:
-                for symbol in symbol_list:
-                    string_split[i] = string_split[i].replace(symbol,
-                                                              SPACE + symbol + SPACE)
-                string_split[i] = re.sub(r'\s+', SPACE, string_split[i])
-                tokens = tokens + string_split[i].split()
-            else:
-                tokens = tokens + ['"' + string_split[i] + '"']
-        return tokens
-
     def get_curr_token(self):
         return self._curr_token
 
-    def get_symbol_record(self, var_name):
-        """
-        get the record of variable
-        :param var_name: variable
-        :return: symbol_kind, symbol_type, symbol_counter
-        """
-        temp_scope = self.symbol_table.head_val
-        while temp_scope is not None:
-            if var_name in temp_scope.var_dict:
-                identifier_record = temp_scope.var_dict[var_name]
-                return kind_to_segment_dict[identifier_record[0]], \
-                       identifier_record[1], identifier_record[2]
-            temp_scope = temp_scope.next_val
-            if temp_scope is None:
-                return None
+    def get_position(self):
+        """
+        :return: line and column of the current token in the source
+        """
+        index = self._curr_index - 1
+        return self._lines[index], self._columns[index]
+
+    def error(self, message):
+        """
+        :param message: what is wrong at the current token
+        :return: JackSyntaxError at the line and column of the current token
+        """
+        line, column = 1, 1
+        if self._curr_token is not None:
+            line, column = self.get_position()
+        return JackSyntaxError(self.file_path, [(line, column, message)])
+
+    def unexpected(self, expected):
+        """
+        :param expected: what the current token should have been
+        :return: JackSyntaxError of the current token not being it
+        """
+        if self._curr_token is None:
+            return self.error('expected %s, found end of input' % expected)
+        return self.error('expected %s, found %r' % (expected,
+                                                     self._curr_token))
+
+    def skip_statement(self):
+        """
+        advance past the statement the current token is in, to go on after
+        a syntax error in it - past its ; or its last block, or up to the }
+        that closes the enclosing block
+        :return: False if the input ended first
+        """
+        depth = 0
+        while True:
+            token = self._curr_token
+            if token == CLOSE_TALTAL and depth == 0:
+                return True
+            if not self.has_more_tokens():
+                return False
+            self.advance()
+            if token == OPEN_TALTAL:
+                depth += 1
+            elif token == CLOSE_TALTAL:
+                depth -= 1
+                if depth == 0 and self._curr_token != ELSE:
+                    return True
+            elif token == END_OF_LINE and depth == 0:
+                return True
+
+
+class StreamTokenizer(JackTokenizer):
+    """
+    JackTokenizer that reads the input a chunk at a time and splits it
+    lazily. Only the tokens that can still be looked at are kept - the
+    current one and the lookahead window of future_token() / peek() - so
+    memory stays flat however big the class is.
+    """
+
+    def __init__(self, file_path, source=None, chunk_size=CHUNK_SIZE):
+        """
+        :param file_path: Input file / stream
+        :param source: jack code to split instead of reading file_path
+        :param chunk_size: characters to read at a time
+        """
+        self.file_path = file_path
+        if source is None:
+            self._tokens = lex_file(file_path, chunk_size)
+        else:
+            self._tokens = lex_stream(io.StringIO(source).read, chunk_size)
+        self._window = deque()
+        self._curr_entry = (None, None, 0, 0)
+        self._curr_token = None
+        self._curr_kind = None
+
+    def _fill(self, n):
+        """
+        read tokens into the lookahead window until it holds n of them
+        :param n: size of the window needed
+        :return: True if there are n tokens after the current one
+        """
+        window = self._window
+        while len(window) < n:
+            entry = next(self._tokens, None)
+            if entry is None:
+                return False
+            window.append(entry)
+        return True
+
+    def has_more_tokens(self):
+        """
+        Are there more commands in the input?
+        :return: boolean
+        """
+        return bool(self._window) or self._fill(1)
+
+    def advance(self):
+        """
+        Reads the next command from the input and makes it the current
+        command. Should be called only if hasMoreCommands is true.
+        """
+        if not self._window:
+            self._fill(1)
+        entry = self._window.popleft()
+        self._curr_entry = entry
+        self._curr_token = entry[0]
+        self._curr_kind = entry[1]
+
+    def future_token(self):
+        """
+        :return: current +1 token, None past the end
+        """
+        if not self._window and not self._fill(1):
+            return None
+        return self._window[0][0]
+
+    def peek(self, n=1):
+        """
+        :param n: how many tokens to look ahead, 0 is the current token
+        :return: the token n places after the current one, None past the end
+        """
+        if n == 0:
+            return self._curr_token
+        if n < 0 or not self._fill(n):
+            return None
+        return self._window[n - 1][0]
+
+    def get_position(self):
+        """
+        :return: line and column of the current token in the source
+        """
+        return self._curr_entry[2], self._curr_entry[3]
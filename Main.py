@@ -1,19 +1,67 @@
+import argparse
+import glob
 import os
+import re
 import sys
+import time
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
 
+import AsmWriter
+import BuildCache
+import CodeGenerator
 import CompilationEngine
-
-FILE_LOCATION = 1
+import JackParser
+import JackTokenizer
+import Profiler
+import WholeProgram
 
 VM = ".vm"
 
 JACK = ".jack"
 
+SERIAL = 1
+
+STDIN = '-'  # path that compiles stdin to stdout
+
+ENCODING = 'utf-8'
+
+POLL_INTERVAL = 0.25  # seconds between two scans of a watched dir
+
+DEBOUNCE = 0.1  # seconds a change must be quiet before it is compiled
+
+GLOB_CHARS = '*?['
+
+# a diagnostic at a line and column of the file
+POSITION_PATTERN = re.compile(r'\d+:\d+: ')
+
+NEW_LINE = '\n'
 
-def translate_files(file_path):
+
+def translate_files(file_path, jobs=SERIAL, cache=None, options=None,
+                    stats=None, profiler=None, out_dir=None):
     """
     handle dir & path
     :param file_path: path of file or dir
+    :param jobs: number of worker processes, 0 for one per core
+    :param cache: BuildCache of the dir, None to always compile
+    :param options: CompileOptions, None for the defaults
+    :param stats: Counter to add the optimization counters to
+    :param profiler: Profiler to measure the build with - the files are
+    then compiled serially, in this process
+    :param out_dir: dir to save the vm files to, None for the dir of the
+    jack files
+    :return: list of (file path, error message) for files that failed
+    """
+    files_list, dir_path = list_files(file_path)
+    return handle_files(files_list, dir_path, jobs, cache, options, stats,
+                        profiler, out_dir)
+
+
+def list_files(file_path):
+    """
+    :param file_path: path of file or dir
+    :return: list of the jack files to compile, the dir they are in
     """
     files_list = []
     if os.path.isdir(file_path):
@@ -26,25 +74,862 @@ def translate_files(file_path):
         if file_extension == JACK:
             file_path, file = os.path.split(file_path)
             files_list.append(file)
-    handle_files(files_list, file_path)
+    return files_list, file_path
 
 
-def handle_files(files_list, dir_path):
+def collect_sources(paths, out_dir=None):
+    """
+    find the jack files of many paths, grouped by dir
+    :param paths: jack files, dirs - searched recursively - and glob
+    patterns of them
+    :param out_dir: dir to mirror the tree of every path into, None to save
+    the vm files next to the jack files
+    :return: sorted list of (dir path, sorted jack file names, dir to save
+    the vm files to, True if the names are all the jack files of the dir),
+    list of (path, error message) for paths that do not exist
+    """
+    groups = {}
+    errors = []
+    for pattern in paths:
+        matches = [pattern]
+        if any(char in pattern for char in GLOB_CHARS):
+            matches = sorted(glob.glob(pattern, recursive=True))
+        if not any(os.path.exists(path) for path in matches):
+            errors.append((pattern, 'no such file or dir'))
+            continue
+        for path in matches:
+            if os.path.isdir(path):
+                for dir_path, files_list in scan_dir(path):
+                    vm_dir = dir_path
+                    if out_dir is not None:
+                        vm_dir = os.path.normpath(os.path.join(
+                            out_dir, os.path.relpath(dir_path, path)))
+                    group = groups.setdefault(dir_path, [set(), vm_dir, True])
+                    group[0].update(files_list)
+                    group[2] = True
+            elif path.endswith(JACK) and os.path.isfile(path):
+                dir_path, file_name = os.path.split(path)
+                vm_dir = dir_path if out_dir is None else out_dir
+                group = groups.setdefault(dir_path, [set(), vm_dir, False])
+                group[0].add(file_name)
+    return [(dir_path, sorted(files), vm_dir, complete)
+            for dir_path, (files, vm_dir, complete) in
+            sorted(groups.items())], errors
+
+
+def scan_dir(root):
+    """
+    walk a dir tree with os.scandir, skipping hidden dirs (.jackcache) and
+    not following links to dirs
+    :param root: dir to walk
+    :return: iterator of (dir path, sorted names of its jack files), for
+    every dir that has any
+    """
+    pending = [root]
+    while pending:
+        dir_path = pending.pop()
+        files_list = []
+        subdirs = []
+        try:
+            with os.scandir(dir_path) as entries:
+                for entry in entries:
+                    if entry.is_dir(follow_symlinks=False):
+                        if not entry.name.startswith('.'):
+                            subdirs.append(entry.path)
+                    elif entry.name.endswith(JACK) and entry.is_file():
+                        files_list.append(entry.name)
+        except OSError:
+            continue
+        pending.extend(sorted(subdirs, reverse=True))
+        if files_list:
+            yield dir_path, sorted(files_list)
+
+
+def handle_files(files_list, dir_path, jobs=SERIAL, cache=None,
+                 options=None, stats=None, profiler=None, out_dir=None):
     """
     Main func go over the lines of the files
     :param files_list: list of files in the dir
     :param dir_path : path to save to
+    :param jobs: number of worker processes, 0 for one per core
+    :param cache: BuildCache of the dir, None to always compile
+    :param options: CompileOptions, None for the defaults
+    :param stats: Counter to add the optimization counters to
+    :param profiler: Profiler to measure the build with, or None
+    :param out_dir: dir to save the vm files to, None for dir_path
+    :return: list of (file path, error message) for files that failed
+    """
+    caches = None if cache is None else {dir_path: cache}
+    vm_dir = dir_path if out_dir is None else out_dir
+    return handle_groups([(dir_path, files_list, vm_dir, True)], jobs,
+                         caches, options, stats, profiler)
+
+
+def handle_groups(groups, jobs=SERIAL, caches=None, options=None, stats=None,
+                  profiler=None):
+    """
+    compile the jack files of many dirs in one go, skipping the files the
+    build cache of their dir is up to date with
+    :param groups: list of (dir path, jack file names, dir to save the vm
+    files to, complete) as collect_sources() returns
+    :param jobs: number of worker processes, 0 for one per core
+    :param caches: dict of dir path -> BuildCache, None to always compile
+    :param options: CompileOptions, None for the defaults
+    :param stats: Counter to add the optimization counters to
+    :param profiler: Profiler to measure the build with, or None
+    :return: list of (file path, error message) for files that failed
+    """
+    if options is None:
+        options = CompilationEngine.CompileOptions()
+    units = []
+    keys = {}
+    for dir_path, files_list, vm_dir, complete in groups:
+        if vm_dir:
+            os.makedirs(vm_dir, exist_ok=True)
+        cache = None if caches is None else caches.get(dir_path)
+        for file_name in files_list:
+            unit = (file_name, dir_path, vm_dir)
+            if cache is None or not cached(unit, cache, keys, options):
+                units.append(unit)
+    errors = compile_files(units, jobs, options, stats, profiler)
+    if caches is not None:
+        failed = set(file_path for file_path, error in errors)
+        for file_name, dir_path, vm_dir in units:
+            if dir_path in caches and \
+                    os.path.join(dir_path, file_name) not in failed:
+                caches[dir_path].store(keys[file_name, dir_path],
+                                       vm_path(file_name, vm_dir))
+        for dir_path, files_list, vm_dir, complete in groups:
+            if dir_path in caches:
+                caches[dir_path].save()
+    return errors
+
+
+def cached(unit, cache, keys, options):
+    """
+    :param unit: (jack file name, dir of the file, dir of its vm file)
+    :param cache: BuildCache of the dir
+    :param keys: dict to record the cache key of the file in
+    :param options: CompileOptions the file is compiled with
+    :return: True if the vm file is up to date and needs no compilation
+    """
+    file_name, dir_path, vm_dir = unit
+    with open(os.path.join(dir_path, file_name), 'rb') as f:
+        key = cache.source_key(f.read(), options.key())
+    keys[file_name, dir_path] = key
+    return cache.fetch(key, vm_path(file_name, vm_dir))
+
+
+def vm_path(file_name, dir_path):
+    """
+    :param file_name: jack file name
+    :param dir_path: dir of the vm file
+    :return: path of the vm file of the jack file
+    """
+    return os.path.join(dir_path, os.path.splitext(file_name)[0] + VM)
+
+
+def compile_files(units, jobs=SERIAL, options=None, stats=None,
+                  profiler=None):
+    """
+    compile the given files serially or on a single process pool
+    :param units: list of (jack file name, dir of the file, dir to save its
+    vm file to)
+    :param jobs: number of worker processes, 0 for one per core
+    :param options: CompileOptions, None for the defaults
+    :param stats: Counter to add the optimization counters to
+    :param profiler: Profiler to measure the build with, or None
+    :return: list of (file path, error message) for files that failed
+    """
+    if jobs == 0:
+        jobs = os.cpu_count() or SERIAL
+    jobs = min(jobs, len(units))
+    if jobs <= SERIAL or profiler is not None:
+        results = [compile_file(file_name, dir_path, options, profiler,
+                                vm_dir)
+                   for file_name, dir_path, vm_dir in units]
+    else:
+        files_list, dir_paths, vm_dirs = zip(*units)
+        with ProcessPoolExecutor(max_workers=jobs) as pool:
+            results = list(pool.map(compile_file, files_list, dir_paths,
+                                    [options] * len(units),
+                                    [None] * len(units), vm_dirs,
+                                    chunksize=max(1, len(units) // jobs // 4)))
+    errors = []
+    for (file_name, dir_path, vm_dir), (error, file_stats) in \
+            zip(units, results):
+        if error is not None:
+            errors.append((os.path.join(dir_path, file_name), error))
+        if stats is not None:
+            stats.update(file_stats)
+    return errors
+
+
+def compile_file(file_name, dir_path, options=None, profiler=None,
+                 vm_dir=None):
+    """
+    compile a single jack file into a vm file. module level so it can be
+    shipped to a worker process.
+    :param file_name: jack file name
+    :param dir_path: dir of the file
+    :param options: CompileOptions, None for the defaults
+    :param profiler: Profiler to measure the compilation with, or None
+    :param vm_dir: dir to save the vm file to, None for dir_path
+    :return: error message or None on success, optimization counters
+    """
+    stats = Counter()
+    if vm_dir is None:
+        vm_dir = dir_path
+    try:
+        with open(vm_path(file_name, vm_dir), 'w') as f:
+            if profiler is not None:
+                stats = profiler.compile_file(
+                    os.path.join(dir_path, file_name), f, options)
+                return None, stats
+            if options is not None and options.ast:
+                stats = CodeGenerator.compile_file(
+                    os.path.join(dir_path, file_name), f, options).stats
+                return None, stats
+            compilation_eng = CompilationEngine.CompilationEngine(
+                os.path.join(dir_path, file_name), f, options)
+            stats = compilation_eng.stats
+            compilation_eng.compile_class()
+            compilation_eng.write_class_to_file()
+    except Exception as error:
+        return JackTokenizer.error_message(error), stats
+    return None, stats
+
+
+def compile_source(source, options=None):
+    """
+    compile a jack class in memory, without touching the file system
+    :param source: jack code, str or bytes
+    :param options: CompileOptions, None for the defaults
+    :return: vm code of the class
+    """
+    chunks = []
+    compile_to(source, chunks.append, options)
+    return ''.join(chunks)
+
+
+def compile_source_lines(source, options=None):
+    """
+    compile a jack class in memory lazily: the class is read through a
+    StreamTokenizer and compiled a subroutine at a time, as its lines are
+    read, so neither its tokens nor its whole vm code are ever held at once
+    (with options.ast the tree of the class is parsed first)
+    :param source: jack code, str or bytes
+    :param options: CompileOptions, None for the defaults
+    :return: iterator over the vm code lines of the class
+    :raise JackSyntaxError: when the lines written before the errors are
+    read - unlike compile_source, a class with errors may yield some lines
+    first
+    """
+    if isinstance(source, bytes):
+        source = source.decode(ENCODING)
+    # vm text chunks the writer handed over, not split into lines yet
+    chunks = []
+    pending = ''
+    error = None
+    try:
+        if options is not None and options.ast:
+            class_node = JackParser.parse_file(None, source, True,
+                                               options.max_errors)
+            generator = CodeGenerator.CodeGenerator(chunks.append, options)
+            steps = generator.generate_steps(class_node)
+        else:
+            tokenizer = JackTokenizer.StreamTokenizer(None, source)
+            generator = CompilationEngine.CompilationEngine(
+                None, chunks.append, options, tokenizer=tokenizer)
+            steps = generator.compile_class_steps()
+        for _ in steps:
+            pending = yield from pending_lines(chunks, pending)
+        generator.writer.flush()
+    except Exception as compile_error:
+        error = compile_error
+    pending = yield from pending_lines(chunks, pending)
+    if pending:
+        yield pending
+    if error is not None:
+        raise error
+
+
+def pending_lines(chunks, pending):
+    """
+    yield the complete lines of the vm text chunks, and empty the chunks
+    :param chunks: list of vm text chunks
+    :param pending: start of a line the previous chunks ended with
+    :return: start of a line the chunks end with
+    """
+    if not chunks:
+        return pending
+    lines = (pending + ''.join(chunks)).split(NEW_LINE)
+    chunks.clear()
+    pending = lines.pop()
+    yield from lines
+    return pending
+
+
+def compile_to(source, output, options=None):
+    """
+    :param source: jack code, str or bytes
+    :param output: file / stream to write the vm code to, or a callable
+    :param options: CompileOptions, None for the defaults
+    :return: optimization counters
+    """
+    if isinstance(source, bytes):
+        source = source.decode(ENCODING)
+    if options is not None and options.ast:
+        return CodeGenerator.compile_file(None, output, options,
+                                          source=source).stats
+    compilation_eng = CompilationEngine.CompilationEngine(
+        None, output, options, source=source)
+    compilation_eng.compile_class()
+    compilation_eng.write_class_to_file()
+    return compilation_eng.stats
+
+
+def translate_stdin(args, stats=None):
+    """
+    compile the class on stdin and write its vm code to stdout - only when
+    it compiles, so a pipeline never gets half a class
+    :param args: parsed arguments namespace
+    :param stats: Counter to add the optimization counters to
+    :return: list of (name, error message) if it failed
     """
+    source = sys.stdin.read()
+    try:
+        if args.parse_only:
+            JackParser.parse_file(None, source, args.stream, args.max_errors)
+            return []
+        chunks = []
+        file_stats = compile_to(source, chunks.append, compile_options(args))
+    except Exception as error:
+        return [('<stdin>', JackTokenizer.error_message(error))]
+    if stats is not None:
+        stats.update(file_stats)
+    sys.stdout.write(''.join(chunks))
+    sys.stdout.flush()
+    return []
+
+
+def parse_files(files_list, dir_path, stream=False,
+                max_errors=JackTokenizer.MAX_ERRORS):
+    """
+    parse the given files into syntax trees, without generating any code
+    :param files_list: list of files in the dir
+    :param dir_path: dir of the files
+    :param stream: split the files into tokens lazily
+    :param max_errors: syntax errors to report per file
+    :return: list of (file path, error message) for files that failed
+    """
+    errors = []
     for file_name in files_list:
-        file_explicit_name, file_extension = os.path.splitext(file_name)
-        f = open(os.path.join(dir_path, file_explicit_name + VM), 'w')
-        compilation_eng = CompilationEngine.CompilationEngine(
-            os.path.join(dir_path, file_name), f)
-        compilation_eng.compile_class()
-        compilation_eng.write_class_to_file()
-        f.close()
+        file_path = os.path.join(dir_path, file_name)
+        try:
+            JackParser.parse_file(file_path, None, stream, max_errors)
+        except Exception as error:
+            errors.append((file_path, JackTokenizer.error_message(error)))
+    return errors
+
+
+def parse_args(argv):
+    """
+    :param argv: command line arguments without the program name
+    :return: parsed arguments namespace
+    """
+    parser = argparse.ArgumentParser(
+        prog='JackCompiler',
+        description='Compile .jack files into .vm files')
+    parser.add_argument('paths', nargs='+', metavar='path',
+                        help='.jack file, dir of .jack files (searched '
+                             'recursively) or glob pattern of them, - to '
+                             'compile stdin to stdout')
+    parser.add_argument('--out-dir', metavar='DIR',
+                        help='save the .vm files into DIR, mirroring the '
+                             'tree of every dir path, instead of next to '
+                             'the .jack files')
+    parser.add_argument('-j', '--jobs', type=int, default=SERIAL,
+                        help='compile files on N worker processes '
+                             '(0 - one per core)')
+    parser.add_argument('-O', '--optimize', action='store_true',
+                        help='turn on all the optimizations below')
+    parser.add_argument('--peephole', action='store_true',
+                        help='run the peephole pass over the generated VM')
+    parser.add_argument('--fold-constants', action='store_true',
+                        help='evaluate constant expressions at compile time')
+    parser.add_argument('--strength-reduce', action='store_true',
+                        help='replace multiply / divide calls by a constant '
+                             'with cheaper add sequences')
+    parser.add_argument('--branch-layout', action='store_true',
+                        help='lay ifs out with the negated condition and '
+                             'whiles with the condition after the body')
+    parser.add_argument('--array-access', action='store_true',
+                        help='address constant array indexes directly, '
+                             'reuse pointer 1 for the same array and skip '
+                             'the temp shuffle of safe array stores')
+    parser.add_argument('--pool-strings', action='store_true',
+                        help='build every distinct string constant of a '
+                             'class once and reuse it (not part of -O: the '
+                             'constants must not be changed or disposed)')
+    parser.add_argument('--whole-program', action='store_true',
+                        help='compile a dir as one program and leave out the '
+                             'subroutines Main.main can never reach '
+                             '(bypasses the build cache)')
+    parser.add_argument('--no-inline', action='store_true',
+                        help='do not inline the calls of trivial subroutines '
+                             'in --whole-program builds')
+    parser.add_argument('--ast', action='store_true',
+                        help='parse every class into a syntax tree first and '
+                             'generate the code from the tree')
+    parser.add_argument('--bundle', metavar='NAME',
+                        help='write all the classes of every dir into a '
+                             'single vm file NAME, with an index header, '
+                             'instead of a vm file per class')
+    parser.add_argument('--max-errors', type=int,
+                        default=JackTokenizer.MAX_ERRORS, metavar='N',
+                        help='syntax errors to report per file before it is '
+                             'given up (default %(default)s)')
+    parser.add_argument('--target', choices=(CompilationEngine.VM_TARGET,
+                                             AsmWriter.TARGET),
+                        default=CompilationEngine.VM_TARGET,
+                        help='vm: a .vm file per class, asm: a single Hack '
+                             'assembly program <dir name>.asm per dir, '
+                             'translated from the vm commands directly')
+    parser.add_argument('--stream', action='store_true',
+                        help='read every file a chunk at a time and split it '
+                             'into tokens lazily, so memory stays flat for '
+                             'huge classes')
+    parser.add_argument('--parse-only', action='store_true',
+                        help='only parse the files and report the ones that '
+                             'fail, writing nothing')
+    parser.add_argument('--stats', action='store_true',
+                        help='print how often every optimization applied')
+    parser.add_argument('--profile', metavar='REPORT',
+                        help='compile serially without the build cache and '
+                             'write per file / phase timings and hot path '
+                             'counters as json to REPORT')
+    parser.add_argument('--watch', action='store_true',
+                        help='after the build keep polling the sources and '
+                             'recompile only the files that change')
+    parser.add_argument('--no-cache', action='store_true',
+                        help='compile every file, bypassing the build cache')
+    parser.add_argument('--clear-cache', action='store_true',
+                        help='drop the build cache before compiling')
+    parser.add_argument('--cache-stats', action='store_true',
+                        help='print build cache hits and misses')
+    args = parser.parse_args(argv)
+    if args.target == AsmWriter.TARGET and (
+            args.whole_program or args.bundle or STDIN in args.paths):
+        parser.error('--target asm builds a program per dir, it does not '
+                     'go with --whole-program, --bundle or -')
+    if args.profile and (args.ast or args.stream or args.parse_only or
+                         args.whole_program or args.bundle or
+                         args.target == AsmWriter.TARGET or
+                         STDIN in args.paths):
+        parser.error('--profile measures the single pass compiler of plain '
+                     'builds, it does not go with --ast, --stream, '
+                     '--parse-only, --whole-program, --bundle, --target asm '
+                     'or -')
+    return args
+
+
+def compile_options(args):
+    """
+    :param args: parsed arguments namespace
+    :return: CompileOptions the arguments ask for
+    """
+    return CompilationEngine.CompileOptions(
+        peephole=args.optimize or args.peephole,
+        fold_constants=args.optimize or args.fold_constants,
+        strength_reduce=args.optimize or args.strength_reduce,
+        branch_layout=args.optimize or args.branch_layout,
+        pool_strings=args.pool_strings,
+        array_access=args.optimize or args.array_access,
+        ast=args.ast,
+        stream=args.stream,
+        max_errors=args.max_errors,
+        target=args.target)
+
+
+def build(args, caches=None):
+    """
+    run the build the command line asks for
+    :param args: parsed arguments namespace
+    :param caches: dict of dir path -> BuildCache to reuse - the caches of
+    new dirs are added to it - None to open them
+    :return: list of (file path, error message) for files that failed,
+    list of report lines to print
+    """
+    optimization_stats = Counter()
+    report = []
+    if args.paths == [STDIN]:
+        errors = translate_stdin(args, optimization_stats)
+        if args.stats:
+            for name, count in sorted(optimization_stats.items()):
+                report.append('%s: %d' % (name, count))
+        return errors, report
+    start = time.perf_counter()
+    groups, errors = collect_sources(args.paths, args.out_dir)
+    if caches is None:
+        caches = {}
+    for dir_path, files_list, vm_dir, complete in groups:
+        if dir_path not in caches:
+            caches[dir_path] = BuildCache.BuildCache(
+                os.path.join(dir_path, BuildCache.CACHE_DIR))
+        caches[dir_path].reset_stats()
+        if args.clear_cache:
+            caches[dir_path].clear()
+    options = compile_options(args)
+    if args.parse_only:
+        for dir_path, files_list, vm_dir, complete in groups:
+            errors += parse_files(files_list, dir_path, args.stream,
+                                  args.max_errors)
+    elif args.target == AsmWriter.TARGET:
+        errors += assemble_groups(groups, args.jobs, options,
+                                  optimization_stats)
+    elif args.whole_program:
+        program_groups = [group for group in groups if group[3]]
+        for dir_path, files_list, vm_dir, complete in program_groups:
+            if vm_dir:
+                os.makedirs(vm_dir, exist_ok=True)
+            program_errors, removed = WholeProgram.translate_program(
+                files_list, dir_path, args.jobs, options, optimization_stats,
+                not args.no_inline, out_dir=vm_dir,
+                bundle_path=bundle_path(vm_dir, args.bundle))
+            errors += program_errors
+            for name in removed:
+                report.append('removed unreachable %s' % name)
+        # files picked one by one are not a whole program
+        other_groups = [group for group in groups if not group[3]]
+        if args.bundle:
+            errors += bundle_groups(other_groups, args.bundle, args.jobs,
+                                    options, optimization_stats)
+        else:
+            errors += handle_groups(other_groups, args.jobs, None, options,
+                                    optimization_stats)
+    elif args.bundle:
+        errors += bundle_groups(groups, args.bundle, args.jobs, options,
+                                optimization_stats)
+    else:
+        build_profiler = None
+        if args.profile:
+            build_profiler = Profiler.Profiler()
+        errors += handle_groups(groups, args.jobs,
+                                None if args.no_cache or args.profile
+                                else caches,
+                                options, optimization_stats, build_profiler)
+        if build_profiler is not None:
+            build_profiler.write(args.profile)
+    if args.stats:
+        for name, count in sorted(optimization_stats.items()):
+            report.append('%s: %d' % (name, count))
+    if args.cache_stats:
+        report.append(BuildCache.summary(
+            [caches[group[0]] for group in groups]))
+    report.append(summary(groups, errors, args,
+                          time.perf_counter() - start))
+    return errors, report
+
+
+def assemble_groups(groups, jobs=SERIAL, options=None, stats=None):
+    """
+    compile the jack files of every group into a single Hack assembly
+    program in the vm dir of the group - the bootstrap and the trampolines,
+    then every class. the .vm files of a dir that have no .jack source,
+    e.g. of the OS, are translated into the program too. the program is
+    written only when every file compiles.
+    :param groups: list of (dir path, jack file names, dir to save the vm
+    files to, complete) as collect_sources() returns
+    :param jobs: number of worker processes, 0 for one per core
+    :param options: CompileOptions with target 'asm'
+    :param stats: Counter to add the optimization counters to
+    :return: list of (file path, error message) for files that failed
+    """
+    errors = []
+    for dir_path, files_list, vm_dir, complete in groups:
+        paths = [os.path.join(dir_path, file_name) for file_name in files_list]
+        workers = min(jobs or os.cpu_count() or SERIAL, len(paths))
+        if workers <= SERIAL:
+            results = [compile_text(path, options) for path in paths]
+        else:
+            with ProcessPoolExecutor(max_workers=workers) as pool:
+                results = list(pool.map(compile_text, paths,
+                                        [options] * len(paths)))
+        chunks = [NEW_LINE.join(AsmWriter.bootstrap())]
+        group_errors = []
+        for path, (error, file_stats, text) in zip(paths, results):
+            if error is not None:
+                group_errors.append((path, error))
+            if stats is not None:
+                stats.update(file_stats)
+            chunks.append(text)
+        if complete:
+            sources = set(os.path.splitext(file_name)[0]
+                          for file_name in files_list)
+            for file_name in sorted(os.listdir(dir_path or os.curdir)):
+                class_name, extension = os.path.splitext(file_name)
+                if extension == VM and class_name not in sources:
+                    with open(os.path.join(dir_path, file_name)) as f:
+                        commands = AsmWriter.parse_vm(f.read())
+                    chunks.append(NEW_LINE.join(
+                        AsmWriter.AsmTranslator().translate_all(commands)))
+        errors += group_errors
+        if group_errors:
+            continue
+        if vm_dir:
+            os.makedirs(vm_dir, exist_ok=True)
+        with open(asm_path(dir_path, vm_dir), 'w') as f:
+            f.write(NEW_LINE.join(chunk for chunk in chunks if chunk))
+    return errors
+
+
+def asm_path(dir_path, vm_dir):
+    """
+    :param dir_path: dir of the jack files of a program
+    :param vm_dir: dir its output is saved to
+    :return: path of the asm program of the dir - named after the dir
+    """
+    return os.path.join(vm_dir, os.path.basename(
+        os.path.abspath(dir_path)) + AsmWriter.ASM)
+
+
+def compile_text(input_file_path, options=None):
+    """
+    compile a single jack file in memory. module level so it can be
+    shipped to a worker process.
+    :param input_file_path: jack file
+    :param options: CompileOptions, None for the defaults
+    :return: error message or None on success, optimization counters, the
+    compiled code
+    """
+    chunks = []
+    stats = Counter()
+    try:
+        if options is not None and options.ast:
+            stats = CodeGenerator.compile_file(input_file_path, chunks.append,
+                                               options).stats
+        else:
+            compilation_eng = CompilationEngine.CompilationEngine(
+                input_file_path, chunks.append, options)
+            stats = compilation_eng.stats
+            compilation_eng.compile_class()
+            compilation_eng.write_class_to_file()
+    except Exception as error:
+        return JackTokenizer.error_message(error), stats, ''
+    return None, stats, ''.join(chunks)
+
+
+def bundle_path(vm_dir, bundle_name):
+    """
+    :param vm_dir: dir the vm output of a group is saved to
+    :param bundle_name: file name of the bundles, or None
+    :return: path of the bundle of the group, None to write vm files
+    """
+    if not bundle_name:
+        return None
+    return os.path.join(vm_dir, bundle_name)
+
+
+def bundle_groups(groups, bundle_name, jobs=SERIAL, options=None,
+                  stats=None):
+    """
+    compile the jack files of every group into a single bundle file in the
+    vm dir of the group, bypassing the build cache
+    :param groups: list of (dir path, jack file names, dir to save the vm
+    files to, complete) as collect_sources() returns
+    :param bundle_name: file name of the bundles
+    :param jobs: number of worker processes, 0 for one per core
+    :param options: CompileOptions, None for the defaults
+    :param stats: Counter to add the optimization counters to
+    :return: list of (file path, error message) for files that failed
+    """
+    errors = []
+    for dir_path, files_list, vm_dir, complete in groups:
+        if vm_dir:
+            os.makedirs(vm_dir, exist_ok=True)
+        errors += WholeProgram.translate_bundle(
+            files_list, dir_path, bundle_path(vm_dir, bundle_name), jobs,
+            options, stats)
+    return errors
+
+
+def output_paths(group, args):
+    """
+    :param group: (dir path, jack file names, dir to save the vm files to,
+    complete) as collect_sources() returns
+    :param args: parsed arguments namespace
+    :return: paths of the files the build of the group writes
+    """
+    dir_path, files_list, vm_dir, complete = group
+    if args.parse_only:
+        return []
+    if args.target == AsmWriter.TARGET:
+        return [asm_path(dir_path, vm_dir)]
+    if args.bundle:
+        return [bundle_path(vm_dir, args.bundle)]
+    return [vm_path(file_name, vm_dir) for file_name in files_list]
+
+
+def summary(groups, errors, args, seconds):
+    """
+    :param groups: the groups of jack files that were built
+    :param errors: list of (file path, error message) for files that failed
+    :param args: parsed arguments namespace
+    :param seconds: how long the build took
+    :return: one line summary of the build
+    """
+    files = 0
+    jack_bytes = 0
+    output_bytes = 0
+    for group in groups:
+        dir_path, files_list, vm_dir, complete = group
+        files += len(files_list)
+        for file_name in files_list:
+            jack_bytes += os.path.getsize(os.path.join(dir_path, file_name))
+        for output in output_paths(group, args):
+            if os.path.isfile(output):
+                output_bytes += os.path.getsize(output)
+    return '%d files in %d dirs, %d bytes of jack -> %d bytes of %s, ' \
+           '%d failed, %.2f s' % (files, len(groups), jack_bytes,
+                                  output_bytes, args.target, len(errors),
+                                  seconds)
+
+
+def snapshot(paths, out_dir=None):
+    """
+    :param paths: jack files, dirs and glob patterns
+    :param out_dir: dir the vm files are mirrored into, or None
+    :return: dict of (dir path, jack file name) -> (mtime, size) for every
+    jack file the paths hold, dict of dir path -> dir of its vm files
+    """
+    state = {}
+    vm_dirs = {}
+    groups, errors = collect_sources(paths, out_dir)
+    for dir_path, files_list, vm_dir, complete in groups:
+        vm_dirs[dir_path] = vm_dir
+        for file_name in files_list:
+            try:
+                stat = os.stat(os.path.join(dir_path, file_name))
+            except OSError:
+                continue
+            state[dir_path, file_name] = (stat.st_mtime_ns, stat.st_size)
+    return state, vm_dirs
+
+
+def watch(args, caches=None, poll_interval=POLL_INTERVAL,
+          debounce=DEBOUNCE):
+    """
+    build, then poll the sources forever and recompile the files that are
+    added or changed - once they stay unchanged for the debounce time. the
+    vm files of deleted sources are removed. a whole program build is
+    redone as a whole.
+    :param args: parsed arguments namespace
+    :param caches: dict of dir path -> BuildCache to reuse, None to open
+    them
+    :param poll_interval: seconds between two scans
+    :param debounce: seconds a change must be quiet before it is compiled
+    """
+    if caches is None:
+        caches = {}
+    previous, vm_dirs = snapshot(args.paths, args.out_dir)
+    errors, report = build(args, caches)
+    print_build(errors, report)
+    options = compile_options(args)
+    while True:
+        time.sleep(poll_interval)
+        current, current_vm_dirs = snapshot(args.paths, args.out_dir)
+        if current == previous:
+            continue
+        settled = None
+        while settled != current:
+            settled = current
+            time.sleep(debounce)
+            current, current_vm_dirs = snapshot(args.paths, args.out_dir)
+        for dir_path, file_name in sorted(set(previous) - set(current)):
+            try:
+                os.remove(vm_path(file_name, vm_dirs[dir_path]))
+            except OSError:
+                pass
+            print('%s: removed' % os.path.join(dir_path, file_name))
+        vm_dirs = current_vm_dirs
+        if args.whole_program or args.bundle or \
+                args.target == AsmWriter.TARGET:
+            # the output of every file depends on the whole program, or
+            # goes into the one bundle / asm program
+            start = time.perf_counter()
+            errors, report = build(args, caches)
+            print('program: %.1f ms' % ((time.perf_counter() - start) * 1000))
+            print_build(errors, report)
+            previous = current
+            continue
+        for dir_path, file_name in sorted(current):
+            if previous.get((dir_path, file_name)) == \
+                    current[dir_path, file_name]:
+                continue
+            if dir_path not in caches:
+                caches[dir_path] = BuildCache.BuildCache(
+                    os.path.join(dir_path, BuildCache.CACHE_DIR))
+            optimization_stats = Counter()
+            start = time.perf_counter()
+            errors = handle_files([file_name], dir_path, SERIAL,
+                                  None if args.no_cache else caches[dir_path],
+                                  options, optimization_stats, None,
+                                  vm_dirs[dir_path])
+            milliseconds = (time.perf_counter() - start) * 1000
+            if not errors:
+                print('%s: %.1f ms' % (os.path.join(dir_path, file_name),
+                                       milliseconds))
+            report = []
+            if args.stats:
+                for name, count in sorted(optimization_stats.items()):
+                    report.append('%s: %d' % (name, count))
+            print_build(errors, report)
+        previous = current
+
+
+def print_build(errors, report, report_stream=None):
+    """
+    :param errors: list of (file path, error message) for files that failed
+    :param report: list of report lines to print
+    :param report_stream: stream to print the report to, None for stdout
+    """
+    if report_stream is None:
+        report_stream = sys.stdout
+    for line in report:
+        report_stream.write(line + '\n')
+    for failed_file, message in errors:
+        for line in error_lines(failed_file, message):
+            sys.stderr.write(line + '\n')
+    report_stream.flush()
+
+
+def error_lines(failed_file, message):
+    """
+    :param failed_file: path of the file that failed
+    :param message: its error message, one diagnostic per line
+    :return: the lines to report - file:line:column: text for a diagnostic
+    at a position, file: text for any other
+    """
+    lines = []
+    for diagnostic in message.split(NEW_LINE):
+        if POSITION_PATTERN.match(diagnostic):
+            lines.append(failed_file + ':' + diagnostic)
+        else:
+            lines.append(failed_file + ': ' + diagnostic)
+    return lines
 
 
 if __name__ == '__main__':
-    filePath = sys.argv[FILE_LOCATION]
-    translate_files(filePath)
+    arguments = parse_args(sys.argv[1:])
+    if arguments.watch:
+        try:
+            watch(arguments)
+        except KeyboardInterrupt:
+            sys.exit(0)
+    errors, report = build(arguments)
+    # with stdin the vm code goes to stdout, so the report goes to stderr
+    print_build(errors, report,
+                sys.stderr if arguments.paths == [STDIN] else sys.stdout)
+    if errors:
+        sys.exit(1)
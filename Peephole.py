@@ -0,0 +1,328 @@
+from VMWriter import PUSH, POP, LABEL, GOTO, IF_GOTO, CALL, FUNCTION, RETURN
+
+WINDOW_SIZE = 8  # commands held back for the rules to look at
+
+CONSTANT = 'constant'
+
+STAT_PREFIX = 'peephole.'
+
+COMPARISONS = ('eq', 'gt', 'lt')
+LOGICAL = ('and', 'or')
+BINARY = ('add', 'sub') + LOGICAL + COMPARISONS
+UNARY = ('neg', 'not')
+
+
+def value_start(commands, end):
+    """
+    :param commands: vm command tuples
+    :param end: position right after the commands that compute a value
+    :return: position of the first command that computes the value on top
+    of the stack after commands[:end], None if it starts before the
+    commands or control flow joins in between
+    """
+    needed = 1
+    for position in range(end - 1, -1, -1):
+        command = commands[position]
+        operation = command[0]
+        if operation == PUSH:
+            needed -= 1
+        elif operation == POP:
+            needed += 1
+        elif operation in BINARY:
+            needed += 1
+        elif operation == CALL:
+            needed += command[2] - 1
+        elif operation not in UNARY:
+            return None
+        if needed == 0:
+            return position
+    return None
+
+
+def is_boolean(commands, end):
+    """
+    :param commands: vm command tuples
+    :param end: position right after the commands that compute a value
+    :return: True if the value on top of the stack after commands[:end] is
+    provably 0 or -1 - the result of eq / gt / lt, push constant 0, or not /
+    and / or of booleans
+    """
+    if end <= 0:
+        return False
+    command = commands[end - 1]
+    operation = command[0]
+    if operation == PUSH:
+        return command[1] == CONSTANT and command[2] == 0
+    if operation in COMPARISONS:
+        return True
+    if operation == 'not':
+        return is_boolean(commands, end - 1)
+    if operation in LOGICAL:
+        start = value_start(commands, end - 1)
+        return start is not None and is_boolean(commands, end - 1) and \
+            is_boolean(commands, start)
+    return False
+
+
+def push_pop(tail):
+    """
+    push X / pop X stores the value that is already there
+    """
+    push, pop = tail
+    if push[0] == PUSH and pop[0] == POP and push[1:] == pop[1:]:
+        return []
+
+
+def double_unary(tail):
+    """
+    not / not and neg / neg cancel out
+    """
+    first, second = tail
+    if len(first) == 1 and first == second and first[0] in ('not', 'neg'):
+        return []
+
+
+def neutral_operand(tail):
+    """
+    x + 0, x - 0, x | 0, x * 1 and x / 1 are x
+    """
+    push, op = tail
+    if push[0] != PUSH or push[1] != CONSTANT:
+        return None
+    if push[2] == 0 and op in (('add',), ('sub',), ('or',)):
+        return []
+    if push[2] == 1 and op[0] == CALL and op[1] in ('Math.multiply',
+                                                   'Math.divide'):
+        return []
+
+
+def constant_if_goto(tail):
+    """
+    push constant 0 / if-goto never jumps, any other constant always does
+    """
+    push, jump = tail
+    if push[0] == PUSH and push[1] == CONSTANT and jump[0] == IF_GOTO:
+        return [] if push[2] == 0 else [(GOTO, jump[1])]
+
+
+def true_if_goto(tail):
+    """
+    true (push constant 0 / not) or -c (push constant c / neg) followed by
+    if-goto always jumps
+    """
+    push, unary, jump = tail
+    if push[0] == PUSH and push[1] == CONSTANT and jump[0] == IF_GOTO and \
+            ((unary == ('not',) and push[2] == 0) or
+             (unary == ('neg',) and push[2] != 0)):
+        return [(GOTO, jump[1])]
+
+
+def not_if_goto(window):
+    """
+    b / not / if-goto A / goto B branches the same as b / if-goto B / goto A
+    when b is a boolean, 0 or -1. not is bitwise, so any other nonzero b
+    would still jump after it. looks at the whole window to tell.
+    """
+    if len(window) < 4:
+        return None
+    negate, jump, goto = window[-3:]
+    if negate == ('not',) and jump[0] == IF_GOTO and goto[0] == GOTO and \
+            is_boolean(window, len(window) - 3):
+        return window[:-3] + [(IF_GOTO, goto[1]), (GOTO, jump[1])]
+
+
+def goto_next_label(tail):
+    """
+    goto L right before label L falls through anyway
+    """
+    goto, label = tail
+    if goto[0] == GOTO and label[0] == LABEL and goto[1] == label[1]:
+        return [label]
+
+
+def unreachable(tail):
+    """
+    nothing after goto / return runs until the next label or function
+    """
+    jump, command = tail
+    if jump[0] in (GOTO, RETURN) and command[0] not in (LABEL, FUNCTION):
+        return [jump]
+
+
+def array_store(tail):
+    """
+    let a[i] = x of a plain x does not need the temp 0 shuffle - x can be
+    pushed after that is set, unless x itself is read through that
+    """
+    push, save, set_that, restore, store = tail
+    if push[0] == PUSH and push[1] not in ('that', 'pointer', 'temp') and \
+            save == (POP, 'temp', 0) and set_that == (POP, 'pointer', 1) and \
+            restore == (PUSH, 'temp', 0) and store == (POP, 'that', 0):
+        return [set_that, push, store]
+
+
+# name, how many commands it matches - None for the whole window - rewrite
+# function. a rewrite function gets the matched commands and returns their
+# replacement, or None when the rule does not apply
+RULES = [('push-pop', 2, push_pop),
+         ('double-unary', 2, double_unary),
+         ('neutral-operand', 2, neutral_operand),
+         ('constant-if-goto', 2, constant_if_goto),
+         ('true-if-goto', 3, true_if_goto),
+         ('not-if-goto', None, not_if_goto),
+         ('goto-next-label', 2, goto_next_label),
+         ('unreachable', 2, unreachable),
+         ('array-store', 5, array_store)]
+
+
+JUMPS = (GOTO, IF_GOTO)
+
+
+def thread_jumps(commands, stats):
+    """
+    whole function pass over the jumps: a jump to a label that leads to a
+    goto goes straight to the goto's target, and a goto to a label that
+    leads to a return is the return. then gotos that fall through to their
+    label, commands no jump can reach and labels no jump targets are
+    dropped, until nothing changes.
+    :param commands: vm command tuples of one function
+    :param stats: Counter to count the rewrites in
+    :return: the optimized commands
+    """
+    changed = True
+    while changed:
+        changed = False
+        # the first command that is not a label after every label
+        leads_to = {}
+        pending = []
+        for command in commands:
+            if command[0] == LABEL:
+                pending.append(command[1])
+                continue
+            for label in pending:
+                leads_to[label] = command
+            pending = []
+
+        threaded = []
+        for command in commands:
+            if command[0] in JUMPS:
+                target = command[1]
+                seen = set()
+                while leads_to.get(target, (None,))[0] == GOTO and \
+                        target not in seen:
+                    seen.add(target)
+                    target = leads_to[target][1]
+                if command[0] == GOTO and \
+                        leads_to.get(target, (None,))[0] == RETURN:
+                    command = (RETURN,)
+                    stats[STAT_PREFIX + 'jump-to-return'] += 1
+                    changed = True
+                elif target != command[1]:
+                    command = (command[0], target)
+                    stats[STAT_PREFIX + 'jump-threading'] += 1
+                    changed = True
+            threaded.append(command)
+
+        kept = []
+        reachable = True
+        for position, command in enumerate(threaded):
+            if command[0] == LABEL:
+                reachable = True
+            elif not reachable:
+                stats[STAT_PREFIX + 'unreachable'] += 1
+                changed = True
+                continue
+            if command[0] == GOTO and falls_through(threaded, position):
+                stats[STAT_PREFIX + 'goto-next-label'] += 1
+                changed = True
+                continue
+            if command[0] in (GOTO, RETURN):
+                reachable = False
+            kept.append(command)
+
+        used = set(command[1] for command in kept if command[0] in JUMPS)
+        commands = []
+        for command in kept:
+            if command[0] == LABEL and command[1] not in used:
+                stats[STAT_PREFIX + 'unused-label'] += 1
+                changed = True
+                continue
+            commands.append(command)
+    return commands
+
+
+def falls_through(commands, position):
+    """
+    :return: True if the goto at position targets one of the labels right
+    after it
+    """
+    target = commands[position][1]
+    for command in commands[position + 1:]:
+        if command[0] != LABEL:
+            return False
+        if command[1] == target:
+            return True
+    return False
+
+
+class PeepholeOptimizer:
+    """
+    Streaming peephole pass over VM commands. Commands are held back in a
+    small window, and after every new command the rules table is matched
+    against the end of the window until no rule applies any more, so a
+    rewrite can expose another one. Commands that fall out of the window
+    are collected per function, and every complete function goes through
+    thread_jumps() before it is handed to the output callback.
+    """
+
+    def __init__(self, output, stats):
+        """
+        :param output: callable that gets the final commands
+        :param stats: Counter to count rule hits in
+        """
+        self._output = output
+        self._stats = stats
+        self._window = []
+        self._function = []
+
+    def feed(self, command):
+        """
+        :param command: next vm command tuple
+        """
+        window = self._window
+        window.append(command)
+        rewritten = True
+        while rewritten:
+            rewritten = False
+            for name, size, rule in RULES:
+                if size is None:
+                    size = len(window)
+                elif len(window) < size:
+                    continue
+                replacement = rule(window[-size:])
+                if replacement is not None:
+                    window[-size:] = replacement
+                    self._stats[STAT_PREFIX + name] += 1
+                    rewritten = bool(window)
+                    break
+        while len(window) > WINDOW_SIZE:
+            self._collect(window.pop(0))
+
+    def _collect(self, command):
+        if command[0] == FUNCTION:
+            self._output_function()
+        self._function.append(command)
+
+    def _output_function(self):
+        for command in thread_jumps(self._function, self._stats):
+            self._output(command)
+        self._function = []
+
+    def drain(self):
+        """
+        hand all held back commands to the output
+        """
+        for command in self._window:
+            self._collect(command)
+        self._window = []
+        self._output_function()
@@ -0,0 +1,151 @@
+import json
+import time
+from functools import wraps
+
+import CompilationEngine
+import JackTokenizer
+
+NEW_LINE = '\n'
+
+FUNCTION_PREFIX = 'function '
+
+PHASES = ['read', 'tokenize', 'compile', 'write']
+
+
+class Timer:
+    """
+    call count and cumulative wall time of a single hook
+    """
+    __slots__ = ('calls', 'seconds')
+
+    def __init__(self):
+        self.calls = 0
+        self.seconds = 0.0
+
+    def report(self):
+        return {'calls': self.calls, 'seconds': self.seconds}
+
+
+class Profiler:
+    """
+    Per file and per phase wall times of a build, plus counters of the hot
+    paths. Nothing is hooked into the compiler unless a file is compiled
+    through compile_file(), which wraps the methods of that file's engine
+    only - a build without --profile runs the plain code, and builds on
+    other threads are not affected.
+    """
+
+    def __init__(self):
+        self.files = []
+        self.methods = {}
+        self.symbol_lookups = Timer()
+        self.subroutines = {}
+        self._write_seconds = 0.0
+        self._subroutine = None
+
+    def compile_file(self, input_file_path, output, options=None):
+        """
+        compile a single jack file with the single pass engine, measuring
+        every phase - the source is read and split into tokens up front,
+        so the tokenizer is timed on its own
+        :param input_file_path: jack file
+        :param output: file / stream to write the vm code to
+        :param options: CompileOptions, None for the defaults - its ast and
+        stream switches are not measured, Main does not profile them
+        :return: the engine's optimization counters
+        """
+        start = time.perf_counter()
+        with open(input_file_path, 'r') as f:
+            source = f.read()
+        read = time.perf_counter()
+        tokenizer = JackTokenizer.JackTokenizer(input_file_path, source)
+        loaded = time.perf_counter()
+        engine = CompilationEngine.CompilationEngine(
+            input_file_path, self._timed_sink(output), options,
+            tokenizer=tokenizer)
+        self._instrument(engine)
+        self._write_seconds = 0.0
+        self._subroutine = None
+        engine.compile_class()
+        compiled = time.perf_counter()
+        compile_write_seconds = self._write_seconds
+        engine.write_class_to_file()
+        written = time.perf_counter()
+
+        phases = {'read': read - start,
+                  'tokenize': loaded - read,
+                  'compile': compiled - loaded - compile_write_seconds,
+                  'write': written - compiled + compile_write_seconds}
+        self.files.append({'file': input_file_path,
+                           'seconds': written - start,
+                           'phases': phases})
+        return engine.stats
+
+    def _instrument(self, engine):
+        """
+        wrap the compile_* methods and the symbol lookups of one engine
+        """
+        for name in dir(engine):
+            if name.startswith('compile_'):
+                timer = self.methods.setdefault(name, Timer())
+                setattr(engine, name,
+                        self._timed(getattr(engine, name), timer))
+        for statement, method in engine.statements_func_dict.items():
+            engine.statements_func_dict[statement] = getattr(
+                engine, method.__name__)
+        engine.symbol_table.lookup = self._timed(engine.symbol_table.lookup,
+                                                 self.symbol_lookups)
+
+    @staticmethod
+    def _timed(function, timer):
+        @wraps(function)
+        def timed(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                timer.calls += 1
+                timer.seconds += time.perf_counter() - start
+        return timed
+
+    def _timed_sink(self, output):
+        """
+        :return: sink that times the writes and counts the vm commands of
+        every subroutine on their way to output
+        """
+        write = output if callable(output) else output.write
+
+        def sink(text):
+            for line in text.split(NEW_LINE):
+                if line.startswith(FUNCTION_PREFIX):
+                    self._subroutine = line.split()[1]
+                    self.subroutines[self._subroutine] = 0
+                if line and self._subroutine is not None:
+                    self.subroutines[self._subroutine] += 1
+            start = time.perf_counter()
+            write(text)
+            self._write_seconds += time.perf_counter() - start
+        return sink
+
+    def report(self):
+        """
+        :return: json ready dict of everything measured
+        """
+        totals = dict.fromkeys(PHASES, 0.0)
+        for file_record in self.files:
+            for phase in PHASES:
+                totals[phase] += file_record['phases'][phase]
+        return {'seconds': sum(record['seconds'] for record in self.files),
+                'phases': totals,
+                'files': self.files,
+                'methods': dict((name, timer.report()) for name, timer in
+                                sorted(self.methods.items())),
+                'symbol_lookups': self.symbol_lookups.report(),
+                'vm_commands_per_subroutine': self.subroutines}
+
+    def write(self, report_path):
+        """
+        :param report_path: file to write the json report to
+        """
+        with open(report_path, 'w') as f:
+            json.dump(self.report(), f, indent=2)
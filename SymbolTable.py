@@ -0,0 +1,83 @@
+STATIC = 'static'
+FIELD = 'field'
+ARG = 'argument'
+VAR = 'var'
+
+kind_to_segment_dict = {ARG: ARG, VAR: 'local', STATIC: 'static',
+                        FIELD: 'this'}
+
+CLASS_KINDS = (STATIC, FIELD)
+
+
+class SymbolRecord:
+    """
+    a single declared variable. the vm segment is resolved once here, so
+    pushing or popping the variable needs no further lookups.
+    """
+    __slots__ = ('name', 'type', 'kind', 'index', 'segment')
+
+    def __init__(self, name, symbol_type, kind, index):
+        self.name = name
+        self.type = symbol_type
+        self.kind = kind
+        self.index = index
+        self.segment = kind_to_segment_dict[kind]
+
+
+class SymbolTable:
+    """
+    Variables of the class and of the subroutine being compiled. The
+    subroutine scope starts as a copy of the class scope, so resolving a
+    name is a single dict lookup and subroutine variables shadow class
+    variables of the same name.
+    """
+
+    def __init__(self):
+        self._class_scope = {}
+        self._scope = self._class_scope
+        self._counters = {STATIC: 0, FIELD: 0, ARG: 0, VAR: 0}
+
+    def start_subroutine(self):
+        """
+        starts a new subroutine scope
+        """
+        self._scope = dict(self._class_scope)
+        self._counters[ARG] = 0
+        self._counters[VAR] = 0
+
+    def end_subroutine(self):
+        """
+        drops the subroutine scope, back to the class scope
+        """
+        self._scope = self._class_scope
+
+    def define(self, name, symbol_type, kind):
+        """
+        defines a new variable with the next index of its kind. static and
+        field variables go to the class scope, argument and var variables
+        to the subroutine scope.
+        :return: SymbolRecord of the variable
+        """
+        record = SymbolRecord(name, symbol_type, kind, self._counters[kind])
+        self._counters[kind] += 1
+        if kind in CLASS_KINDS:
+            self._class_scope[name] = record
+            self._scope.setdefault(name, record)
+        else:
+            self._scope[name] = record
+        return record
+
+    def var_count(self, kind):
+        """
+        :return: number of variables of the given kind defined so far in
+        the current scope
+        """
+        return self._counters[kind]
+
+    def lookup(self, name):
+        """
+        :param name: variable name
+        :return: SymbolRecord of the variable, None if it is not defined -
+        then the name is a class name
+        """
+        return self._scope.get(name)
@@ -0,0 +1,78 @@
+"""
+Bundled vm output: the vm code of every class of a build in a single file,
+so the next stage reads one file sequentially instead of opening one per
+class. The file starts with an index of // comment lines - the count of
+classes, then the name, first line and number of lines of every class -
+and the classes follow in the order of the index:
+
+    // bundle 2
+    // Main 4 12
+    // Point 16 40
+    function Main.main 0
+    ...
+"""
+import os
+
+BUNDLE_HEADER = '// bundle %d'
+INDEX_ENTRY = '// %s %d %d'
+COMMENT = '//'
+
+NEW_LINE = '\n'
+
+TEMP_SUFFIX = '.tmp'
+
+WRITE_BUFFER = 1 << 20  # bytes buffered before a write reaches the file
+
+
+def line_count(vm_code):
+    """
+    :param vm_code: vm code without a trailing new line
+    :return: number of lines of the code
+    """
+    if not vm_code:
+        return 0
+    return vm_code.count(NEW_LINE) + 1
+
+
+def write_bundle(bundle_path, classes):
+    """
+    write the vm code of classes into a bundle. the bundle is written next
+    to its path and renamed over it once complete, so a reader never sees
+    half a bundle.
+    :param bundle_path: path of the bundle file
+    :param classes: list of (class name, vm code) in bundle order
+    """
+    header = [BUNDLE_HEADER % len(classes)]
+    first_line = len(classes) + 2
+    for class_name, vm_code in classes:
+        lines = line_count(vm_code)
+        header.append(INDEX_ENTRY % (class_name, first_line, lines))
+        first_line += lines
+    temp_path = bundle_path + TEMP_SUFFIX
+    try:
+        with open(temp_path, 'w', buffering=WRITE_BUFFER) as f:
+            f.write(NEW_LINE.join(header))
+            for class_name, vm_code in classes:
+                if vm_code:
+                    f.write(NEW_LINE)
+                    f.write(vm_code)
+        os.replace(temp_path, bundle_path)
+    except BaseException:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+
+
+def read_index(bundle_path):
+    """
+    :param bundle_path: path of a bundle file
+    :return: list of (class name, first line, number of lines) as the
+    header of the bundle gives them, lines counted from 1
+    """
+    index = []
+    with open(bundle_path, 'r') as f:
+        count = int(f.readline().split()[2])
+        for _ in range(count):
+            comment, class_name, first_line, lines = f.readline().split()
+            index.append((class_name, int(first_line), int(lines)))
+    return index
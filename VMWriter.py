@@ -0,0 +1,211 @@
+NEW_LINE = '\n'
+
+SPACE = ' '
+
+FLUSH_SIZE = 4096  # commands per bulk write
+
+PUSH = 'push'
+POP = 'pop'
+LABEL = 'label'
+GOTO = 'goto'
+IF_GOTO = 'if-goto'
+CALL = 'call'
+FUNCTION = 'function'
+RETURN = 'return'
+
+SET_THAT = (POP, 'pointer', 1)
+
+# segments of the variables an array base is tracked in - no call, and no
+# store through an array, can change them
+BASE_SEGMENTS = ('local', 'argument')
+
+
+def discard_text(text):
+    """
+    sink of a writer whose output is dropped
+    """
+
+
+def format_command(command):
+    """
+    :param command: vm command tuple, e.g. ('push', 'constant', 7)
+    :return: vm code line of the command
+    """
+    if len(command) == 1:
+        return command[0]
+    return SPACE.join([str(part) for part in command])
+
+
+class VMWriter:
+    """
+    Emits VM commands into a shared sink. Every command is appended exactly
+    once as a small tuple, and the pending commands are formatted and
+    written to the sink in bulk, so memory stays flat no matter how big the
+    compiled class is. The sink is a file / io buffer (anything with a
+    write method) or a callback that gets the text chunks. An optimizer
+    (e.g. PeepholeOptimizer) can be put between the writer and the sink.
+
+    The writer also follows which variable pointer 1 holds at the end of the
+    commands emitted so far (that_base), so an array access can reuse it.
+    """
+
+    def __init__(self, output, optimizer=None, translator=None):
+        """
+        :param output: file / stream to write to, or a callable
+        :param optimizer: factory that gets the callable to pass commands
+        on to and returns an object with feed(command) and drain(), or None
+        :param translator: object whose translate_all(commands) returns the
+        lines to write instead of the vm code (e.g. AsmTranslator), or None
+        """
+        self._translator = translator
+        self._write = output if callable(output) else output.write
+        self._commands = []
+        self._captures = []
+        self._deferred = []
+        self._empty = True
+        # (segment, index) of the local / argument pointer 1 was set to, or
+        # None. a call keeps it - the frame of the caller restores that
+        self.that_base = None
+        self._last = None
+        self._optimizer = None
+        if optimizer is not None:
+            self._optimizer = optimizer(self._commands_append)
+
+    def write_push(self, segment, index):
+        self.emit((PUSH, segment, index))
+
+    def write_pop(self, segment, index):
+        self.emit((POP, segment, index))
+
+    def write_arithmetic(self, command):
+        self.emit((command,))
+
+    def write_label(self, label):
+        self.emit((LABEL, label))
+
+    def write_goto(self, label):
+        self.emit((GOTO, label))
+
+    def write_if(self, label):
+        self.emit((IF_GOTO, label))
+
+    def write_call(self, name, n_args):
+        self.emit((CALL, name, n_args))
+
+    def write_function(self, name, n_locals):
+        self.emit((FUNCTION, name, n_locals))
+
+    def write_return(self):
+        self.emit((RETURN,))
+
+    def emit(self, command):
+        """
+        append a single command
+        :param command: vm command tuple
+        """
+        if self._deferred:
+            deferred = self._deferred
+            self._deferred = []
+            for commands in deferred:
+                self.emit_all(commands)
+        operation = command[0]
+        if operation == POP:
+            if command == SET_THAT:
+                last = self._last
+                self.that_base = None
+                if last is not None and last[0] == PUSH and \
+                        last[1] in BASE_SEGMENTS:
+                    self.that_base = last[1:]
+            elif command[1:] == self.that_base:
+                self.that_base = None
+        elif operation == LABEL or operation == FUNCTION:
+            # code may be jumped to from anywhere
+            self.that_base = None
+        self._last = command
+        if self._captures:
+            self._commands.append(command)
+        elif self._optimizer is not None:
+            self._optimizer.feed(command)
+        else:
+            self._commands_append(command)
+
+    def _commands_append(self, command):
+        self._commands.append(command)
+        if len(self._commands) >= FLUSH_SIZE:
+            self._write_commands()
+
+    def emit_all(self, commands):
+        """
+        append a sequence of already built commands
+        :param commands: vm command tuples
+        """
+        for command in commands:
+            self.emit(command)
+
+    def defer(self, commands):
+        """
+        emit commands only right before the next command that is emitted,
+        unless cancel_deferred() takes them back first
+        :param commands: vm command tuples
+        """
+        self._deferred.append(commands)
+
+    def cancel_deferred(self):
+        """
+        drop the commands of the last defer() - they must not have been
+        emitted yet
+        """
+        self._deferred.pop()
+
+    def start_capture(self):
+        """
+        hold back the following commands instead of emitting them, until
+        end_capture() hands them over. captures may be nested. the captured
+        commands may be emitted anywhere, so that_base starts unknown in them
+        """
+        self._captures.append((self._commands, self.that_base, self._last))
+        self._commands = []
+        self.that_base = None
+        self._last = None
+
+    def end_capture(self):
+        """
+        :return: list of the commands emitted since the matching
+        start_capture() - nothing was emitted since, so that_base is back to
+        what it was then
+        """
+        captured = self._commands
+        self._commands, self.that_base, self._last = self._captures.pop()
+        return captured
+
+    def discard(self):
+        """
+        drop every command from now on, instead of writing it - the output
+        of a class with errors is never used
+        """
+        self._write = discard_text
+        self._optimizer = None
+
+    def flush(self):
+        """
+        write all pending commands to the sink in one go
+        """
+        if self._optimizer is not None:
+            self._optimizer.drain()
+        self._write_commands()
+
+    def _write_commands(self):
+        if not self._commands:
+            return
+        if self._translator is None:
+            text = NEW_LINE.join([format_command(command)
+                                  for command in self._commands])
+        else:
+            text = NEW_LINE.join(self._translator.translate_all(
+                self._commands))
+        self._commands = []
+        if self._empty:
+            self._empty = False
+            self._write(text)
+        else:
+            self._write(NEW_LINE + text)
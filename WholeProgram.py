@@ -0,0 +1,355 @@
+"""
+Whole program builds of a dir. Every class is compiled in memory first,
+and only then, with the call graph of the whole program at hand, the vm
+files are written - without the subroutines that no call can reach. Before
+that, every class is parsed and its syntax tree searched for the trivial
+subroutines (getters, setters, constants), whose calls are inlined.
+"""
+import os
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+
+import CodeGenerator
+import CompilationEngine
+import JackParser
+import JackTokenizer
+import VMBundle
+from JackAST import (LetStatement, ReturnStatement, IntegerConstant,
+                     KeywordConstant, VarTerm)
+
+VM = '.vm'
+
+NEW_LINE = '\n'
+
+FUNCTION_PREFIX = 'function '
+
+SERIAL = 1
+
+INLINE_BUDGET = 6  # most vm commands an inlined call may be replaced by
+
+METHOD = 'method'
+FUNCTION = 'function'
+
+keyword_constant_dict = {'true': [('push', 'constant', 0), ('not',)],
+                         'false': [('push', 'constant', 0)],
+                         'null': [('push', 'constant', 0)]}
+
+DISCARD = ('pop', 'temp', 0)
+
+ENTRY_POINT = 'Main.main'
+
+# classes of the Jack OS - the OS is linked in from outside the program, so
+# whatever the program defines in these classes may be called by it
+OS_CLASSES = ('Array', 'Keyboard', 'Math', 'Memory', 'Output', 'Screen',
+              'String', 'Sys')
+
+
+def parse_classes(paths):
+    """
+    :param paths: jack files
+    :return: list of the ClassNode of every file, in the order of paths -
+    None for a file that does not parse, its compilation reports why
+    """
+    class_nodes = []
+    for path in paths:
+        try:
+            class_nodes.append(JackParser.parse_file(path))
+        except (OSError, JackTokenizer.JackSyntaxError):
+            class_nodes.append(None)
+    return class_nodes
+
+
+def inline_bodies(class_node, budget=INLINE_BUDGET):
+    """
+    find the subroutines of a class whose calls can be replaced by their
+    body - a single return of a field, static, argument or constant, or a
+    single let of a field or static from the only argument
+    :param class_node: ClassNode of the class
+    :param budget: most vm commands a call may be replaced by
+    :return: inline table of the class - subroutine name -> (number of
+    arguments, vm commands that replace the call, the only class the
+    commands are valid in or None)
+    """
+    class_vars = {'static': {}, 'field': {}}
+    for var_dec in class_node.class_vars:
+        names = class_vars[var_dec.kind]
+        for name in var_dec.names:
+            names[name] = len(names)
+    table = {}
+    for subroutine in class_node.subroutines:
+        inlined = inline_body(class_node.name, subroutine,
+                              class_vars['field'], class_vars['static'])
+        if inlined is not None and len(inlined[1]) <= budget:
+            table[class_node.name + '.' + subroutine.name] = inlined
+    return table
+
+
+def single_term(expression):
+    """
+    :return: the term of an expression that is a single term, None if it
+    has operations
+    """
+    if expression is None or expression.operations:
+        return None
+    return expression.term
+
+
+def inline_body(class_name, subroutine, fields, statics):
+    """
+    :param class_name: class of the subroutine
+    :param subroutine: Subroutine node
+    :param fields: field name -> index
+    :param statics: static name -> index
+    :return: (number of arguments, vm commands that replace the call, the
+    only class the commands are valid in or None), None if the body can
+    not be inlined
+    """
+    is_method = subroutine.kind == METHOD
+    if not is_method and subroutine.kind != FUNCTION:
+        return None
+    if subroutine.var_decs:
+        return None
+    params = [name for symbol_type, name in subroutine.params]
+    n_args = len(params) + is_method
+    discard = [DISCARD] * n_args
+    statements = subroutine.statements
+    if len(statements) == 1 and type(statements[0]) is ReturnStatement:
+        term = single_term(statements[0].value)
+        if type(term) is IntegerConstant:
+            return n_args, discard + [('push', 'constant', term.value)], None
+        if type(term) is KeywordConstant and \
+                term.word in keyword_constant_dict:
+            return n_args, discard + keyword_constant_dict[term.word], None
+        if type(term) is not VarTerm:
+            return None
+        if term.name in params:
+            # the argument is left on the stack as the return value
+            if n_args == 1:
+                return n_args, [], None
+        elif term.name in fields:
+            if is_method and n_args == 1:
+                return n_args, [('pop', 'pointer', 1),
+                                ('push', 'that', fields[term.name])], None
+        elif term.name in statics:
+            return n_args, discard + [('push', 'static',
+                                       statics[term.name])], class_name
+        return None
+    if len(statements) == 2 and type(statements[0]) is LetStatement and \
+            type(statements[1]) is ReturnStatement and \
+            statements[1].value is None and len(params) == 1:
+        let = statements[0]
+        term = single_term(let.value)
+        if let.index is not None or let.name in params or \
+                type(term) is not VarTerm or term.name != params[0]:
+            return None
+        if let.name in fields and is_method:
+            return n_args, [DISCARD, ('pop', 'pointer', 1),
+                            ('push', 'temp', 0),
+                            ('pop', 'that', fields[let.name]),
+                            ('push', 'constant', 0)], None
+        if let.name in statics:
+            return n_args, [('pop', 'static', statics[let.name])] + \
+                discard[1:] + [('push', 'constant', 0)], class_name
+    return None
+
+
+def compile_unit(input_file_path, options=None, inline_table=None,
+                 class_node=None):
+    """
+    compile a single jack file in memory. module level so it can be shipped
+    to a worker process.
+    :param input_file_path: jack file
+    :param options: CompileOptions, None for the defaults
+    :param inline_table: subroutine name -> inlined body, see inline_bodies
+    :param class_node: ClassNode of the file if it was parsed already - the
+    code is generated from it when options.ast is on
+    :return: error message or None on success, optimization counters, list
+    of (subroutine name, vm code) in source order, call graph of the class
+    """
+    chunks = []
+    stats = Counter()
+    try:
+        if options is not None and options.ast and class_node is not None:
+            engine = CodeGenerator.CodeGenerator(chunks.append, options,
+                                                 inline_table,
+                                                 input_file_path)
+            stats = engine.stats
+            engine.generate(class_node)
+        elif options is not None and options.ast:
+            engine = CodeGenerator.compile_file(input_file_path, chunks.append,
+                                                options, inline_table)
+            stats = engine.stats
+        else:
+            engine = CompilationEngine.CompilationEngine(
+                input_file_path, chunks.append, options, inline_table)
+            stats = engine.stats
+            engine.compile_class()
+            engine.write_class_to_file()
+    except Exception as error:
+        return JackTokenizer.error_message(error), stats, [], {}
+    return None, stats, split_functions(''.join(chunks)), engine.calls
+
+
+def split_functions(vm_code):
+    """
+    :param vm_code: vm code of a class
+    :return: list of (subroutine name, vm code of the subroutine)
+    """
+    functions = []
+    for line in vm_code.split(NEW_LINE):
+        if line.startswith(FUNCTION_PREFIX):
+            functions.append((line.split()[1], [line]))
+        elif functions:
+            functions[-1][1].append(line)
+    return [(name, NEW_LINE.join(lines)) for name, lines in functions]
+
+
+def reachable(calls, roots):
+    """
+    :param calls: call graph - subroutine name -> names it calls
+    :param roots: names of the subroutines that are called from outside
+    :return: set of the names reachable from the roots
+    """
+    reached = set(roots)
+    pending = list(roots)
+    while pending:
+        for callee in calls.get(pending.pop(), ()):
+            if callee not in reached:
+                reached.add(callee)
+                pending.append(callee)
+    return reached
+
+
+def program_roots(calls):
+    """
+    :param calls: call graph of the whole program
+    :return: names of the subroutines called from outside the program,
+    None if the program has no entry point - then it is a library
+    """
+    if ENTRY_POINT not in calls:
+        return None
+    return [name for name in calls
+            if name == ENTRY_POINT or name.split('.')[0] in OS_CLASSES]
+
+
+def compile_units(paths, jobs=SERIAL, options=None, inline_table=None,
+                  class_nodes=None):
+    """
+    compile jack files in memory, serially or on a process pool
+    :param paths: jack files
+    :param jobs: number of worker processes, 0 for one per core
+    :param options: CompileOptions, None for the defaults
+    :param inline_table: subroutine name -> inlined body, see inline_bodies
+    :param class_nodes: ClassNode of every file, or None, see compile_unit
+    :return: list of the results of compile_unit, in the order of paths
+    """
+    if class_nodes is None:
+        class_nodes = [None] * len(paths)
+    if jobs == 0:
+        jobs = os.cpu_count() or SERIAL
+    jobs = min(jobs, len(paths))
+    if jobs <= SERIAL:
+        return [compile_unit(path, options, inline_table, class_node)
+                for path, class_node in zip(paths, class_nodes)]
+    with ProcessPoolExecutor(max_workers=jobs) as pool:
+        return list(pool.map(compile_unit, paths, [options] * len(paths),
+                             [inline_table] * len(paths), class_nodes))
+
+
+def translate_bundle(files_list, dir_path, bundle_path, jobs=SERIAL,
+                     options=None, stats=None):
+    """
+    compile the jack files of a dir into a single bundle file, see
+    VMBundle. the bundle is written only when every file compiles.
+    :param files_list: list of files in the dir, in bundle order
+    :param dir_path: dir of the files
+    :param bundle_path: path of the bundle file
+    :param jobs: number of worker processes, 0 for one per core
+    :param options: CompileOptions, None for the defaults
+    :param stats: Counter to add the optimization counters to
+    :return: list of (file path, error message) for files that failed
+    """
+    paths = [os.path.join(dir_path, file_name) for file_name in files_list]
+    errors = []
+    classes = []
+    for path, (error, unit_stats, functions, unit_calls) in \
+            zip(paths, compile_units(paths, jobs, options)):
+        if error is not None:
+            errors.append((path, error))
+        if stats is not None:
+            stats.update(unit_stats)
+        classes.append((os.path.splitext(os.path.basename(path))[0],
+                        NEW_LINE.join(vm_code for name, vm_code in functions)))
+    if not errors:
+        VMBundle.write_bundle(bundle_path, classes)
+    return errors
+
+
+def translate_program(files_list, dir_path, jobs=SERIAL, options=None,
+                      stats=None, inline=True, budget=INLINE_BUDGET,
+                      out_dir=None, bundle_path=None):
+    """
+    compile the jack files of a dir as one program and write their vm files,
+    inlining the calls of trivial subroutines and leaving out the
+    subroutines that cannot be reached from Main.main. when a file fails,
+    the call graph is incomplete and nothing is left out.
+    :param files_list: list of files in the dir
+    :param dir_path: dir of the files, vm files are saved there too
+    :param jobs: number of worker processes, 0 for one per core
+    :param options: CompileOptions, None for the defaults
+    :param stats: Counter to add the optimization counters to
+    :param inline: inline the calls of trivial subroutines
+    :param budget: most vm commands an inlined call may be replaced by
+    :param out_dir: dir to save the vm files into instead, None for dir_path
+    :param bundle_path: write all the classes into this bundle file instead
+    of a vm file each - only when every file compiles - None for vm files
+    :return: list of (file path, error message) for files that failed,
+    sorted list of the names of the subroutines left out
+    """
+    paths = [os.path.join(dir_path, file_name) for file_name in files_list]
+    inline_table = {}
+    class_nodes = None
+    if inline:
+        class_nodes = parse_classes(paths)
+        for class_node in class_nodes:
+            if class_node is not None:
+                inline_table.update(inline_bodies(class_node, budget))
+    results = compile_units(paths, jobs, options, inline_table, class_nodes)
+
+    errors = []
+    calls = {}
+    for path, (error, unit_stats, functions, unit_calls) in \
+            zip(paths, results):
+        if error is not None:
+            errors.append((path, error))
+        if stats is not None:
+            stats.update(unit_stats)
+        calls.update(unit_calls)
+    roots = None if errors else program_roots(calls)
+    reached = reachable(calls, roots) if roots is not None else set(calls)
+
+    if out_dir is None:
+        out_dir = dir_path
+    removed = []
+    classes = []
+    for file_name, (error, unit_stats, functions, unit_calls) in \
+            zip(files_list, results):
+        if error is not None:
+            continue
+        kept = []
+        for name, vm_code in functions:
+            if name in reached:
+                kept.append(vm_code)
+            else:
+                removed.append(name)
+        classes.append((os.path.splitext(file_name)[0], NEW_LINE.join(kept)))
+    if bundle_path is not None:
+        if not errors:
+            VMBundle.write_bundle(bundle_path, classes)
+    else:
+        for class_name, vm_code in classes:
+            with open(os.path.join(out_dir, class_name + VM), 'w') as f:
+                f.write(vm_code)
+    if stats is not None and removed:
+        stats['whole.subroutines_removed'] += len(removed)
+    return errors, sorted(removed)
@@ -0,0 +1,6 @@
+"""
+Throughput benchmarks of the compiler - a generator of synthetic Jack
+classes, timing harnesses for the tokenizer, the compilation engine and
+whole builds, and a comparison against a stored baseline. Run from the
+compiler dir with: python -m benchmark --help
+"""
@@ -0,0 +1,167 @@
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+
+from benchmark import corpus
+
+BENCHMARK_DIR = os.path.dirname(os.path.abspath(__file__))
+COMPILER_DIR = os.path.dirname(BENCHMARK_DIR)
+BASELINE = os.path.join(BENCHMARK_DIR, 'baseline.json')
+
+# the speed of the machine the throughputs are divided by
+REFERENCE = ('reference', 'units_per_sec')
+RELATIVE = 'relative'  # throughput / reference speed, what is compared
+
+# benchmark name, throughput metric that is checked against the baseline
+THROUGHPUT = [('tokenizer', 'tokens_per_sec'),
+              ('tokenizer_stream', 'tokens_per_sec'),
+              ('engine', 'lines_per_sec'),
+              ('end_to_end', 'lines_per_sec')]
+
+
+def parse_args(argv):
+    """
+    :param argv: command line arguments without the program name
+    :return: parsed arguments namespace
+    """
+    parser = argparse.ArgumentParser(
+        prog='python -m benchmark',
+        description='Measure compiler throughput on a synthetic corpus')
+    parser.add_argument('--classes', type=int, default=20)
+    parser.add_argument('--subroutines', type=int, default=20)
+    parser.add_argument('--locals', type=int, default=16)
+    parser.add_argument('--depth', type=int, default=4,
+                        help='nesting depth of the generated expressions')
+    parser.add_argument('--string-length', type=int, default=40)
+    parser.add_argument('--statements', type=int, default=20,
+                        help='statements per function')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--repeat', type=int, default=3,
+                        help='runs per benchmark, the fastest one counts')
+    parser.add_argument('-O', '--optimize', action='store_true',
+                        help='compile with all the optimizations on')
+    parser.add_argument('--corpus-dir',
+                        help='keep the generated corpus in this dir')
+    parser.add_argument('--output', help='write the results json here')
+    parser.add_argument('--baseline', default=BASELINE,
+                        help='results json to compare against')
+    parser.add_argument('--threshold', type=float, default=0.2,
+                        help='fail when a throughput relative to the '
+                             'reference speed drops by more than this '
+                             'fraction of the baseline')
+    parser.add_argument('--update-baseline', action='store_true',
+                        help='store the results as the new baseline')
+    return parser.parse_args(argv)
+
+
+def run_isolated(name, args, switches=None):
+    """
+    run a benchmark in a fresh interpreter, so its peak rss is its own - a
+    forked worker would start with the memory of this process
+    :param name: benchmark name in harness.BENCHMARKS
+    :param args: its json serializable arguments
+    :param switches: CompileOptions switches to pass it, None if it takes
+    no options
+    :return: the benchmark's result dict
+    """
+    request = {'benchmark': name, 'args': args, 'options': switches}
+    completed = subprocess.run(
+        [sys.executable, '-m', 'benchmark.harness'], cwd=COMPILER_DIR,
+        input=json.dumps(request), capture_output=True, text=True,
+        check=True)
+    return json.loads(completed.stdout)
+
+
+def run_benchmarks(dir_path, paths, repeat, switches):
+    """
+    :return: dict of benchmark name to its result dict, with the
+    throughputs relative to the reference speed
+    """
+    dir_path = os.path.abspath(dir_path)
+    paths = [os.path.abspath(path) for path in paths]
+    benchmarks = {
+        'reference': run_isolated('reference', [repeat]),
+        'tokenizer': run_isolated('tokenizer', [paths, repeat]),
+        'tokenizer_stream': run_isolated('tokenizer', [paths, repeat, True]),
+        'engine': run_isolated('engine', [paths, repeat], switches),
+        'end_to_end': run_isolated('end_to_end', [dir_path, repeat],
+                                   switches)}
+    add_relative(benchmarks)
+    return benchmarks
+
+
+def add_relative(benchmarks):
+    """
+    store every throughput relative to the reference speed, so results of
+    different machines compare
+    :param benchmarks: dict of benchmark name to its result dict
+    """
+    reference = benchmarks[REFERENCE[0]][REFERENCE[1]]
+    for name, metric in THROUGHPUT:
+        benchmarks[name][RELATIVE] = benchmarks[name][metric] / reference
+
+
+def regressions(results, baseline, threshold):
+    """
+    :return: list of messages, one per throughput below the baseline by
+    more than the threshold
+    """
+    messages = []
+    for name, metric in THROUGHPUT:
+        before = baseline['benchmarks'].get(name, {}).get(RELATIVE)
+        if not before:
+            continue
+        after = results['benchmarks'][name][RELATIVE]
+        if after < before * (1 - threshold):
+            messages.append(
+                '%s %s: %.3f of the reference, baseline %.3f (%+.1f%%)' % (
+                    name, metric, after, before,
+                    100.0 * (after / before - 1)))
+    return messages
+
+
+def main(argv):
+    args = parse_args(argv)
+    spec = corpus.CorpusSpec(args.classes, args.subroutines, args.locals,
+                             args.depth, args.string_length, args.statements,
+                             args.seed)
+    switches = {}
+    if args.optimize:
+        switches = dict(peephole=True, fold_constants=True,
+                        strength_reduce=True)
+    with tempfile.TemporaryDirectory() as temp_dir:
+        dir_path = args.corpus_dir or temp_dir
+        paths = corpus.generate_corpus(dir_path, spec)
+        benchmarks = run_benchmarks(dir_path, paths, args.repeat, switches)
+    results = {'spec': vars(spec), 'optimize': args.optimize,
+               'python': sys.version.split()[0], 'benchmarks': benchmarks}
+    text = json.dumps(results, indent=2, sort_keys=True)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(text + '\n')
+    print(text)
+
+    if args.update_baseline:
+        with open(args.baseline, 'w') as f:
+            f.write(text + '\n')
+        return 0
+    if not os.path.isfile(args.baseline):
+        return 0
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+    if baseline['spec'] != results['spec'] or \
+            baseline['optimize'] != results['optimize']:
+        sys.stderr.write('baseline was measured on a different corpus, '
+                         'not comparing\n')
+        return 0
+    messages = regressions(results, baseline, args.threshold)
+    for message in messages:
+        sys.stderr.write('regression: ' + message + '\n')
+    return 1 if messages else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,153 @@
+import os
+import random
+
+OPS = ['+', '-', '*', '/', '&', '|', '<', '>', '=']
+
+LETTERS = 'abcdefghijklmnopqrstuvwxyz ABCDEFGHIJKLMNOPQRSTUVWXYZ0123456789'
+
+LOCALS_PER_LINE = 8
+
+
+class CorpusSpec:
+    """
+    size knobs of a synthetic corpus
+    """
+
+    def __init__(self, classes=20, subroutines=20, locals_count=16,
+                 expression_depth=4, string_length=40, statements=20,
+                 seed=0):
+        """
+        :param classes: number of classes besides Main
+        :param subroutines: functions per class
+        :param locals_count: local variables per function
+        :param expression_depth: nesting depth of the generated expressions
+        :param string_length: length of the string constants
+        :param statements: statements per function body
+        :param seed: random seed, the same spec always generates the same
+        corpus
+        """
+        self.classes = classes
+        self.subroutines = subroutines
+        self.locals_count = locals_count
+        self.expression_depth = expression_depth
+        self.string_length = string_length
+        self.statements = statements
+        self.seed = seed
+
+
+class ClassGenerator:
+    """
+    Generates the Jack source of a single synthetic class. Every class has
+    a static array, and functions fN(a, b) that use locals, nested
+    expressions, array accesses, string constants, loops, branches and
+    calls to the other functions of the class.
+    """
+
+    def __init__(self, name, spec, rng):
+        """
+        :param name: class name
+        :param spec: CorpusSpec
+        :param rng: random.Random to draw from
+        """
+        self.name = name
+        self.spec = spec
+        self.rng = rng
+        self.local_names = ['v' + str(i) for i in range(spec.locals_count)]
+
+    def generate(self):
+        """
+        :return: jack source of the class
+        """
+        lines = ['class ' + self.name + ' {',
+                 '    static Array table;', '']
+        for index in range(self.spec.subroutines):
+            lines += self.function(index)
+        lines.append('}')
+        return '\n'.join(lines) + '\n'
+
+    def function(self, index):
+        lines = ['    function int f' + str(index) + '(int a, int b) {',
+                 '        var Array buf;', '        var String s;']
+        for start in range(0, len(self.local_names), LOCALS_PER_LINE):
+            lines.append('        var int ' + ', '.join(
+                self.local_names[start:start + LOCALS_PER_LINE]) + ';')
+        lines.append('        let buf = Array.new(16);')
+        for _ in range(self.spec.statements):
+            lines += self.statement(index, '        ')
+        lines += ['        do buf.dispose();',
+                  '        return ' + self.expression(1) + ';', '    }', '']
+        return lines
+
+    def statement(self, index, indent):
+        choice = self.rng.randrange(6)
+        if choice == 0:
+            return [indent + 'while (' + self.variable() + ' < ' +
+                    str(self.rng.randrange(100)) + ') {',
+                    indent + '    let ' + self.variable() + ' = ' +
+                    self.expression(self.spec.expression_depth) + ';',
+                    indent + '}']
+        if choice == 1:
+            return [indent + 'if (' + self.expression(2) + ') {',
+                    indent + '    let buf[' + self.expression(1) + '] = ' +
+                    self.expression(self.spec.expression_depth) + ';',
+                    indent + '} else {',
+                    indent + '    let s = ' + self.string() + ';',
+                    indent + '}']
+        if choice == 2 and index > 0:
+            return [indent + 'do ' + self.name + '.f' +
+                    str(self.rng.randrange(index)) + '(' +
+                    self.expression(2) + ', ' + self.expression(2) + ');']
+        if choice == 3:
+            return [indent + 'do Output.printString(' + self.string() + ');']
+        return [indent + 'let ' + self.variable() + ' = ' +
+                self.expression(self.spec.expression_depth) + ';']
+
+    def expression(self, depth):
+        if depth <= 0:
+            return self.term()
+        return '(' + self.expression(depth - 1) + ' ' + \
+            self.rng.choice(OPS) + ' ' + self.expression(depth - 1) + ')'
+
+    def term(self):
+        choice = self.rng.randrange(5)
+        if choice == 0:
+            return str(self.rng.randrange(32768))
+        if choice == 1:
+            return 'buf[' + self.variable() + ']'
+        if choice == 2:
+            return '-' + self.variable()
+        return self.variable()
+
+    def variable(self):
+        return self.rng.choice(self.local_names + ['a', 'b'])
+
+    def string(self):
+        return '"' + ''.join(self.rng.choice(LETTERS) for _ in
+                             range(self.spec.string_length)) + '"'
+
+
+def generate_corpus(dir_path, spec):
+    """
+    write a synthetic program - Main.jack and spec.classes other classes -
+    into a dir
+    :param dir_path: dir to write the .jack files to
+    :param spec: CorpusSpec
+    :return: list of the written file paths
+    """
+    os.makedirs(dir_path, exist_ok=True)
+    rng = random.Random(spec.seed)
+    paths = []
+    main_lines = ['class Main {', '    function void main() {']
+    for index in range(spec.classes):
+        name = 'Bench' + str(index)
+        path = os.path.join(dir_path, name + '.jack')
+        with open(path, 'w') as f:
+            f.write(ClassGenerator(name, spec, rng).generate())
+        paths.append(path)
+        main_lines.append('        do ' + name + '.f0(1, 2);')
+    main_lines += ['        return;', '    }', '}']
+    path = os.path.join(dir_path, 'Main.jack')
+    with open(path, 'w') as f:
+        f.write('\n'.join(main_lines) + '\n')
+    paths.append(path)
+    return paths
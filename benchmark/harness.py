@@ -0,0 +1,170 @@
+import io
+import json
+import os
+import resource
+import sys
+import time
+
+import CompilationEngine
+import JackTokenizer
+import Main
+
+NEW_LINE = '\n'
+
+# linux keeps ru_maxrss across fork and exec, so a child would report the
+# peak of its parent - the high water mark of its own memory is read here
+PROC_STATUS = '/proc/self/status'
+PEAK_RSS_FIELD = 'VmHWM:'
+
+REFERENCE_UNITS = 500000  # iterations of the reference loop
+
+
+def peak_rss_kb():
+    """
+    :return: peak resident set size of this process, in KB
+    """
+    try:
+        with open(PROC_STATUS) as f:
+            for line in f:
+                if line.startswith(PEAK_RSS_FIELD):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+def best_time(run, repeat):
+    """
+    :param run: callable to time, returns a count of processed units
+    :param repeat: how many times to run it
+    :return: fastest wall time in seconds, units of the last run
+    """
+    best = None
+    units = 0
+    for _ in range(repeat):
+        start = time.perf_counter()
+        units = run()
+        elapsed = time.perf_counter() - start
+        if best is None or elapsed < best:
+            best = elapsed
+    return best, units
+
+
+def reference_work():
+    """
+    fixed pure python work that runs no compiler code - string formatting
+    and dict updates, like the symbol lookups of the compiler
+    :return: number of units done
+    """
+    counts = {}
+    for i in range(REFERENCE_UNITS):
+        name = 'v%d' % (i & 1023)
+        counts[name] = counts.get(name, 0) + 1
+    return sum(counts.values())
+
+
+def bench_reference(repeat):
+    """
+    speed of the machine - the throughputs are compared relative to it, so
+    a baseline holds on other machines too
+    """
+    seconds, units = best_time(reference_work, repeat)
+    return {'seconds': seconds, 'units': units,
+            'units_per_sec': units / seconds, 'peak_rss_kb': peak_rss_kb()}
+
+
+def tokenize_files(paths, tokenizer_class=JackTokenizer.JackTokenizer):
+    """
+    :param tokenizer_class: JackTokenizer or StreamTokenizer
+    :return: number of tokens in the files
+    """
+    tokens = 0
+    for path in paths:
+        tokenizer = tokenizer_class(path)
+        while tokenizer.has_more_tokens():
+            tokenizer.advance()
+            tokens += 1
+    return tokens
+
+
+def bench_tokenizer(paths, repeat, stream=False):
+    """
+    JackTokenizer alone - read, split and walk every token
+    """
+    tokenizer_class = JackTokenizer.StreamTokenizer if stream else \
+        JackTokenizer.JackTokenizer
+    seconds, tokens = best_time(
+        lambda: tokenize_files(paths, tokenizer_class), repeat)
+    return {'seconds': seconds, 'tokens': tokens,
+            'tokens_per_sec': tokens / seconds, 'peak_rss_kb': peak_rss_kb()}
+
+
+def compile_in_memory(paths, options):
+    """
+    :return: seconds spent in the engines only, number of vm lines
+    """
+    outputs = [io.StringIO() for _ in paths]
+    engines = [CompilationEngine.CompilationEngine(path, output, options)
+               for path, output in zip(paths, outputs)]
+    start = time.perf_counter()
+    for engine in engines:
+        engine.compile_class()
+        engine.write_class_to_file()
+    elapsed = time.perf_counter() - start
+    return elapsed, sum(output.getvalue().count(NEW_LINE) + 1
+                        for output in outputs)
+
+
+def bench_engine(paths, repeat, options=None):
+    """
+    CompilationEngine alone - the files are tokenized before the clock
+    starts, and the vm code goes to memory
+    """
+    runs = [compile_in_memory(paths, options) for _ in range(repeat)]
+    seconds, lines = min(runs)
+    return {'seconds': seconds, 'vm_lines': lines,
+            'lines_per_sec': lines / seconds, 'peak_rss_kb': peak_rss_kb()}
+
+
+def bench_end_to_end(dir_path, repeat, options=None):
+    """
+    Main.translate_files on the whole dir, without the build cache
+    """
+    def run():
+        errors = Main.translate_files(dir_path, options=options)
+        if errors:
+            raise RuntimeError(errors)
+        lines = 0
+        for file_name in os.listdir(dir_path):
+            if file_name.endswith(Main.VM):
+                with open(os.path.join(dir_path, file_name)) as f:
+                    lines += f.read().count(NEW_LINE) + 1
+        return lines
+
+    seconds, lines = best_time(run, repeat)
+    return {'seconds': seconds, 'vm_lines': lines,
+            'lines_per_sec': lines / seconds, 'peak_rss_kb': peak_rss_kb()}
+
+
+# harnesses python -m benchmark runs in a fresh process, by name
+BENCHMARKS = {'reference': bench_reference,
+              'tokenizer': bench_tokenizer,
+              'engine': bench_engine,
+              'end_to_end': bench_end_to_end}
+
+
+def main():
+    """
+    run one benchmark in this process, for python -m benchmark - reads
+    {"benchmark": name, "args": [...], "options": switches or null} as json
+    from stdin and writes the result dict as json to stdout
+    """
+    request = json.load(sys.stdin)
+    args = request['args']
+    if request.get('options') is not None:
+        args.append(CompilationEngine.CompileOptions(**request['options']))
+    json.dump(BENCHMARKS[request['benchmark']](*args), sys.stdout)
+
+
+if __name__ == '__main__':
+    main()
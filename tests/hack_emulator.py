@@ -0,0 +1,110 @@
+"""
+Hack assembler and CPU emulator for the tests. A write to OUTPUT_ADDRESS
+prints the char written, a write to HALT_ADDRESS stops the program - the
+jack_os Sys.init and Output.printChar use them.
+"""
+from vm_emulator import word
+
+OUTPUT_ADDRESS = 32000
+HALT_ADDRESS = 32001
+
+predefined_dict = {'SP': 0, 'LCL': 1, 'ARG': 2, 'THIS': 3, 'THAT': 4,
+                   'SCREEN': 16384, 'KBD': 24576}
+predefined_dict.update(('R%d' % index, index) for index in range(16))
+
+FIRST_VARIABLE = 16
+
+comp_dict = {
+    '0': lambda a, d, m: 0, '1': lambda a, d, m: 1, '-1': lambda a, d, m: -1,
+    'D': lambda a, d, m: d, 'A': lambda a, d, m: a, 'M': lambda a, d, m: m,
+    '!D': lambda a, d, m: ~d, '!A': lambda a, d, m: ~a,
+    '!M': lambda a, d, m: ~m,
+    '-D': lambda a, d, m: -d, '-A': lambda a, d, m: -a,
+    '-M': lambda a, d, m: -m,
+    'D+1': lambda a, d, m: d + 1, 'A+1': lambda a, d, m: a + 1,
+    'M+1': lambda a, d, m: m + 1,
+    'D-1': lambda a, d, m: d - 1, 'A-1': lambda a, d, m: a - 1,
+    'M-1': lambda a, d, m: m - 1,
+    'D+A': lambda a, d, m: d + a, 'A+D': lambda a, d, m: d + a,
+    'D+M': lambda a, d, m: d + m, 'M+D': lambda a, d, m: d + m,
+    'D-A': lambda a, d, m: d - a, 'D-M': lambda a, d, m: d - m,
+    'A-D': lambda a, d, m: a - d, 'M-D': lambda a, d, m: m - d,
+    'D&A': lambda a, d, m: d & a, 'D&M': lambda a, d, m: d & m,
+    'D|A': lambda a, d, m: d | a, 'D|M': lambda a, d, m: d | m}
+
+jump_dict = {'': lambda value: False, 'JMP': lambda value: True,
+             'JEQ': lambda value: value == 0, 'JNE': lambda value: value != 0,
+             'JGT': lambda value: value > 0, 'JLT': lambda value: value < 0,
+             'JGE': lambda value: value >= 0, 'JLE': lambda value: value <= 0}
+
+
+def assemble(asm_code):
+    """
+    :param asm_code: Hack assembly program
+    :return: list of instructions - an int for an A instruction, a tuple of
+    (dest A, dest D, dest M, reads M, comp, jump) for a C instruction
+    """
+    symbols = dict(predefined_dict)
+    lines = []
+    for line in asm_code.split('\n'):
+        line = line.split('//', 1)[0].strip()
+        if not line:
+            continue
+        if line.startswith('('):
+            label = line[1:-1]
+            if label in symbols:
+                raise ValueError('label %s defined twice' % label)
+            symbols[label] = len(lines)
+        else:
+            lines.append(line)
+    variable = FIRST_VARIABLE
+    instructions = []
+    for line in lines:
+        if line.startswith('@'):
+            value = line[1:]
+            if not value.isdigit():
+                if value not in symbols:
+                    symbols[value] = variable
+                    variable += 1
+                value = symbols[value]
+            instructions.append(int(value))
+            continue
+        dest, comp = '', line
+        if '=' in line:
+            dest, comp = line.split('=', 1)
+        comp, _, jump = comp.partition(';')
+        instructions.append(('A' in dest, 'D' in dest, 'M' in dest,
+                             'M' in comp, comp_dict[comp], jump_dict[jump]))
+    return instructions
+
+
+def run(asm_code, max_steps=10 ** 8):
+    """
+    :param asm_code: Hack assembly program
+    :param max_steps: instructions to run before giving up on the program
+    :return: everything the program printed, instructions it ran
+    """
+    instructions = assemble(asm_code)
+    ram = [0] * (1 << 15)
+    a = d = pc = 0
+    output = []
+    for step in range(max_steps):
+        instruction = instructions[pc]
+        if isinstance(instruction, int):
+            a = instruction
+            pc += 1
+            continue
+        dest_a, dest_d, dest_m, reads_m, comp, jump = instruction
+        value = word(comp(a, d, ram[a] if reads_m else 0))
+        if dest_m:
+            ram[a] = value
+            if a == OUTPUT_ADDRESS:
+                output.append(chr(value))
+            elif a == HALT_ADDRESS:
+                return ''.join(output), step + 1
+        pc = a if jump(value) else pc + 1
+        if dest_a:
+            a = value
+        if dest_d:
+            d = value
+    raise RuntimeError('program did not halt')
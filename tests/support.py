@@ -0,0 +1,153 @@
+"""
+Helpers shared by the tests: the sample programs, compiling them in memory
+or through a command line build, and running the result.
+"""
+import os
+import shutil
+
+import CompilationEngine
+import Main
+import hack_emulator
+import vm_emulator
+
+TESTS_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_DIR = os.path.dirname(TESTS_DIR)
+PROGRAMS_DIR = os.path.join(TESTS_DIR, 'programs')
+JACK_OS_DIR = os.path.join(TESTS_DIR, 'jack_os')
+
+JACK = '.jack'
+
+PROGRAMS = sorted(os.listdir(PROGRAMS_DIR))
+
+ALL_OPTIMIZATIONS = dict(peephole=True, fold_constants=True,
+                         strength_reduce=True, branch_layout=True,
+                         array_access=True)
+
+# CompileOptions switches worth checking one by one and all together
+OPTION_SETS = {'default': {},
+               'peephole': dict(peephole=True),
+               'fold': dict(fold_constants=True),
+               'strength': dict(strength_reduce=True),
+               'branch': dict(branch_layout=True),
+               'array': dict(array_access=True),
+               'pool': dict(pool_strings=True),
+               'optimize': ALL_OPTIMIZATIONS}
+
+
+def options(**switches):
+    """
+    :return: CompileOptions with the given switches
+    """
+    return CompilationEngine.CompileOptions(**switches)
+
+
+def program_sources(program, dir_path=PROGRAMS_DIR):
+    """
+    :param program: name of a program dir
+    :param dir_path: dir holding the program dirs
+    :return: dict of class name -> jack code of the program
+    """
+    program_dir = os.path.join(dir_path, program)
+    sources = {}
+    for file_name in sorted(os.listdir(program_dir)):
+        class_name, extension = os.path.splitext(file_name)
+        if extension == JACK:
+            with open(os.path.join(program_dir, file_name)) as f:
+                sources[class_name] = f.read()
+    return sources
+
+
+def compile_sources(sources, compile_options=None):
+    """
+    :param sources: dict of class name -> jack code
+    :param compile_options: CompileOptions, None for the defaults
+    :return: dict of class name -> vm code
+    """
+    return dict((class_name, Main.compile_source(source, compile_options))
+                for class_name, source in sources.items())
+
+
+def run_vm(vm_codes):
+    """
+    :param vm_codes: dict of class name -> vm code of a program
+    :return: what the program prints
+    """
+    return vm_emulator.VMEmulator(vm_codes.values()).run()
+
+
+def run_sources(sources, compile_options=None):
+    """
+    :return: what the program of the sources prints once compiled
+    """
+    return run_vm(compile_sources(sources, compile_options))
+
+
+def run_program(program, compile_options=None):
+    """
+    :return: what a sample program prints once compiled
+    """
+    return run_sources(program_sources(program), compile_options)
+
+
+def write_sources(dir_path, sources):
+    """
+    :param dir_path: dir to write the jack files to, made if missing
+    :param sources: dict of class name -> jack code
+    """
+    os.makedirs(dir_path, exist_ok=True)
+    for class_name, source in sources.items():
+        with open(os.path.join(dir_path, class_name + JACK), 'w') as f:
+            f.write(source)
+
+
+def copy_program(program, dir_path):
+    """
+    copy the jack files of a sample program into dir_path
+    :return: dir_path
+    """
+    write_sources(dir_path, program_sources(program))
+    return dir_path
+
+
+def build(argv):
+    """
+    run a command line build
+    :param argv: command line arguments without the program name
+    :return: list of (file path, error message), report lines
+    """
+    return Main.build(Main.parse_args(argv))
+
+
+def read_vm_files(dir_path):
+    """
+    :return: dict of class name -> vm code of the vm files in dir_path
+    """
+    vm_codes = {}
+    for file_name in sorted(os.listdir(dir_path)):
+        class_name, extension = os.path.splitext(file_name)
+        if extension == Main.VM:
+            with open(os.path.join(dir_path, file_name)) as f:
+                vm_codes[class_name] = f.read()
+    return vm_codes
+
+
+def copy_jack_os(dir_path):
+    """
+    copy the jack_os classes, that run on the Hack emulator, into dir_path
+    """
+    for file_name in os.listdir(JACK_OS_DIR):
+        shutil.copy(os.path.join(JACK_OS_DIR, file_name), dir_path)
+
+
+def run_asm(program_dir, *argv):
+    """
+    build a program with the jack_os classes as Hack assembly and run it
+    :param program_dir: dir of the jack files of the program
+    :param argv: more command line arguments of the build
+    :return: what the program prints, instructions it ran
+    """
+    copy_jack_os(program_dir)
+    errors, report = build([program_dir, '--target', 'asm'] + list(argv))
+    assert errors == []
+    with open(Main.asm_path(program_dir, program_dir)) as f:
+        return hack_emulator.run(f.read())
@@ -0,0 +1,91 @@
+import os
+
+import pytest
+
+import AsmWriter
+import support
+
+
+@pytest.mark.parametrize('optimize', [False, True])
+@pytest.mark.parametrize('program', support.PROGRAMS)
+def test_asm_program_prints_like_the_vm_code(program, optimize, tmp_path):
+    dir_path = support.copy_program(program, str(tmp_path / program))
+    argv = ['-O'] if optimize else []
+    output, steps = support.run_asm(dir_path, *argv)
+    assert output == support.run_program(program)
+
+
+def test_asm_is_written_once_per_dir(tmp_path):
+    dir_path = support.copy_program('points', str(tmp_path / 'points'))
+    support.copy_jack_os(dir_path)
+    out_dir = str(tmp_path / 'out')
+    errors, report = support.build([dir_path, '--target', 'asm',
+                                    '--out-dir', out_dir])
+    assert errors == []
+    assert os.listdir(out_dir) == ['points' + AsmWriter.ASM]
+    assert not any(name.endswith('.vm') for name in os.listdir(dir_path))
+
+
+def test_asm_is_not_written_on_errors(tmp_path):
+    dir_path = str(tmp_path / 'bad')
+    support.write_sources(dir_path, {'Main': 'class Main { let }'})
+    errors, report = support.build([dir_path, '--target', 'asm'])
+    assert len(errors) == 1
+    assert not os.path.exists(os.path.join(dir_path, 'bad' + AsmWriter.ASM))
+
+
+def test_asm_translates_the_vm_files_of_the_dir(tmp_path):
+    dir_path = support.copy_program('lists', str(tmp_path / 'lists'))
+    vm_codes = support.compile_sources(support.program_sources('lists'))
+    os.remove(os.path.join(dir_path, 'List.jack'))
+    with open(os.path.join(dir_path, 'List.vm'), 'w') as f:
+        f.write(vm_codes['List'])
+    output, steps = support.run_asm(dir_path)
+    assert output == support.run_program('lists')
+
+
+def test_translator_commands():
+    translator = AsmWriter.AsmTranslator()
+    lines = translator.translate_all(AsmWriter.parse_vm(
+        'function Main.f 0\npush constant 7\nreturn'))
+    assert lines[0] == '(Main.f)'
+    assert '@7' in lines
+
+
+EXTREMES = '''class Main {
+    function void main() {
+        var Array a;
+        var int i, j;
+        let a = Array.new(7);
+        let a[0] = -32767 - 1;
+        let a[1] = -20000;
+        let a[2] = -1;
+        let a[3] = 0;
+        let a[4] = 1;
+        let a[5] = 20000;
+        let a[6] = 32767;
+        let i = 0;
+        while (i < 7) {
+            let j = 0;
+            while (j < 7) {
+                if (a[i] > a[j]) { do Output.printChar(71); }
+                if (a[i] < a[j]) { do Output.printChar(76); }
+                if (a[i] = a[j]) { do Output.printChar(69); }
+                let j = j + 1;
+            }
+            let i = i + 1;
+        }
+        return;
+    }
+}
+'''
+
+
+def test_comparisons_of_extreme_values(tmp_path):
+    # x - y overflows for operands of different signs
+    expected = support.run_sources({'Main': EXTREMES})
+    assert expected[:7] == 'ELLLLLL' and expected[-7:] == 'GGGGGGE'
+    dir_path = str(tmp_path / 'extremes')
+    support.write_sources(dir_path, {'Main': EXTREMES})
+    output, steps = support.run_asm(dir_path)
+    assert output == expected
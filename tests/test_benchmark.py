@@ -0,0 +1,59 @@
+import os
+
+from benchmark import __main__ as benchmark_main
+from benchmark import corpus, harness
+
+SPEC = corpus.CorpusSpec(2, 3, 4, 2, 8, 5, 7)
+
+
+def results(relative):
+    return {'benchmarks': dict((name, {benchmark_main.RELATIVE: relative})
+                               for name, metric in benchmark_main.THROUGHPUT)}
+
+
+def test_corpus_is_reproducible_and_compiles(tmp_path):
+    first = corpus.generate_corpus(str(tmp_path / 'first'), SPEC)
+    second = corpus.generate_corpus(str(tmp_path / 'second'), SPEC)
+    assert [os.path.basename(path) for path in first] == \
+        [os.path.basename(path) for path in second]
+    for first_path, second_path in zip(first, second):
+        with open(first_path) as f, open(second_path) as g:
+            assert f.read() == g.read()
+    assert harness.bench_end_to_end(str(tmp_path / 'first'), 1)['vm_lines'] > 0
+
+
+def test_tokenizer_benchmarks_count_the_same_tokens(tmp_path):
+    paths = corpus.generate_corpus(str(tmp_path), SPEC)
+    plain = harness.bench_tokenizer(paths, 1)
+    stream = harness.bench_tokenizer(paths, 1, True)
+    assert plain['tokens'] == stream['tokens'] > 0
+
+
+def test_throughputs_are_relative_to_the_reference():
+    benchmarks = dict((name, {metric: 300.0})
+                      for name, metric in benchmark_main.THROUGHPUT)
+    benchmarks['reference'] = {'units_per_sec': 1000.0}
+    benchmark_main.add_relative(benchmarks)
+    assert all(benchmarks[name][benchmark_main.RELATIVE] == 0.3
+               for name, metric in benchmark_main.THROUGHPUT)
+
+
+def test_isolated_peak_rss_is_the_childs_own(tmp_path):
+    paths = corpus.generate_corpus(str(tmp_path), SPEC)
+    # the child must not report the memory this process holds
+    ballast = b'x' * (256 * 1024 * 1024)
+    result = benchmark_main.run_isolated('tokenizer', [paths, 1])
+    assert result['tokens'] == harness.bench_tokenizer(paths, 1)['tokens']
+    assert 0 < result['peak_rss_kb'] < len(ballast) // 1024 // 2
+
+
+def test_regressions_against_the_baseline():
+    baseline = results(1.0)
+    assert benchmark_main.regressions(results(0.9), baseline, 0.2) == []
+    messages = benchmark_main.regressions(results(0.7), baseline, 0.2)
+    assert len(messages) == len(benchmark_main.THROUGHPUT)
+    assert messages[0].startswith('tokenizer tokens_per_sec: 0.700')
+    # a benchmark the baseline does not have is not compared
+    del baseline['benchmarks']['tokenizer_stream']
+    assert len(benchmark_main.regressions(results(0.7), baseline, 0.2)) \
+        == len(benchmark_main.THROUGHPUT) - 1
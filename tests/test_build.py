@@ -0,0 +1,228 @@
+import os
+import shutil
+
+import BuildCache
+import Main
+import VMBundle
+import WholeProgram
+import support
+
+
+def test_parallel_build_matches_serial(tmp_path):
+    serial = support.copy_program('lists', str(tmp_path / 'serial'))
+    parallel = support.copy_program('lists', str(tmp_path / 'parallel'))
+    assert support.build([serial, '--no-cache'])[0] == []
+    assert support.build([parallel, '-j', '2', '--no-cache'])[0] == []
+    assert support.read_vm_files(parallel) == support.read_vm_files(serial)
+    assert support.read_vm_files(serial) == support.compile_sources(
+        support.program_sources('lists'))
+
+
+def test_parallel_build_reports_every_failure(tmp_path):
+    dir_path = support.copy_program('points', str(tmp_path))
+    support.write_sources(dir_path, {'Bad': 'class Bad { let }',
+                                     'Worse': 'class Worse {'})
+    errors, report = support.build([dir_path, '-j', '2', '--no-cache'])
+    assert sorted(os.path.basename(path) for path, error in errors) == \
+        ['Bad.jack', 'Worse.jack']
+    assert os.path.isfile(os.path.join(dir_path, 'Point.vm'))
+
+
+def test_cache_hits_and_misses(tmp_path):
+    dir_path = support.copy_program('points', str(tmp_path))
+    errors, report = support.build([dir_path, '--cache-stats'])
+    assert 'cache: 0 hits (0 restored), 2 misses' in report
+    errors, report = support.build([dir_path, '--cache-stats'])
+    assert 'cache: 2 hits (0 restored), 0 misses' in report
+
+    # an edited file is compiled again, the other one is not
+    point_path = os.path.join(dir_path, 'Point.jack')
+    with open(point_path, 'a') as f:
+        f.write('// edited\n')
+    errors, report = support.build([dir_path, '--cache-stats'])
+    assert 'cache: 1 hits (0 restored), 1 misses' in report
+
+    # other options give other output
+    errors, report = support.build([dir_path, '--cache-stats', '-O'])
+    assert 'cache: 0 hits (0 restored), 2 misses' in report
+    assert support.read_vm_files(dir_path)['Main'] == Main.compile_source(
+        support.program_sources('points')['Main'],
+        support.options(**support.ALL_OPTIMIZATIONS))
+
+    # going back restores the outputs from their blobs, without compiling
+    errors, report = support.build([dir_path, '--cache-stats'])
+    assert 'cache: 2 hits (2 restored), 0 misses' in report
+
+    # and so is a deleted output
+    os.remove(os.path.join(dir_path, 'Main.vm'))
+    errors, report = support.build([dir_path, '--cache-stats'])
+    assert 'cache: 2 hits (1 restored), 0 misses' in report
+    assert support.read_vm_files(dir_path) == support.compile_sources(
+        support.program_sources('points'))
+
+
+def test_cache_is_cleared_and_skipped(tmp_path):
+    dir_path = support.copy_program('points', str(tmp_path))
+    support.build([dir_path])
+    cache_dir = os.path.join(dir_path, BuildCache.CACHE_DIR)
+    assert os.path.isfile(os.path.join(cache_dir, BuildCache.MANIFEST))
+    errors, report = support.build([dir_path, '--clear-cache',
+                                    '--cache-stats'])
+    assert 'cache: 0 hits (0 restored), 2 misses' in report
+    errors, report = support.build([dir_path, '--no-cache',
+                                    '--cache-stats'])
+    assert 'cache: 0 hits (0 restored), 0 misses' in report
+
+
+def test_failed_file_is_not_cached(tmp_path):
+    dir_path = str(tmp_path)
+    support.write_sources(dir_path, {'Bad': 'class Bad { let }'})
+    for _ in range(2):
+        errors, report = support.build([dir_path, '--cache-stats'])
+        assert len(errors) == 1
+        assert 'cache: 0 hits (0 restored), 1 misses' in report
+
+
+def test_many_roots_globs_and_out_dir(tmp_path):
+    tree = tmp_path / 'tree'
+    support.copy_program('points', str(tree / 'a'))
+    support.copy_program('lists', str(tree / 'b' / 'deep'))
+    support.write_sources(str(tree / '.hidden'), {'Skip': 'class Skip {}'})
+    single = support.copy_program('numbers', str(tmp_path / 'single'))
+    out_dir = str(tmp_path / 'out')
+    errors, report = support.build([str(tree), '--out-dir', out_dir])
+    assert errors == []
+    assert support.read_vm_files(os.path.join(out_dir, 'a')) == \
+        support.compile_sources(support.program_sources('points'))
+    assert support.read_vm_files(os.path.join(out_dir, 'b', 'deep')) == \
+        support.compile_sources(support.program_sources('lists'))
+    assert not os.path.exists(os.path.join(out_dir, '.hidden'))
+    assert not any(name.endswith(Main.VM)
+                   for name in os.listdir(str(tree / 'a')))
+
+    errors, report = support.build([str(tree / '*' / 'deep' / 'L*.jack'),
+                                    os.path.join(single, 'Main.jack'),
+                                    str(tmp_path / 'missing')])
+    assert errors == [(str(tmp_path / 'missing'), 'no such file or dir')]
+    assert os.path.isfile(str(tree / 'b' / 'deep' / 'List.vm'))
+    assert not os.path.isfile(str(tree / 'b' / 'deep' / 'Main.vm'))
+    assert os.path.isfile(os.path.join(single, 'Main.vm'))
+    assert report[-1].startswith('2 files in 2 dirs')
+
+
+def test_bundle_holds_every_class(tmp_path):
+    dir_path = support.copy_program('lists', str(tmp_path))
+    errors, report = support.build([dir_path, '--bundle', 'all.vm'])
+    assert errors == []
+    bundle_path = os.path.join(dir_path, 'all.vm')
+    with open(bundle_path) as f:
+        lines = f.read().split('\n')
+    expected = support.compile_sources(support.program_sources('lists'))
+    index = VMBundle.read_index(bundle_path)
+    assert [class_name for class_name, first, count in index] == \
+        sorted(expected)
+    for class_name, first, count in index:
+        assert '\n'.join(lines[first - 1:first - 1 + count]) == \
+            expected[class_name]
+    assert support.run_vm(dict(
+        (class_name, '\n'.join(lines[first - 1:first - 1 + count]))
+        for class_name, first, count in index)) == \
+        support.run_program('lists')
+
+
+def test_bundle_is_not_written_on_errors(tmp_path):
+    dir_path = support.copy_program('lists', str(tmp_path))
+    support.write_sources(dir_path, {'Bad': 'class Bad { let }'})
+    errors, report = support.build([dir_path, '--bundle', 'all.vm'])
+    assert len(errors) == 1
+    assert not os.path.exists(os.path.join(dir_path, 'all.vm'))
+
+
+def test_whole_program_removes_unreachable_subroutines(tmp_path):
+    dir_path = support.copy_program('points', str(tmp_path))
+    errors, report = support.build([dir_path, '--whole-program',
+                                    '--no-inline'])
+    assert errors == []
+    assert 'removed unreachable Main.reallyUnused' in report
+    assert 'removed unreachable Point.seven' in report
+    assert 'removed unreachable Main.unused' not in report
+    vm_codes = support.read_vm_files(dir_path)
+    assert 'function Main.reallyUnused' not in vm_codes['Main']
+    assert support.run_vm(vm_codes) == support.run_program('points')
+
+
+def test_whole_program_keeps_a_library_whole(tmp_path):
+    dir_path = str(tmp_path)
+    sources = support.program_sources('points')
+    support.write_sources(dir_path, {'Point': sources['Point']})
+    errors, report = support.build([dir_path, '--whole-program',
+                                    '--no-inline'])
+    assert errors == []
+    assert not any(line.startswith('removed') for line in report)
+    assert support.read_vm_files(dir_path) == support.compile_sources(
+        {'Point': sources['Point']})
+
+
+def test_inlining_keeps_behaviour(tmp_path):
+    for program in ('inline', 'points', 'arrays'):
+        dir_path = support.copy_program(program, str(tmp_path / program))
+        errors, report = support.build([dir_path, '--whole-program'])
+        assert errors == []
+        vm_codes = support.read_vm_files(dir_path)
+        assert support.run_vm(vm_codes) == support.run_program(program)
+    inlined = support.read_vm_files(str(tmp_path / 'inline'))['Main']
+    assert 'call Box.getV' not in inlined
+    assert 'call Box.id' not in inlined
+    # a call with a side effect in its arguments is kept
+    assert 'call Main.side' in inlined
+
+
+def test_inline_table_comes_from_the_parse(tmp_path):
+    dir_path = support.copy_program('inline', str(tmp_path))
+    support.write_sources(dir_path, {'Bad': 'class Bad { let }'})
+    box, bad = WholeProgram.parse_classes(
+        [os.path.join(dir_path, 'Box.jack'), os.path.join(dir_path,
+                                                          'Bad.jack')])
+    # a class that does not parse is left to the compilation to report
+    assert bad is None
+    table = WholeProgram.inline_bodies(box)
+    assert sorted(table) == ['Box.bump', 'Box.getV', 'Box.getW', 'Box.id',
+                             'Box.made', 'Box.setW', 'Box.yes']
+    assert table['Box.getW'] == (1, [('pop', 'pointer', 1),
+                                     ('push', 'that', 1)], None)
+    assert table['Box.made'] == (0, [('push', 'static', 0)], 'Box')
+    assert table['Box.id'] == (1, [], None)
+
+
+def test_whole_program_ast_build_matches(tmp_path):
+    plain = support.copy_program('inline', str(tmp_path / 'plain'))
+    ast = support.copy_program('inline', str(tmp_path / 'ast'))
+    assert support.build([plain, '--whole-program'])[0] == []
+    assert support.build([ast, '--whole-program', '--ast', '-j', '2'])[0] \
+        == []
+    assert support.read_vm_files(ast) == support.read_vm_files(plain)
+
+
+def test_inlined_calls_run_fewer_calls(tmp_path):
+    dir_path = support.copy_program('inline', str(tmp_path / 'inlined'))
+    support.build([dir_path, '--whole-program'])
+    inlined = support.vm_emulator.VMEmulator(
+        support.read_vm_files(dir_path).values())
+    plain = support.vm_emulator.VMEmulator(support.compile_sources(
+        support.program_sources('inline')).values())
+    assert inlined.run() == plain.run()
+    assert inlined.calls < plain.calls
+
+
+def test_parse_only_writes_nothing(tmp_path):
+    dir_path = support.copy_program('points', str(tmp_path))
+    errors, report = support.build([dir_path, '--parse-only'])
+    assert errors == []
+    assert support.read_vm_files(dir_path) == {}
+    shutil.copy(os.path.join(dir_path, 'Point.jack'),
+                os.path.join(dir_path, 'Copy.jack'))
+    with open(os.path.join(dir_path, 'Copy.jack'), 'a') as f:
+        f.write('class')
+    errors, report = support.build([dir_path, '--parse-only', '--ast'])
+    assert [os.path.basename(path) for path, error in errors] == \
+        ['Copy.jack']
@@ -0,0 +1,172 @@
+import io
+import subprocess
+import sys
+
+import pytest
+
+import CompilationEngine
+import JackTokenizer
+import Main
+import SymbolTable
+import VMWriter
+import support
+from benchmark import corpus
+
+BIG_SPEC = corpus.CorpusSpec(1, 40, 16, 4, 20, 20, 0)
+SMALL_SPEC = corpus.CorpusSpec(2, 6, 8, 3, 10, 10, 1)
+
+
+@pytest.mark.parametrize('switches', sorted(support.OPTION_SETS))
+@pytest.mark.parametrize('program', support.PROGRAMS)
+def test_ast_and_stream_compile_the_same_code(program, switches):
+    sources = support.program_sources(program)
+    expected = support.compile_sources(
+        sources, support.options(**support.OPTION_SETS[switches]))
+    for mode in (dict(ast=True), dict(stream=True),
+                 dict(ast=True, stream=True)):
+        compile_options = support.options(
+            **dict(support.OPTION_SETS[switches], **mode))
+        assert support.compile_sources(sources, compile_options) == expected
+
+
+def test_ast_compiles_a_generated_corpus_the_same(tmp_path):
+    for path in corpus.generate_corpus(str(tmp_path), SMALL_SPEC):
+        with open(path) as f:
+            source = f.read()
+        for switches in support.OPTION_SETS.values():
+            assert Main.compile_source(source, support.options(
+                ast=True, **switches)) == Main.compile_source(
+                source, support.options(**switches))
+
+
+def test_writer_sinks_get_the_same_text(tmp_path):
+    path = corpus.generate_corpus(str(tmp_path), BIG_SPEC)[0]
+    with open(path) as f:
+        source = f.read()
+    chunks = []
+    Main.compile_to(source, chunks.append)
+    stream = io.StringIO()
+    Main.compile_to(source, stream)
+    # a big class is written in several bulk writes of FLUSH_SIZE commands
+    assert len(chunks) > 1
+    assert ''.join(chunks) == stream.getvalue()
+    assert len(chunks[0].splitlines()) == VMWriter.FLUSH_SIZE
+    assert not stream.getvalue().endswith('\n')
+
+
+def test_writer_formats_commands():
+    chunks = []
+    writer = VMWriter.VMWriter(chunks.append)
+    writer.write_function('Main.f', 2)
+    writer.write_push('constant', 7)
+    writer.write_arithmetic('neg')
+    writer.start_capture()
+    writer.write_pop('local', 1)
+    captured = writer.end_capture()
+    writer.write_if('END')
+    writer.emit_all(captured)
+    writer.write_return()
+    writer.flush()
+    assert ''.join(chunks).split('\n') == [
+        'function Main.f 2', 'push constant 7', 'neg', 'if-goto END',
+        'pop local 1', 'return']
+
+
+def test_symbol_table_scopes():
+    table = SymbolTable.SymbolTable()
+    table.define('count', 'int', SymbolTable.STATIC)
+    table.define('x', 'int', SymbolTable.FIELD)
+    table.define('y', 'int', SymbolTable.FIELD)
+    table.start_subroutine()
+    table.define('this', 'Point', SymbolTable.ARG)
+    table.define('x', 'boolean', SymbolTable.ARG)
+    table.define('i', 'int', SymbolTable.VAR)
+    x = table.lookup('x')
+    assert (x.type, x.segment, x.index) == ('boolean', 'argument', 1)
+    assert (table.lookup('y').segment, table.lookup('y').index) == ('this', 1)
+    assert table.lookup('i').segment == 'local'
+    assert table.lookup('count').segment == 'static'
+    assert table.lookup('Point') is None
+    assert table.var_count(SymbolTable.FIELD) == 2
+    assert table.var_count(SymbolTable.VAR) == 1
+    table.end_subroutine()
+    assert table.lookup('x').segment == 'this'
+    assert table.lookup('i') is None
+    table.start_subroutine()
+    assert table.var_count(SymbolTable.ARG) == 0
+    assert table.define('j', 'int', SymbolTable.VAR).index == 0
+
+
+def test_compile_source_accepts_bytes_and_options():
+    source = support.program_sources('points')['Main']
+    assert Main.compile_source(source.encode('utf-8')) == \
+        Main.compile_source(source)
+    optimized = support.options(**support.ALL_OPTIMIZATIONS)
+    assert Main.compile_source(source, optimized) != \
+        Main.compile_source(source)
+
+
+LONG_CLASS = 'class Main {\n%s}\n' % ''.join(
+    'function void f%d() { do Output.printInt(%d); return; }\n' % (i, i)
+    for i in range(2000))
+
+
+def test_compile_source_lines():
+    source = support.program_sources('lists')['List']
+    assert list(Main.compile_source_lines(source)) == \
+        Main.compile_source(source).split('\n')
+    assert list(Main.compile_source_lines(LONG_CLASS)) == \
+        Main.compile_source(LONG_CLASS).split('\n')
+    optimized = support.options(ast=True, **support.ALL_OPTIMIZATIONS)
+    assert list(Main.compile_source_lines(LONG_CLASS, optimized)) == \
+        Main.compile_source(LONG_CLASS, optimized).split('\n')
+
+
+def test_compile_source_lines_is_lazy(monkeypatch):
+    compiled = []
+    compile_subroutine = CompilationEngine.CompilationEngine.compile_subroutine
+
+    def count_subroutine(engine):
+        compiled.append(engine.tokenizer.get_curr_token())
+        compile_subroutine(engine)
+
+    monkeypatch.setattr(CompilationEngine.CompilationEngine,
+                        'compile_subroutine', count_subroutine)
+    lines = Main.compile_source_lines(LONG_CLASS)
+    assert not compiled
+    assert next(lines) == 'function Main.f0 0'
+    # only up to the subroutine that filled the first bulk write
+    assert 0 < len(compiled) < 2000
+    lines.close()
+
+
+def test_compile_source_lines_raises_after_the_lines():
+    source = LONG_CLASS.replace('printInt(1999)', 'printInt(y)')
+    lines = Main.compile_source_lines(source)
+    assert next(lines) == 'function Main.f0 0'
+    with pytest.raises(JackTokenizer.JackSyntaxError) as error:
+        list(lines)
+    assert str(error.value) == "2001:44: undefined variable 'y'"
+
+
+def test_stdin_to_stdout():
+    source = support.program_sources('numbers')['Main']
+    completed = subprocess.run(
+        [sys.executable, 'Main.py', '-', '-O'], input=source,
+        capture_output=True, text=True, cwd=support.REPO_DIR)
+    assert completed.returncode == 0
+    assert completed.stdout == Main.compile_source(
+        source, Main.compile_options(Main.parse_args(['-', '-O'])))
+    completed = subprocess.run(
+        [sys.executable, 'Main.py', '-'], input='class Main { let',
+        capture_output=True, text=True, cwd=support.REPO_DIR)
+    assert completed.returncode == 1
+    assert completed.stdout == ''
+    assert completed.stderr.startswith('<stdin>:1:')
+
+
+def test_default_options_are_plain():
+    compile_options = CompilationEngine.CompileOptions()
+    assert not (compile_options.peephole or compile_options.ast or
+                compile_options.branch_layout)
+    assert compile_options.target == CompilationEngine.VM_TARGET
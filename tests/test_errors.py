@@ -0,0 +1,123 @@
+import os
+
+import pytest
+
+import CodeGenerator
+import JackParser
+import JackTokenizer
+import Main
+import support
+
+MODES = [dict(), dict(ast=True), dict(stream=True),
+         dict(fold_constants=True)]
+
+BAD_SOURCES = [
+    ('class Main { function void f() { var int x; let x = ; let x = 1 + ; '
+     'do g(; return; } }',
+     ["1:53: expected term, found ';'", "1:67: expected term, found ';'",
+      "1:74: expected term, found ';'"]),
+    ('class Main { function void f() { var int x; let x = 1 }',
+     ["1:55: expected ';', found '}'", '1:55: unexpected end of input']),
+    ('class Main { function void f( { } }',
+     ["1:33: expected parameter name, found '}'"]),
+    ('class Main { field int ; }',
+     ["1:24: expected variable name, found ';'"]),
+    ('class { }', ["1:7: expected class name, found '{'"]),
+    ('', ["1:1: expected 'class', found end of input"]),
+    ('class Main {\n  function void f() {\n    while (true) { let',
+     ['3:20: unexpected end of input']),
+    ('class Main { function void f() { var int x; let x = 1 +* 2; '
+     'return; } }', ["1:56: expected term, found '*'"]),
+    ('class Main { function void f() { var int x; let x = (1 + 2]; '
+     'return; } }', ["1:59: expected ')', found ']'"]),
+    ('class Main { function void f() { var int x; let x = (x; return; } }',
+     ["1:55: expected ')', found ';'"]),
+    ('class Main { function void f() { var int x; let x = (x + 1 return; '
+     '} }', ["1:60: expected ')', found 'return'"]),
+    ('class Main { function void f() { let y = 1; return; } }',
+     ["1:38: undefined variable 'y'"]),
+    ('class Main { function void f() { var int x; let x = y + z[1]; '
+     'let x = x[y]; return; } }',
+     ["1:53: undefined variable 'y'", "1:73: undefined variable 'y'"]),
+    ('class Main { function void f(int a, int b) { let a = b; return; } '
+     'function void g() { let a = 1; return; } }',
+     ["1:91: undefined variable 'a'"]),
+    ('class Main { function void f() { do g(1 2); do g(,1); do g(1,); '
+     'do 5; return; } }',
+     ["1:41: expected ')', found '2'", "1:50: expected term, found ','",
+      "1:62: expected term, found ')'",
+      "1:68: expected subroutine name, found '5'"]),
+    ('class Main { function void f(int a int b) { return; } }',
+     ["1:36: expected ')', found 'int'"]),
+]
+
+MANY_ERRORS = 'class Main { function void f() {\n%s  return;\n} }' % (
+    '  let = 1;\n' * 30)
+
+
+def compile_error(source, **switches):
+    """
+    :return: the message of the error compiling source raises
+    """
+    with pytest.raises(JackTokenizer.JackSyntaxError) as error:
+        Main.compile_source(source, support.options(**switches))
+    return JackTokenizer.error_message(error.value)
+
+
+@pytest.mark.parametrize('mode', range(len(MODES)))
+@pytest.mark.parametrize('source, diagnostics', BAD_SOURCES)
+def test_errors_are_positioned(source, diagnostics, mode):
+    assert compile_error(source, **MODES[mode]).split('\n') == diagnostics
+
+
+def test_parse_only_reports_the_same_errors():
+    for source, diagnostics in BAD_SOURCES:
+        with pytest.raises(JackTokenizer.JackSyntaxError) as error:
+            JackParser.parse_file(None, source)
+        assert str(error.value).split('\n') == diagnostics
+
+
+def test_errors_are_capped():
+    diagnostics = compile_error(MANY_ERRORS).split('\n')
+    assert len(diagnostics) == JackTokenizer.MAX_ERRORS
+    assert diagnostics[0] == "2:7: expected variable name, found '='"
+    assert diagnostics[-1].startswith('%d:7: ' % (JackTokenizer.MAX_ERRORS +
+                                                  1))
+    assert len(compile_error(MANY_ERRORS, max_errors=3).split('\n')) == 3
+    for mode in MODES:
+        assert compile_error(MANY_ERRORS, max_errors=1, **mode) == \
+            "2:7: expected variable name, found '='"
+
+
+@pytest.mark.parametrize('mode', range(len(MODES)))
+def test_every_truncated_class_terminates(mode):
+    source = support.program_sources('arrays')['Box']
+    for end in range(len(source)):
+        try:
+            Main.compile_source(source[:end], support.options(**MODES[mode]))
+        except JackTokenizer.JackSyntaxError as error:
+            assert error.diagnostics
+
+
+def test_build_reports_file_line_and_column(tmp_path, capsys):
+    dir_path = str(tmp_path)
+    support.write_sources(dir_path, {'Bad': BAD_SOURCES[1][0]})
+    errors, report = support.build([dir_path])
+    Main.print_build(errors, report)
+    bad_path = os.path.join(dir_path, 'Bad.jack')
+    assert capsys.readouterr().err.split('\n') == [
+        bad_path + ":1:55: expected ';', found '}'",
+        bad_path + ':1:55: unexpected end of input', '']
+
+
+def test_code_generator_reports_undefined_variables_at_the_name():
+    class_node = JackParser.parse_file(
+        None, 'class Main { function void f() { var int x;\n'
+              '  let x = x; return; } }')
+    let = class_node.subroutines[0].statements[0]
+    let.value.term.name = 'y'
+    generator = CodeGenerator.CodeGenerator([].append, file_path='Main.jack')
+    with pytest.raises(JackTokenizer.JackSyntaxError) as error:
+        generator.generate(class_node)
+    assert error.value.file_path == 'Main.jack'
+    assert str(error.value) == "2:11: undefined variable 'y'"
@@ -0,0 +1,217 @@
+import pytest
+
+import Main
+import Peephole
+import support
+
+FOLDED = '''class Main {
+    function void main() {
+        do Output.printInt(32767 + 1);
+        do Output.printInt(-32767 - 1 - 1);
+        do Output.printInt(200 * 200);
+        do Output.printInt(-7 / 2);
+        do Output.printInt(~(2 | 5) & 15);
+        do Output.printInt((1 < 2) + (3 = 4));
+        return;
+    }
+}
+'''
+
+REDUCED = '''class Main {
+    function void main() {
+        var int x, i;
+        let i = -3;
+        while (i < 4) {
+            let x = i * 4096;
+            do Output.printInt(x * 8);
+            do Output.printInt(3 * x);
+            do Output.printInt(x * -2);
+            do Output.printInt(x * 0);
+            do Output.printInt(x / 1);
+            do Output.printInt(x * 1);
+            do Output.printChar(32);
+            let i = i + 1;
+        }
+        return;
+    }
+}
+'''
+
+POOLED = '''class Main {
+    function void main() {
+        var int i;
+        let i = 0;
+        while (i < 3) {
+            do Output.printString("same");
+            do Output.printString("same");
+            do Output.printString("other");
+            let i = i + 1;
+        }
+        return;
+    }
+}
+'''
+
+
+@pytest.mark.parametrize('switches', sorted(support.OPTION_SETS))
+@pytest.mark.parametrize('program', support.PROGRAMS)
+def test_optimizations_keep_behaviour(program, switches):
+    expected = support.run_program(program)
+    compile_options = support.options(**support.OPTION_SETS[switches])
+    assert support.run_program(program, compile_options) == expected
+
+
+def test_peephole_shrinks_output():
+    sources = support.program_sources('points')
+    plain = support.compile_sources(sources)
+    optimized = support.compile_sources(sources,
+                                        support.options(peephole=True))
+    for class_name in sources:
+        assert len(optimized[class_name].splitlines()) <= \
+            len(plain[class_name].splitlines())
+    assert sum(map(len, optimized.values())) < sum(map(len, plain.values()))
+
+
+def test_fold_constants_wraps_like_the_vm():
+    expected = support.run_sources({'Main': FOLDED})
+    assert expected == ''.join(['-32768', '32767', '-25536', '-3', '8',
+                                '-1'])
+    folded_options = support.options(fold_constants=True)
+    vm_code = Main.compile_source(FOLDED, folded_options)
+    assert 'add' not in vm_code.split()
+    assert 'Math.multiply' not in vm_code
+    assert support.run_sources({'Main': FOLDED}, folded_options) == expected
+
+
+def test_strength_reduce_negative_and_edge_operands():
+    expected = support.run_sources({'Main': REDUCED})
+    reduced_options = support.options(strength_reduce=True)
+    vm_code = Main.compile_source(REDUCED, reduced_options)
+    assert vm_code.count('Math.multiply') < \
+        Main.compile_source(REDUCED).count('Math.multiply')
+    assert support.run_sources({'Main': REDUCED}, reduced_options) == \
+        expected
+
+
+def test_pool_strings_builds_every_literal_once():
+    emulator = support.vm_emulator.VMEmulator(
+        [Main.compile_source(POOLED, support.options(pool_strings=True))])
+    assert emulator.run() == 'samesameother' * 3
+    assert len(emulator.strings) == 2
+    emulator = support.vm_emulator.VMEmulator([Main.compile_source(POOLED)])
+    assert emulator.run() == 'samesameother' * 3
+    assert len(emulator.strings) == 9
+
+
+
+NEGATED_LOOPS = '''class Main {
+    function void main() {
+        var int i, j;
+        let i = 3;
+        while (~i) { do Output.printInt(i); let i = i - 1; }
+        let i = 6;
+        while (~(i | -2)) { do Output.printInt(i); let i = i + 1; }
+        let j = 0;
+        while (~(j > 2)) { do Output.printInt(j); let j = j + 1; }
+        return;
+    }
+}
+'''
+
+
+@pytest.mark.parametrize('switches', sorted(support.OPTION_SETS))
+def test_negated_conditions_that_are_not_booleans(switches):
+    # ~x of x other than 0 / -1 is nonzero too - only a negated boolean
+    # may swap the branches
+    compile_options = support.options(**support.OPTION_SETS[switches])
+    assert support.run_sources({'Main': NEGATED_LOOPS}, compile_options) \
+        == '3210' + '6' + '012'
+
+
+def test_peephole_swaps_the_branches_of_a_negated_boolean():
+    stats = Main.compile_to(NEGATED_LOOPS, [].append,
+                            support.options(peephole=True))
+    assert stats['peephole.not-if-goto'] == 1
+
+
+def test_is_boolean():
+    lt = [('push', 'local', 0), ('push', 'constant', 5), ('lt',)]
+    assert Peephole.is_boolean(lt, 3)
+    assert Peephole.is_boolean(lt + [('not',)], 4)
+    assert Peephole.is_boolean([('push', 'constant', 0), ('not',)], 2)
+    assert Peephole.is_boolean(lt + lt + [('and',)], 7)
+    assert not Peephole.is_boolean(lt + lt[:2] + [('and',)], 6)
+    assert not Peephole.is_boolean([('push', 'constant', 1)], 1)
+    assert not Peephole.is_boolean(lt + [('neg',)], 4)
+    # both operands of or must be seen
+    assert not Peephole.is_boolean(lt + [('or',)], 4)
+    assert not Peephole.is_boolean([('label', 'L'), ('push', 'local', 0),
+                                    ('eq',), ('or',)], 4)
+
+
+NEGATED_IFS = '''class Main {
+    function void main() {
+        var int x;
+        let x = 0;
+        while (x < 4) {
+            if (~(x & 2)) { do Output.printChar(65); }
+            else { do Output.printChar(66); }
+            if (~(x < 2)) { do Output.printChar(67); }
+            else { do Output.printChar(68); }
+            if (~((x = 1) | (x = 3))) { do Output.printChar(69); }
+            else { do Output.printChar(70); }
+            if (~x) { do Output.printChar(71); }
+            let x = x + 1;
+        }
+        return;
+    }
+}
+'''
+
+
+@pytest.mark.parametrize('switches', sorted(support.OPTION_SETS))
+def test_negated_ifs_that_are_not_booleans(switches):
+    expected = 'ADEG' + 'ADFG' + 'ACEG' + 'ACFG'
+    for front_end in (dict(), dict(ast=True)):
+        compile_options = support.options(
+            **dict(support.OPTION_SETS[switches], **front_end))
+        assert support.run_sources({'Main': NEGATED_IFS},
+                                   compile_options) == expected
+
+
+def test_branch_layout_negates_boolean_conditions_only():
+    vm_code = Main.compile_source(NEGATED_IFS,
+                                  support.options(branch_layout=True))
+    assert vm_code.count('IF_FALSE_') == 2 * 2
+    assert 'IF_FALSE_1' in vm_code and 'IF_FALSE_2' in vm_code
+
+
+NEGATED_INT = '''class Main {
+    function void main() {
+        var int x;
+        let x = 5;
+        if (~x) { do Output.printChar(65); }
+        else { do Output.printChar(66); }
+        return;
+    }
+}
+'''
+
+
+def test_negated_int_keeps_the_else_first_layout():
+    # ~5 is -6, so the if clause runs - jumping on x would run the else
+    for front_end in (dict(), dict(ast=True)):
+        compile_options = support.options(branch_layout=True, **front_end)
+        vm_code = Main.compile_source(NEGATED_INT, compile_options)
+        assert 'IF_FALSE_' not in vm_code
+        assert 'not\nif-goto IF_START_0\n' in vm_code
+        assert 'IF_END_0' in vm_code
+        assert support.run_sources({'Main': NEGATED_INT},
+                                   compile_options) == 'A'
+
+
+def test_negated_ifs_on_the_hack_cpu(tmp_path):
+    dir_path = str(tmp_path / 'negated')
+    support.write_sources(dir_path, {'Main': NEGATED_IFS})
+    output, steps = support.run_asm(dir_path, '-O')
+    assert output == support.run_sources({'Main': NEGATED_IFS})
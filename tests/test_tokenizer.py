@@ -0,0 +1,87 @@
+import io
+
+import pytest
+
+import JackTokenizer
+import support
+
+SOURCE = '''/** doc
+ * comment */
+class Main {  // a // line comment
+    function void main() {
+        do Output.printString("a // b /* c */");
+        let x = y[12]-~3; /* block // with a
+        line comment in it */ return;
+    }
+}
+'''
+
+
+def tokens_of(tokenizer):
+    tokens = []
+    while tokenizer.has_more_tokens():
+        tokenizer.advance()
+        tokens.append((tokenizer.get_curr_token(),
+                       tokenizer.token_type().value,
+                       tokenizer.get_position()))
+    return tokens
+
+
+def test_lex_drops_comments_and_keeps_strings():
+    tokens, kinds, lines, columns = JackTokenizer.lex(SOURCE)
+    assert tokens[:4] == ['class', 'Main', '{', 'function']
+    assert '"a // b /* c */"' in tokens
+    assert tokens[-4:] == ['return', ';', '}', '}']
+    assert 'line' not in tokens and 'comment' not in tokens
+
+
+def test_lex_kinds_and_positions():
+    tokens, kinds, lines, columns = JackTokenizer.lex(SOURCE)
+    entries = list(zip(tokens, kinds, lines, columns))
+    assert entries[0] == ('class', JackTokenizer.KEYWORD, 3, 1)
+    assert entries[1] == ('Main', JackTokenizer.IDENTIFIER, 3, 7)
+    index = tokens.index('12')
+    assert entries[index] == ('12', JackTokenizer.INT_CONST, 6, 19)
+    index = tokens.index('"a // b /* c */"')
+    assert entries[index][1:] == (JackTokenizer.STRING_CONST, 5, 31)
+    assert entries[tokens.index('~')] == ('~', JackTokenizer.SYMBOL, 6, 23)
+    assert entries[tokens.index('return')][2:] == (7, 31)
+
+
+def test_tokenizer_walks_the_lexed_tokens():
+    tokenizer = JackTokenizer.JackTokenizer(None, SOURCE)
+    assert tokenizer.future_token() == 'class'
+    tokenizer.advance()
+    assert tokenizer.peek(0) == 'class'
+    assert tokenizer.peek(2) == '{'
+    assert tokenizer.token_type() == JackTokenizer.TokenType.KEYWORD
+    tokens = tokens_of(tokenizer)
+    assert tokens[0] == ('Main', JackTokenizer.IDENTIFIER, (3, 7))
+    assert tokenizer.future_token() is None
+
+
+@pytest.mark.parametrize('chunk_size', [1, 2, 3, 7, 64,
+                                        JackTokenizer.CHUNK_SIZE])
+@pytest.mark.parametrize('program', support.PROGRAMS)
+def test_stream_tokens_match_lexer(program, chunk_size):
+    for source in support.program_sources(program).values():
+        expected = tokens_of(JackTokenizer.JackTokenizer(None, source))
+        stream = JackTokenizer.StreamTokenizer(None, source, chunk_size)
+        assert tokens_of(stream) == expected
+
+
+@pytest.mark.parametrize('chunk_size', [1, 4, 5, 16])
+def test_stream_tokens_across_chunk_edges(chunk_size):
+    expected = list(zip(*JackTokenizer.lex(SOURCE)))
+    stream = JackTokenizer.lex_stream(io.StringIO(SOURCE).read, chunk_size)
+    assert list(stream) == expected
+
+
+def test_stream_lookahead():
+    stream = JackTokenizer.StreamTokenizer(None, SOURCE, 2)
+    stream.advance()
+    assert stream.peek(3) == 'function'
+    assert stream.future_token() == 'Main'
+    stream.advance()
+    assert (stream.get_curr_token(), stream.get_position()) == ('Main',
+                                                                (3, 7))
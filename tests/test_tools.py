@@ -0,0 +1,168 @@
+import json
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+import pytest
+
+import CompileServer
+import Main
+import Profiler
+import support
+
+WATCH_TIMEOUT = 20  # seconds to wait for the watcher to report a build
+
+
+def test_profile_report(tmp_path):
+    dir_path = support.copy_program('points', str(tmp_path / 'points'))
+    report_path = str(tmp_path / 'profile.json')
+    errors, report = support.build([dir_path, '--profile', report_path])
+    assert errors == []
+    with open(report_path) as f:
+        profile = json.load(f)
+    assert sorted(profile['phases']) == sorted(Profiler.PHASES)
+    assert [os.path.basename(record['file'])
+            for record in profile['files']] == ['Main.jack', 'Point.jack']
+    for record in profile['files']:
+        assert all(seconds >= 0 for seconds in record['phases'].values())
+    assert profile['phases']['tokenize'] > 0
+    assert profile['methods']['compile_class']['calls'] == 2
+    assert profile['methods']['compile_let']['calls'] > 0
+    assert profile['symbol_lookups']['calls'] > 0
+    commands = profile['vm_commands_per_subroutine']
+    assert commands['Point.seven'] == 3
+    # the profiled build writes the same code as a plain one
+    assert support.read_vm_files(dir_path) == support.compile_sources(
+        support.program_sources('points'))
+
+
+@pytest.mark.parametrize('switches', [['--ast'], ['--stream'],
+                                      ['--parse-only'], ['--whole-program'],
+                                      ['--bundle', 'all.vm'],
+                                      ['--target', 'asm']])
+def test_profile_rejects_the_modes_it_does_not_measure(switches, capsys):
+    with pytest.raises(SystemExit):
+        Main.parse_args(['src', '--profile', 'profile.json'] + switches)
+    assert '--profile' in capsys.readouterr().err
+
+
+def test_compile_server(tmp_path):
+    dir_path = support.copy_program('lists', str(tmp_path / 'lists'))
+    socket_dir = tempfile.mkdtemp()
+    socket_path = os.path.join(socket_dir, 'server.sock')
+    server = CompileServer.CompileServer(socket_path)
+    thread = threading.Thread(target=server.serve_forever)
+    thread.start()
+    try:
+        reply = CompileServer.send_request(
+            socket_path, {'cwd': str(tmp_path),
+                          'args': ['lists', '--cache-stats']})
+        assert reply['status'] == CompileServer.OK
+        assert [record['status'] for record in reply['files']] == \
+            [CompileServer.OK, CompileServer.OK]
+        assert 'cache: 0 hits (0 restored), 2 misses' in reply['report']
+        assert support.read_vm_files(dir_path) == support.compile_sources(
+            support.program_sources('lists'))
+
+        # the server keeps the caches of the dirs it built
+        reply = CompileServer.send_request(
+            socket_path, {'cwd': str(tmp_path),
+                          'args': ['lists', '--cache-stats']})
+        assert 'cache: 2 hits (0 restored), 0 misses' in reply['report']
+
+        # a second server leaves the socket of a live one alone
+        with pytest.raises(OSError):
+            CompileServer.CompileServer(socket_path)
+        reply = CompileServer.send_request(
+            socket_path, {'cwd': str(tmp_path), 'args': ['lists']})
+        assert reply['status'] == CompileServer.OK
+
+        support.write_sources(dir_path, {'Bad': 'class Bad { let }'})
+        reply = CompileServer.send_request(
+            socket_path, {'cwd': str(tmp_path), 'args': ['lists']})
+        assert reply['status'] == CompileServer.ERROR
+        failed = [record for record in reply['files']
+                  if record['status'] == CompileServer.ERROR]
+        assert [os.path.basename(record['file']) for record in failed] == \
+            ['Bad.jack']
+        assert failed[0]['lines'][0].startswith(failed[0]['file'] + ':1:')
+
+        reply = CompileServer.send_request(
+            socket_path, {'cwd': str(tmp_path), 'args': ['-']})
+        assert reply['status'] == CompileServer.ERROR
+        assert CompileServer.send_request(
+            socket_path, {'shutdown': True}) == {'status': CompileServer.OK}
+        thread.join(5)
+        assert not thread.is_alive()
+    finally:
+        if thread.is_alive():
+            server.shutdown()
+            thread.join()
+        server.server_close()
+        assert not os.path.exists(socket_path)
+        os.rmdir(socket_dir)
+
+
+def test_compile_server_replaces_a_stale_socket():
+    socket_dir = tempfile.mkdtemp()
+    socket_path = os.path.join(socket_dir, 'server.sock')
+    try:
+        # the socket file of a server that is gone
+        stale = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        stale.bind(socket_path)
+        stale.close()
+        server = CompileServer.CompileServer(socket_path)
+        server.server_close()
+        assert not os.path.exists(socket_path)
+
+        # a file that is not a socket is not removed
+        with open(socket_path, 'w') as f:
+            f.write('not a socket')
+        with pytest.raises(OSError):
+            CompileServer.CompileServer(socket_path)
+        assert os.path.isfile(socket_path)
+    finally:
+        if os.path.exists(socket_path):
+            os.unlink(socket_path)
+        os.rmdir(socket_dir)
+
+
+def read_line_with(process, text):
+    """
+    :return: the first line of the process output that holds text
+    """
+    deadline = time.monotonic() + WATCH_TIMEOUT
+    while time.monotonic() < deadline:
+        line = process.stdout.readline()
+        if text in line:
+            return line
+    raise AssertionError('no %r from the watcher' % text)
+
+
+def test_watch_recompiles_changed_files(tmp_path):
+    dir_path = support.copy_program('points', str(tmp_path / 'points'))
+    process = subprocess.Popen(
+        [sys.executable, '-u', 'Main.py', dir_path, '--watch'],
+        cwd=support.REPO_DIR, stdout=subprocess.PIPE,
+        stderr=subprocess.STDOUT, text=True)
+    try:
+        read_line_with(process, '2 files in 1 dirs')
+        sources = support.program_sources('points')
+        changed = sources['Point'].replace('return 7;', 'return 8;')
+        support.write_sources(dir_path, {'Point': changed})
+        line = read_line_with(process, 'Point.jack')
+        assert line.startswith(os.path.join(dir_path, 'Point.jack') + ': ')
+        assert support.read_vm_files(dir_path)['Point'] == \
+            support.compile_sources({'Point': changed})['Point']
+
+        os.remove(os.path.join(dir_path, 'Point.jack'))
+        read_line_with(process, 'Point.jack: removed')
+        assert sorted(support.read_vm_files(dir_path)) == ['Main']
+    finally:
+        process.kill()
+        process.wait()
+        process.stdout.close()
@@ -0,0 +1,224 @@
+"""
+VM emulator for the tests. Runs the vm code of a program with the stack,
+the segments and the call frames laid out in RAM the way the standard VM
+translator lays them out, so a test sees what a compiled program really
+does. The OS subroutines the program does not define are Python stubs.
+"""
+WORD = 1 << 16
+MAX_INT = (1 << 15) - 1
+
+SP, LCL, ARG, THIS, THAT = range(5)
+TEMP_BASE = 5
+STATIC_BASE = 16
+STACK_BASE = 256
+HEAP_BASE = 2048
+
+base_segment_dict = {'local': LCL, 'argument': ARG, 'this': THIS,
+                     'that': THAT}
+
+binary_dict = {'add': lambda x, y: x + y, 'sub': lambda x, y: x - y,
+               'and': lambda x, y: x & y, 'or': lambda x, y: x | y,
+               'eq': lambda x, y: -1 if x == y else 0,
+               'gt': lambda x, y: -1 if x > y else 0,
+               'lt': lambda x, y: -1 if x < y else 0}
+
+unary_dict = {'neg': lambda x: -x, 'not': lambda x: ~x}
+
+
+def word(value):
+    """
+    :return: value wrapped to a signed 16 bit word
+    """
+    value %= WORD
+    return value - WORD if value > MAX_INT else value
+
+
+def parse(vm_code):
+    """
+    :return: list of the commands of vm code, as lists of strings
+    """
+    commands = []
+    for line in vm_code.split('\n'):
+        parts = line.split('//', 1)[0].split()
+        if parts:
+            commands.append(parts)
+    return commands
+
+
+class VMEmulator:
+    """
+    Loads the vm code of the classes of a program and runs it from
+    Main.main. Output.* writes go to the output list.
+    """
+
+    def __init__(self, vm_codes, max_steps=10 ** 7):
+        """
+        :param vm_codes: iterable of the vm code of every class
+        :param max_steps: commands to run before giving up on the program
+        """
+        self.code = []
+        self.functions = {}
+        self.labels = {}
+        function = None
+        for vm_code in vm_codes:
+            for command in parse(vm_code):
+                if command[0] == 'function':
+                    function = command[1]
+                    self.functions[function] = len(self.code)
+                if command[0] == 'label':
+                    self.labels[function, command[1]] = len(self.code)
+                self.code.append((command, function))
+        self.ram = [0] * (1 << 15)
+        self.statics = {}
+        self.heap = HEAP_BASE
+        self.strings = {}
+        self.output = []
+        self.max_steps = max_steps
+        self.steps = 0
+        self.calls = 0
+
+    def static_address(self, function, index):
+        name = '%s.%d' % (function.split('.')[0], index)
+        if name not in self.statics:
+            self.statics[name] = STATIC_BASE + len(self.statics)
+        return self.statics[name]
+
+    def address(self, segment, index, function):
+        if segment in base_segment_dict:
+            return self.ram[base_segment_dict[segment]] + index
+        if segment == 'temp':
+            return TEMP_BASE + index
+        if segment == 'pointer':
+            return THIS + index
+        if segment == 'static':
+            return self.static_address(function, index)
+        raise ValueError('no address in segment %s' % segment)
+
+    def push(self, value):
+        ram = self.ram
+        ram[ram[SP]] = word(value)
+        ram[SP] += 1
+
+    def pop(self):
+        ram = self.ram
+        ram[SP] -= 1
+        return ram[ram[SP]]
+
+    def run(self, entry='Main.main'):
+        """
+        :return: everything the program printed
+        """
+        ram = self.ram
+        ram[SP] = STACK_BASE
+        pc = self.call(entry, 0, None)
+        while pc is not None:
+            self.steps += 1
+            if self.steps > self.max_steps:
+                raise RuntimeError('program did not end')
+            command, function = self.code[pc]
+            operation = command[0]
+            pc += 1
+            if operation == 'push':
+                if command[1] == 'constant':
+                    self.push(int(command[2]))
+                else:
+                    self.push(ram[self.address(command[1], int(command[2]),
+                                               function)])
+            elif operation == 'pop':
+                value = self.pop()
+                ram[self.address(command[1], int(command[2]),
+                                 function)] = value
+            elif operation in binary_dict:
+                y = self.pop()
+                x = self.pop()
+                self.push(binary_dict[operation](x, y))
+            elif operation in unary_dict:
+                self.push(unary_dict[operation](self.pop()))
+            elif operation == 'goto':
+                pc = self.labels[function, command[1]]
+            elif operation == 'if-goto':
+                if self.pop() != 0:
+                    pc = self.labels[function, command[1]]
+            elif operation == 'function':
+                for _ in range(int(command[2])):
+                    self.push(0)
+            elif operation == 'call':
+                pc = self.call(command[1], int(command[2]), pc)
+            elif operation == 'return':
+                frame = ram[LCL]
+                pc = ram[frame - 5]
+                ram[ram[ARG]] = self.pop()
+                ram[SP] = ram[ARG] + 1
+                ram[THAT], ram[THIS], ram[ARG], ram[LCL] = \
+                    ram[frame - 1], ram[frame - 2], ram[frame - 3], \
+                    ram[frame - 4]
+                if pc < 0:
+                    pc = None
+            elif operation != 'label':
+                raise ValueError('unknown command %s' % ' '.join(command))
+        return ''.join(self.output)
+
+    def call(self, name, n_args, return_pc):
+        """
+        :return: pc to go on at
+        """
+        self.calls += 1
+        ram = self.ram
+        if name not in self.functions:
+            args = [self.pop() for _ in range(n_args)][::-1]
+            self.push(self.os_call(name, args))
+            return return_pc
+        self.push(-1 if return_pc is None else return_pc)
+        for register in (LCL, ARG, THIS, THAT):
+            self.push(ram[register])
+        ram[ARG] = ram[SP] - n_args - 5
+        ram[LCL] = ram[SP]
+        return self.functions[name]
+
+    def alloc(self, size):
+        address = self.heap
+        self.heap += max(size, 1)
+        return address
+
+    def os_call(self, name, args):
+        """
+        :return: value the OS subroutine returns
+        """
+        if name == 'Math.multiply':
+            return args[0] * args[1]
+        if name == 'Math.divide':
+            quotient = abs(args[0]) // abs(args[1])
+            return -quotient if (args[0] < 0) != (args[1] < 0) else quotient
+        if name == 'Math.abs':
+            return abs(args[0])
+        if name in ('Memory.alloc', 'Array.new'):
+            return self.alloc(args[0])
+        if name == 'Memory.peek':
+            return self.ram[args[0]]
+        if name == 'Memory.poke':
+            self.ram[args[0]] = args[1]
+            return 0
+        if name == 'String.new':
+            address = self.alloc(1)
+            self.strings[address] = []
+            return address
+        if name == 'String.appendChar':
+            self.strings[args[0]].append(chr(args[1] % WORD))
+            return args[0]
+        if name == 'String.length':
+            return len(self.strings[args[0]])
+        if name == 'String.charAt':
+            return ord(self.strings[args[0]][args[1]])
+        if name in ('Memory.deAlloc', 'Array.dispose', 'String.dispose'):
+            return 0
+        if name == 'Output.printInt':
+            self.output.append(str(args[0]))
+        elif name == 'Output.printChar':
+            self.output.append(chr(args[0] % WORD))
+        elif name == 'Output.printString':
+            self.output.append(''.join(self.strings[args[0]]))
+        elif name == 'Output.println':
+            self.output.append('\n')
+        else:
+            raise KeyError('no OS stub for %s' % name)
+        return 0